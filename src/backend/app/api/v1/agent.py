@@ -242,19 +242,23 @@ async def create_session(
 )
 async def get_user_sessions(
     limit: int = Query(20, description="返回数量限制", ge=1, le=100),
+    offset: int = Query(0, description="偏移量", ge=0),
     current_user: UserResponse = Depends(get_current_user)
 ) -> Dict[str, Any]:
     """
-    获取用户会话列表接口
+    获取用户会话列表接口（按最后活跃时间倒序）
     """
     try:
         sessions = await session_manager.get_user_sessions(
-            str(current_user.id), limit
+            str(current_user.id), limit, offset
         )
+        total = await session_manager.count_user_sessions(str(current_user.id))
         
         return {
             "user_id": str(current_user.id),
-            "total": len(sessions),
+            "total": total,
+            "offset": offset,
+            "limit": limit,
             "sessions": sessions
         }
         
@@ -85,12 +85,13 @@ async def create_conversation(
 async def stream_conversation(
     request: Request,
     conversation_id: str = Query(...),
+    last_event_id: Optional[str] = Query(None, description="最后收到的事件ID（无法设置请求头时使用）"),
     current_user: User = Depends(get_current_user)
 ):
-    """SSE流式对话端点."""
+    """SSE流式对话端点（重连时通过 Last-Event-ID 补发断线期间的事件）."""
     try:
-        # 验证对话归属
-        conversation = await conversation_service.get_conversation(
+        # 验证对话归属（只读取元数据）
+        conversation = await conversation_service.get_conversation_meta(
             conversation_id,
             current_user.id
         )
@@ -105,7 +106,8 @@ async def stream_conversation(
         connection = await sse_manager.connect(
             current_user.id,
             session_id=str(current_user.id),
-            request=request
+            request=request,
+            last_event_id=request.headers.get("last-event-id") or last_event_id
         )
         
         # 返回SSE响应
@@ -138,8 +140,8 @@ async def send_message(
 ) -> ResponseModel:
     """发送消息到对话."""
     try:
-        # 验证对话归属
-        conversation = await conversation_service.get_conversation(
+        # 验证对话归属（只读取元数据）
+        conversation = await conversation_service.get_conversation_meta(
             conversation_id,
             current_user.id
         )
@@ -220,30 +222,39 @@ async def send_message(
 
 @router.get("/history", response_model=ResponseModel)
 async def get_conversation_history(
-    skip: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
     limit: int = Query(20, ge=1, le=100),
-    status: Optional[ConversationStatus] = None,
+    status_filter: Optional[ConversationStatus] = Query(None, alias="status"),
     current_user: User = Depends(get_current_user)
 ) -> ResponseModel:
-    """获取对话历史列表."""
+    """获取对话历史列表（按更新时间倒序，游标分页）."""
     try:
         conversations = await conversation_service.list_conversations(
             current_user.id,
-            skip=skip,
             limit=limit,
-            status=status
+            status=status_filter,
+            cursor=cursor
         )
         
+        next_cursor = None
+        if len(conversations) == limit:
+            next_cursor = conversation_service.encode_cursor(conversations[-1])
+        
         return ResponseModel(
             success=True,
             data={
                 "conversations": [conv.dict() for conv in conversations],
                 "total": len(conversations),
-                "skip": skip,
+                "next_cursor": next_cursor,
                 "limit": limit
             }
         )
         
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
     except Exception as e:
         logger.error(f"Failed to get conversation history: {e}")
         raise HTTPException(
@@ -285,6 +296,54 @@ async def get_conversation(
         )
 
 
+@router.get("/{conversation_id}/messages", response_model=ResponseModel)
+async def get_conversation_messages(
+    conversation_id: str,
+    before_seq: Optional[int] = Query(None, ge=0, description="只返回序号小于该值的消息"),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user)
+) -> ResponseModel:
+    """从最新消息开始向前分页获取对话消息."""
+    try:
+        conversation = await conversation_service.get_conversation_meta(
+            conversation_id,
+            current_user.id
+        )
+        
+        if not conversation:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found"
+            )
+        
+        if before_seq is None:
+            messages = await conversation_service.get_recent_messages(conversation_id, limit)
+        else:
+            messages = await conversation_service.get_messages(
+                conversation_id,
+                before_seq=before_seq,
+                limit=limit
+            )
+        
+        return ResponseModel(
+            success=True,
+            data={
+                "messages": [message.dict() for message in messages],
+                "next_before_seq": messages[0].seq if messages and messages[0].seq else None,
+                "limit": limit
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to get conversation messages: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
+
+
 @router.delete("/{conversation_id}", response_model=ResponseModel)
 async def delete_conversation(
     conversation_id: str,
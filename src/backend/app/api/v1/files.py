@@ -0,0 +1,139 @@
+"""文件相关API路由."""
+
+from urllib.parse import quote
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_db
+from app.core.exceptions import ConflictError
+from app.core.logging import get_logger
+from app.dependencies.auth import get_current_user
+from app.models.user import User
+from app.services.file import file_service
+from app.utils.http_range import (
+    RangeNotSatisfiable,
+    etag_matches,
+    format_http_date,
+    if_range_matches,
+    parse_range,
+)
+
+logger = get_logger(__name__)
+
+router = APIRouter()
+
+# 对象在读取信息和打开内容之间被替换时，重新读取的最多次数
+DOWNLOAD_ATTEMPTS = 2
+
+
+async def _open_download(
+    request: Request,
+    db: AsyncSession,
+    file_id: int,
+    user_id: int
+) -> Response:
+    """
+    读取对象信息并打开对应版本的内容流.
+    
+    Raises:
+        ConflictError: 对象在读取信息之后被替换
+    """
+    info = await file_service.get_download_info(db, file_id, user_id)
+    
+    if not info:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    
+    file_record, stat = info
+    size = stat["size"]
+    etag = f'"{stat["etag"]}"'
+    last_modified = stat.get("last_modified")
+    
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+    }
+    if last_modified:
+        headers["Last-Modified"] = format_http_date(last_modified)
+    
+    # 客户端缓存仍然有效
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    # 解析范围（If-Range 不匹配时返回完整内容）
+    byte_range = None
+    if if_range_matches(request.headers.get("if-range"), etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+    
+    if byte_range:
+        start, end = byte_range
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    else:
+        start, end = 0, size - 1
+        status_code = status.HTTP_200_OK
+    
+    length = end - start + 1
+    headers["Content-Length"] = str(length)
+    headers["Content-Disposition"] = (
+        f"attachment; filename*=UTF-8''{quote(file_record.original_name)}"
+    )
+    
+    # 只读取与上面的响应头一致的版本
+    content = await file_service.open_stream(
+        file_record, offset=start, length=length, etag=stat["etag"]
+    )
+    
+    return StreamingResponse(
+        content,
+        status_code=status_code,
+        media_type=file_record.mime_type or "application/octet-stream",
+        headers=headers
+    )
+
+
+@router.get("/{file_id}/download")
+async def download_file(
+    file_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+) -> Response:
+    """
+    流式下载文件.
+    
+    支持 If-None-Match（304）、Range 和 If-Range（206/416，单个字节范围），
+    内容按块从对象存储读取，内存占用与文件大小无关。对象在读取信息之后被替换时
+    重新读取，仍不一致时返回 409。
+    """
+    try:
+        for _ in range(DOWNLOAD_ATTEMPTS):
+            try:
+                return await _open_download(request, db, file_id, current_user.id)
+            except ConflictError as e:
+                logger.warning(f"File changed during download: {e.details}")
+        
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="File changed during download"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to download file: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
@@ -123,7 +123,7 @@ async def detailed_health_check(
         start_minio = time.time()
         minio_client = get_minio_client()
         # 检查存储桶是否存在
-        bucket_exists = minio_client.bucket_exists(settings.MINIO_BUCKET_NAME)
+        bucket_exists = await minio_client.bucket_exists(settings.MINIO_BUCKET_NAME)
         response_time = (time.time() - start_minio) * 1000
         
         dependencies["minio"] = {
@@ -64,6 +64,9 @@ class Settings(BaseSettings):
     MINIO_SECRET_KEY: str = "rootpassword"
     MINIO_SECURE: bool = False
     MINIO_BUCKET_NAME: str = "tradeflow-storage"
+    MINIO_MAX_WORKERS: int = 8  # 执行MinIO调用的线程数（最大并发请求数）
+    MINIO_UPLOAD_PART_SIZE: int = 5 * 1024 * 1024  # 流式上传分片大小（S3要求至少5MB）
+    MINIO_DOWNLOAD_CHUNK_SIZE: int = 256 * 1024  # 流式下载每次读取的字节数
     
     # JWT配置
     ACCESS_TOKEN_EXPIRE_HOURS: int = 4  # B2B场景适中的过期时间
@@ -100,8 +103,40 @@ class Settings(BaseSettings):
     AGENT_ENABLE_CACHE: bool = True
     AGENT_RUNNER_POOL_SIZE: int = 5
     AGENT_RUNNER_IDLE_TIMEOUT: int = 300
+    AGENT_RUNNER_ACQUIRE_TIMEOUT: float = 30.0
+    AGENT_RUNNER_MAX_USES: int = 100
     AGENT_CACHE_TTL: int = 3600
     AGENT_CACHE_MAX_SIZE: int = 1000
+    AGENT_HISTORY_MAX_MESSAGES: int = 200
+    AGENT_HISTORY_MAX_BYTES: int = 256 * 1024
+    AGENT_HISTORY_SUMMARY_MAX_CHARS: int = 4000
+    
+    # 缓存配置
+    CACHE_L1_ENABLED: bool = True
+    CACHE_L1_MAX_ENTRIES: int = 10000
+    CACHE_L1_MAX_BYTES: int = 32 * 1024 * 1024  # 32MB
+    CACHE_L1_TTL: int = 30  # 进程内缓存最长保留时间（秒），兜底丢失的失效广播
+    CACHE_L1_KEY_PREFIXES: List[str] = ["user:profile:", "user:subscription:"]
+    CACHE_INVALIDATION_CHANNEL: str = "cache:invalidate"
+    CACHE_COMPRESSION: str = "auto"  # auto / zstd / lz4 / zlib / none，auto 按 zstd > lz4 > zlib 选择已安装的实现
+    CACHE_COMPRESSION_THRESHOLD: int = 1024  # 序列化后超过该字节数才压缩
+    
+    # 对话配置
+    CONVERSATION_MESSAGE_BUCKET_SIZE: int = 100  # 每个消息桶保存的消息数
+    CONVERSATION_TAIL_MESSAGES: int = 50  # 读取对话时加载的最近消息数
+    CONVERSATION_META_CACHE_TTL: int = 300  # 对话元数据缓存时间（秒）
+    CONVERSATION_TAIL_CACHE_TTL: int = 600  # 最近消息缓存时间（秒）
+    CONVERSATION_STATS_FLUSH_INTERVAL: float = 5.0  # 统计增量写入MongoDB的间隔（秒）
+    CONVERSATION_STATS_MAX_PENDING_USERS: int = 1000  # 待写入用户数达到该值时提前写入
+    
+    # SSE配置
+    SSE_QUEUE_MAX_SIZE: int = 256  # 每个连接最多缓存的待发送消息数
+    SSE_OVERFLOW_POLICY: str = "drop_oldest"  # drop_oldest / coalesce / disconnect
+    SSE_HEARTBEAT_INTERVAL: int = 30  # 每个连接的心跳间隔（秒）
+    SSE_HEARTBEAT_WHEEL_SLOTS: int = 30  # 心跳时间轮槽数，连接随机分布到各槽
+    SSE_CLEANUP_BATCH_DELAY: float = 0.05  # 断开连接后Redis注册信息批量清理的等待时间（秒）
+    SSE_REPLAY_MAXLEN: int = 1000  # 每个用户事件流最多保留的事件数
+    SSE_REPLAY_RETENTION: int = 600  # 事件流保留时间（秒），超过后重连只能全量刷新
     
     # 前端配置
     FRONTEND_URL: str = "http://localhost:3000"
@@ -159,4 +159,38 @@ class RateLimitError(TradeFlowException):
             error_code="RATE_LIMIT_ERROR",
             details=details,
             status_code=429,
-        )
\ No newline at end of file
+        )
+
+
+class RunnerPoolTimeoutError(TradeFlowException):
+    """Runner实例池获取超时异常."""
+    
+    def __init__(
+        self,
+        message: str = "Timed out waiting for an agent runner",
+        details: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """初始化Runner实例池获取超时异常."""
+        super().__init__(
+            message=message,
+            error_code="RUNNER_POOL_TIMEOUT",
+            details=details,
+            status_code=503,
+        )
+
+
+class FileTooLargeError(TradeFlowException):
+    """文件超过大小上限异常."""
+    
+    def __init__(
+        self,
+        message: str = "File too large",
+        details: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """初始化文件超过大小上限异常."""
+        super().__init__(
+            message=message,
+            error_code="FILE_TOO_LARGE",
+            details=details,
+            status_code=413,
+        )
@@ -17,8 +17,12 @@ from app.middleware.error_handler import ErrorHandlerMiddleware
 from app.middleware.logging import LoggingMiddleware
 from app.middleware.performance import PerformanceMiddleware, RateLimitMiddleware
 from app.middleware.metrics import MetricsMiddleware, PerformanceMonitoringMiddleware
-from app.utils.minio_client import init_minio
+from app.utils.minio_client import close_minio, init_minio
 from app.utils.redis_client import close_redis, init_redis
+from app.utils.serialization import FastJSONResponse
+from app.services.cache import cache_service
+from app.services.conversation import conversation_service
+from app.services.sse import sse_manager
 from app.services.agent_service import initialize_agent_service, cleanup_agent_service
 
 # 配置日志
@@ -37,10 +41,22 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
         await init_databases()
         logger.info("Database connections initialized")
         
+        # 创建MongoDB索引（幂等）
+        try:
+            await conversation_service.ensure_indexes()
+        except Exception as e:
+            logger.warning(f"MongoDB index creation failed: {e}")
+        
+        # 启动对话统计写回任务
+        await conversation_service.stats_buffer.start()
+        
         # 初始化Redis连接
         await init_redis()
         logger.info("Redis connection initialized")
         
+        # 启动进程内缓存失效监听
+        await cache_service.start_invalidation_listener()
+        
         # 初始化MinIO
         await init_minio()
         logger.info("MinIO initialized")
@@ -65,14 +81,21 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     logger.info("Shutting down TradeFlow Backend API")
     
     try:
-        # 关闭数据库连接
+        # 写入缓冲的对话统计后关闭数据库连接
+        await conversation_service.stats_buffer.stop()
         await close_databases()
         logger.info("Database connections closed")
         
-        # 关闭Redis连接
+        # 停止缓存失效监听、SSE跨节点监听并关闭Redis连接
+        await cache_service.stop_invalidation_listener()
+        await sse_manager.close()
         await close_redis()
         logger.info("Redis connection closed")
         
+        # 等待进行中的MinIO调用完成并关闭线程池
+        await close_minio()
+        logger.info("MinIO client closed")
+        
         # 清理Agent服务
         try:
             await cleanup_agent_service()
@@ -97,6 +120,7 @@ def create_app() -> FastAPI:
         docs_url=f"{settings.API_V1_PREFIX}/docs" if settings.DEBUG else None,
         redoc_url=f"{settings.API_V1_PREFIX}/redoc" if settings.DEBUG else None,
         lifespan=lifespan,
+        default_response_class=FastJSONResponse,
     )
     
     # 添加中间件（注意顺序很重要）
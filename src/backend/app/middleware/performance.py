@@ -1,16 +1,38 @@
 """性能监控中间件."""
 
 import asyncio
+import math
 import time
-from typing import Callable
+from collections import OrderedDict
+from typing import Callable, Tuple
 
 from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from prometheus_client import Counter, Gauge
+from starlette.datastructures import MutableHeaders
 from starlette.middleware.base import BaseHTTPMiddleware
 
 from app.core.logging import get_logger
+from app.schemas.common import ErrorResponse
 
 logger = get_logger(__name__)
 
+# 速率限制指标
+rate_limit_rejections = Counter(
+    'http_rate_limit_rejections_total',
+    'Requests rejected by the in-process rate limiter'
+)
+
+rate_limit_evictions = Counter(
+    'http_rate_limit_evictions_total',
+    'Client IPs evicted from the rate limiter table'
+)
+
+rate_limit_tracked_clients = Gauge(
+    'http_rate_limit_tracked_clients',
+    'Client IPs currently tracked by the rate limiter'
+)
+
 
 class PerformanceMiddleware(BaseHTTPMiddleware):
     """性能监控中间件."""
@@ -91,99 +113,126 @@ class PerformanceMiddleware(BaseHTTPMiddleware):
             raise
 
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """简单的速率限制中间件."""
+class _ClientWindow:
+    """单个客户端的滑动窗口计数（当前窗口和上一个窗口两个桶）."""
+    
+    __slots__ = ("window_index", "current", "previous")
     
-    def __init__(self, app, requests_per_minute: int = 60):
+    def __init__(self, window_index: int):
+        self.window_index = window_index
+        self.current = 0
+        self.previous = 0
+    
+    def advance(self, window_index: int) -> None:
+        """滚动到指定窗口."""
+        if window_index == self.window_index:
+            return
+        self.previous = self.current if window_index == self.window_index + 1 else 0
+        self.current = 0
+        self.window_index = window_index
+
+
+class RateLimitMiddleware:
+    """
+    简单的速率限制中间件.
+    
+    每个客户端IP使用两个桶的滑动窗口计数：上一个窗口的计数按剩余比例加权，
+    加上当前窗口的计数作为估计值，更新为O(1)。客户端表是容量固定的LRU，
+    超出 max_clients 时淘汰最久未访问的IP（被淘汰的IP计数重新开始）。
+    """
+    
+    def __init__(self, app, requests_per_minute: int = 60, max_clients: int = 10000):
         """初始化速率限制中间件.
         
         Args:
-            app: FastAPI应用实例
+            app: ASGI应用
             requests_per_minute: 每分钟允许的请求数
+            max_clients: 最多跟踪的客户端IP数量
         """
-        super().__init__(app)
+        self.app = app
         self.requests_per_minute = requests_per_minute
-        self.request_times = {}
-        self.cleanup_interval = 60  # 每60秒清理一次过期记录
-        self.last_cleanup = time.time()
+        self.max_clients = max_clients
+        self.window = 60
+        self.clients: "OrderedDict[str, _ClientWindow]" = OrderedDict()
     
-    def _cleanup_old_requests(self) -> None:
-        """清理过期的请求记录."""
-        current_time = time.time()
+    def _hit(self, client_ip: str, now: float) -> Tuple[bool, float]:
+        """记录一次请求，返回 (是否允许, 估计请求数)."""
+        window_index = int(now // self.window)
+        entry = self.clients.get(client_ip)
         
-        if current_time - self.last_cleanup > self.cleanup_interval:
-            cutoff_time = current_time - 60  # 保留最近1分钟的记录
-            
-            for client_ip in list(self.request_times.keys()):
-                self.request_times[client_ip] = [
-                    req_time for req_time in self.request_times[client_ip]
-                    if req_time > cutoff_time
-                ]
-                
-                # 如果客户端没有最近的请求，删除记录
-                if not self.request_times[client_ip]:
-                    del self.request_times[client_ip]
-            
-            self.last_cleanup = current_time
+        if entry is None:
+            entry = _ClientWindow(window_index)
+            self.clients[client_ip] = entry
+            if len(self.clients) > self.max_clients:
+                self.clients.popitem(last=False)
+                rate_limit_evictions.inc()
+            rate_limit_tracked_clients.set(len(self.clients))
+        else:
+            self.clients.move_to_end(client_ip)
+            entry.advance(window_index)
+        
+        elapsed = (now - window_index * self.window) / self.window
+        estimated = entry.previous * (1 - elapsed) + entry.current
+        
+        if estimated >= self.requests_per_minute:
+            return False, estimated
+        
+        entry.current += 1
+        return True, estimated
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope, receive, send):
         """处理请求并检查速率限制."""
-        # 获取客户端IP
-        client_ip = request.client.host if request.client else "unknown"
-        current_time = time.time()
-        
-        # 清理过期记录
-        self._cleanup_old_requests()
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # 获取客户端的请求历史
-        if client_ip not in self.request_times:
-            self.request_times[client_ip] = []
+        # 获取客户端IP
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+        now = time.monotonic()
         
-        # 检查最近1分钟的请求数量
-        recent_requests = [
-            req_time for req_time in self.request_times[client_ip]
-            if req_time > current_time - 60
-        ]
+        allowed, estimated = self._hit(client_ip, now)
+        reset_after = math.ceil(self.window - now % self.window)
         
         # 检查是否超过限制
-        if len(recent_requests) >= self.requests_per_minute:
+        if not allowed:
+            rate_limit_rejections.inc()
             logger.warning(
                 "Rate limit exceeded",
                 client_ip=client_ip,
-                request_count=len(recent_requests),
+                request_count=int(estimated),
                 limit=self.requests_per_minute,
-                url=str(request.url),
+                path=scope["path"],
             )
             
-            from fastapi.responses import JSONResponse
-            from app.schemas.common import ErrorResponse
-            
             error_response = ErrorResponse(
                 message="Rate limit exceeded",
                 error_code="RATE_LIMIT_ERROR",
                 details={
                     "limit": self.requests_per_minute,
                     "window": "1 minute",
-                    "retry_after": 60,
+                    "retry_after": reset_after,
                 },
             )
             
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=429,
-                content=error_response.dict(),
-                headers={"Retry-After": "60"},
+                content=error_response.model_dump(mode="json"),
+                headers={"Retry-After": str(reset_after)},
             )
-        
-        # 记录当前请求时间
-        self.request_times[client_ip].append(current_time)
-        
-        # 处理请求
-        response = await call_next(request)
+            await response(scope, receive, send)
+            return
         
         # 添加速率限制头部信息
-        remaining = max(0, self.requests_per_minute - len(recent_requests) - 1)
-        response.headers["X-RateLimit-Limit"] = str(self.requests_per_minute)
-        response.headers["X-RateLimit-Remaining"] = str(remaining)
-        response.headers["X-RateLimit-Reset"] = str(int(current_time + 60))
+        remaining = max(0, int(self.requests_per_minute - estimated - 1))
+        reset_time = str(int(time.time() + reset_after))
+        
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-RateLimit-Limit"] = str(self.requests_per_minute)
+                headers["X-RateLimit-Remaining"] = str(remaining)
+                headers["X-RateLimit-Reset"] = reset_time
+            await send(message)
         
-        return response
\ No newline at end of file
+        await self.app(scope, receive, send_with_headers)
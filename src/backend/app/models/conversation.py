@@ -43,6 +43,7 @@ class Message(BaseModel):
     file_ids: List[str] = Field(default_factory=list)
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     tokens_used: Optional[int] = None
+    seq: Optional[int] = None  # 对话内从0开始的序号
     
     class Config:
         use_enum_values = True
@@ -55,7 +56,9 @@ class Conversation(BaseModel):
     user_id: int
     session_id: str
     title: Optional[str] = None
+    # 消息存储在分桶集合中，读取时只填充最近的消息
     messages: List[Message] = Field(default_factory=list)
+    message_count: int = 0
     status: ConversationStatus = ConversationStatus.ACTIVE
     context: Optional[Dict[str, Any]] = None
     total_tokens: int = 0
@@ -71,6 +74,16 @@ class Conversation(BaseModel):
         }
 
 
+class MessageBucket(BaseModel):
+    """消息分桶模型（MongoDB文档）：每个文档保存一段连续序号的消息."""
+    
+    conversation_id: str
+    seq: int  # 桶内第一条消息的序号（bucket_size 的整数倍）
+    count: int = 0
+    messages: List[Message] = Field(default_factory=list)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class ConversationStats(BaseModel):
     """对话统计模型."""
     
@@ -0,0 +1,63 @@
+"""
+将对话文档中内嵌的消息迁移到分桶消息集合，并把字符串 _id 转换为 ObjectId.
+
+用法:
+    python -m app.scripts.migrate_conversation_messages
+    python -m app.scripts.migrate_conversation_messages --dry-run
+
+每个对话的消息按序号写入 conversation_messages 集合（每桶 CONVERSATION_MESSAGE_BUCKET_SIZE 条），
+然后移除对话文档中的 messages 数组并写入 message_count；旧版本写入的字符串 _id 文档以 ObjectId
+重新插入后删除原文档（迁移完成前服务同时按两种 _id 查询）。桶按 (conversation_id, seq) 覆盖写入，
+脚本可以重复执行；服务在写入尚未迁移的对话时也会先迁移该对话，因此可以在新版本上线后执行。
+"""
+
+import argparse
+import asyncio
+
+from app.core.database import get_mongodb, mongodb
+from app.core.logging import configure_logging, get_logger
+from app.services.conversation import LEGACY_CONVERSATION_QUERY, conversation_service
+
+logger = get_logger(__name__)
+
+
+async def migrate(batch_size: int, dry_run: bool) -> int:
+    """迁移全部旧文档，返回迁移的对话数."""
+    db = await get_mongodb()
+    collection = db[conversation_service.collection_name]
+    
+    await conversation_service.ensure_indexes()
+    
+    pending = await collection.count_documents(LEGACY_CONVERSATION_QUERY)
+    logger.info(f"Conversations to migrate: {pending}")
+    if dry_run:
+        return 0
+    
+    migrated = 0
+    cursor = collection.find(LEGACY_CONVERSATION_QUERY, {"_id": 1}).batch_size(batch_size)
+    async for doc in cursor:
+        if await conversation_service.migrate_conversation_messages({"_id": doc["_id"]}):
+            migrated += 1
+            if migrated % batch_size == 0:
+                logger.info(f"Migrated {migrated}/{pending} conversations")
+    
+    remaining = await collection.count_documents(LEGACY_CONVERSATION_QUERY)
+    logger.info(f"Migration finished: migrated={migrated} remaining={remaining}")
+    return migrated
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=100, help="每批读取的对话数")
+    parser.add_argument("--dry-run", action="store_true", help="只统计待迁移的对话数")
+    args = parser.parse_args()
+    
+    configure_logging()
+    try:
+        await migrate(args.batch_size, args.dry_run)
+    finally:
+        await mongodb.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,40 @@
+"""
+从对话和消息桶重建对话统计.
+
+用法:
+    python -m app.scripts.reconcile_conversation_stats
+    python -m app.scripts.reconcile_conversation_stats --user-id 42
+
+统计增量在各进程中缓冲后定期写入，进程崩溃会丢失最近一个写入周期的增量；
+定期（例如每天）或故障后执行本脚本，用对话、消息数据覆盖统计文档。
+"""
+
+import argparse
+import asyncio
+
+from app.core.database import mongodb
+from app.core.logging import configure_logging, get_logger
+from app.services.conversation import conversation_service
+
+logger = get_logger(__name__)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--user-id", type=int, help="只重建该用户的统计")
+    args = parser.parse_args()
+    
+    configure_logging()
+    try:
+        if args.user_id is not None:
+            stats = await conversation_service.reconcile_user_stats(args.user_id)
+            logger.info(f"Stats reconciled: {stats.dict()}")
+        else:
+            count = await conversation_service.reconcile_all_stats()
+            logger.info(f"Stats reconciled for {count} users")
+    finally:
+        await mongodb.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,95 +7,286 @@ import asyncio
 import hashlib
 import json
 import time
-from typing import Dict, Any, Optional, List
-from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, AsyncIterator, Awaitable, Callable, Deque
+from collections import defaultdict, deque
 from datetime import datetime, timedelta
 
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.core.exceptions import ExternalServiceError, RunnerPoolTimeoutError
 from app.core.logging import get_logger
-from app.utils.redis_client import get_redis_client
+from app.utils.cache_codec import cache_codec
+from app.utils.redis_client import get_redis_client, redis_client
 from app.config import settings
 
 logger = get_logger(__name__)
 
+# Runner实例池指标
+runner_pool_wait_seconds = Histogram(
+    'agent_runner_pool_wait_seconds',
+    'Time spent waiting to acquire an agent runner',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+runner_pool_queue_depth = Gauge(
+    'agent_runner_pool_queue_depth',
+    'Number of callers waiting for an agent runner'
+)
+
+runner_pool_in_use = Gauge(
+    'agent_runner_pool_in_use',
+    'Number of agent runners currently checked out'
+)
+
+runner_pool_size = Gauge(
+    'agent_runner_pool_size',
+    'Number of agent runners in the pool'
+)
+
+runner_pool_timeouts = Counter(
+    'agent_runner_pool_acquire_timeouts_total',
+    'Total number of agent runner acquire timeouts'
+)
+
+runner_pool_recycled = Counter(
+    'agent_runner_pool_recycled_total',
+    'Total number of agent runners removed from the pool',
+    ['reason']
+)
+
 
 class RunnerPool:
-    """Runner实例池管理器"""
+    """
+    Runner实例池管理器
+    
+    有界池，池满时获取者进入FIFO等待队列，归还的Runner直接交给队首等待者，
+    避免新到达的请求插队。等待超过 ``acquire_timeout`` 抛出 RunnerPoolTimeoutError。
+    Runner每次归还时做健康检查，使用满 ``max_uses`` 次或检查失败即回收，
+    腾出的名额交给等待者重新创建。
+    """
     
-    def __init__(self, max_pool_size: int = 5, idle_timeout: int = 300):
+    def __init__(
+        self,
+        max_pool_size: int = 5,
+        idle_timeout: int = 300,
+        acquire_timeout: float = 30.0,
+        max_uses: int = 100,
+        health_check: Optional[Callable[[Any], Awaitable[bool]]] = None
+    ):
         self.max_pool_size = max_pool_size
         self.idle_timeout = idle_timeout  # 空闲超时时间（秒）
+        self.acquire_timeout = acquire_timeout  # 获取等待超时时间（秒）
+        self.max_uses = max_uses  # 单个Runner最大使用次数，0表示不限制
+        self.health_check = health_check
         self._pool: List[Dict[str, Any]] = []
-        self._lock = asyncio.Lock()
+        self._idle: Deque[Dict[str, Any]] = deque()  # 空闲Runner，右端最近使用
+        # 等待者：结果为Runner信息（直接交接）或None（获得创建名额）
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._creating = 0  # 已占用名额但尚在创建中的Runner数量
         self._stats = {
             "created": 0,
             "reused": 0,
             "expired": 0,
-            "max_pool_size_reached": 0
+            "recycled": 0,
+            "max_pool_size_reached": 0,
+            "timeouts": 0
         }
     
-    async def get_runner(self) -> Any:
+    async def get_runner(self, timeout: Optional[float] = None) -> Any:
         """
         获取Runner实例
         
+        Args:
+            timeout: 等待超时时间（秒），默认使用 acquire_timeout
+            
         Returns:
             Runner实例
-        """
-        async with self._lock:
-            # 清理过期的Runner实例
-            await self._cleanup_expired_runners()
             
-            # 查找可用的Runner实例
-            for runner_info in self._pool:
-                if not runner_info["in_use"]:
-                    runner_info["in_use"] = True
-                    runner_info["last_used"] = time.time()
-                    self._stats["reused"] += 1
-                    
-                    logger.debug(f"复用Runner实例，池大小: {len(self._pool)}")
-                    return runner_info["runner"]
-            
-            # 如果池中没有可用实例且未达到最大大小，创建新实例
-            if len(self._pool) < self.max_pool_size:
-                runner = await self._create_new_runner()
-                if runner:
-                    runner_info = {
-                        "runner": runner,
-                        "created_at": time.time(),
-                        "last_used": time.time(),
-                        "in_use": True,
-                        "use_count": 1
-                    }
-                    
-                    self._pool.append(runner_info)
-                    self._stats["created"] += 1
-                    
-                    logger.info(f"创建新Runner实例，池大小: {len(self._pool)}")
-                    return runner
-            
-            # 池已满，等待或使用最少使用的实例
-            self._stats["max_pool_size_reached"] += 1
-            logger.warning(f"Runner实例池已满 ({self.max_pool_size})，等待可用实例")
+        Raises:
+            RunnerPoolTimeoutError: 等待超时
+            ExternalServiceError: 创建Runner实例失败
+        """
+        start_time = time.monotonic()
+        try:
+            return await self._acquire(timeout if timeout is not None else self.acquire_timeout)
+        finally:
+            runner_pool_wait_seconds.observe(time.monotonic() - start_time)
+            self._update_gauges()
+    
+    @asynccontextmanager
+    async def acquire(self, timeout: Optional[float] = None) -> AsyncIterator[Any]:
+        """
+        以上下文管理器方式获取Runner，退出时自动归还
+        
+        Args:
+            timeout: 等待超时时间（秒），默认使用 acquire_timeout
+        """
+        runner = await self.get_runner(timeout)
+        try:
+            yield runner
+        finally:
+            await self.return_runner(runner)
+    
+    async def _acquire(self, timeout: float) -> Any:
+        """获取Runner：复用空闲实例、创建新实例或排队等待"""
+        self._cleanup_expired_runners()
+        
+        if not self._waiters:
+            if self._idle:
+                runner_info = self._idle.pop()
+                runner_info["in_use"] = True
+                runner_info["last_used"] = time.time()
+                self._stats["reused"] += 1
+                
+                logger.debug(f"复用Runner实例，池大小: {len(self._pool)}")
+                return runner_info["runner"]
             
-            # 简单策略：等待一小段时间后重试
-            await asyncio.sleep(0.1)
-            return await self.get_runner()
+            if len(self._pool) + self._creating < self.max_pool_size:
+                self._creating += 1
+                return await self._create_runner_info()
+        
+        # 池已满，进入FIFO等待队列
+        self._stats["max_pool_size_reached"] += 1
+        logger.debug(f"Runner实例池已满 ({self.max_pool_size})，排队等待，队列长度: {len(self._waiters) + 1}")
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        
+        try:
+            grant = await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                waiter.cancel()
+                self._discard_waiter(waiter)
+                self._stats["timeouts"] += 1
+                runner_pool_timeouts.inc()
+                logger.warning(f"获取Runner实例超时 ({timeout}s)，池大小: {self.max_pool_size}")
+                raise RunnerPoolTimeoutError(
+                    details={"timeout": timeout, "max_pool_size": self.max_pool_size}
+                )
+            # 超时与交接同时发生，以交接为准
+            grant = waiter.result()
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._hand_back(waiter.result())
+            else:
+                waiter.cancel()
+                self._discard_waiter(waiter)
+            raise
+        
+        if grant is None:
+            return await self._create_runner_info()
+        
+        self._stats["reused"] += 1
+        return grant["runner"]
     
-    async def return_runner(self, runner: Any) -> None:
+    def _discard_waiter(self, waiter: asyncio.Future) -> None:
+        """从等待队列移除等待者（cleanup 已清空队列时跳过）"""
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+            self._update_gauges()
+    
+    async def _create_runner_info(self) -> Any:
+        """使用已占用的名额创建Runner并登记到池中"""
+        try:
+            runner = await self._create_new_runner()
+        finally:
+            self._creating -= 1
+        
+        if runner is None:
+            self._release_slot()
+            raise ExternalServiceError("创建Runner实例失败", service="google_adk")
+        
+        runner_info = {
+            "runner": runner,
+            "created_at": time.time(),
+            "last_used": time.time(),
+            "in_use": True,
+            "use_count": 0
+        }
+        self._pool.append(runner_info)
+        self._stats["created"] += 1
+        
+        logger.info(f"创建新Runner实例，池大小: {len(self._pool)}")
+        return runner
+    
+    async def return_runner(self, runner: Any, discard: bool = False) -> None:
         """
         归还Runner实例到池中
         
         Args:
             runner: Runner实例
+            discard: 是否直接丢弃该实例（例如调用过程中出现不可恢复的错误）
         """
-        async with self._lock:
-            for runner_info in self._pool:
-                if runner_info["runner"] is runner:
-                    runner_info["in_use"] = False
-                    runner_info["last_used"] = time.time()
-                    runner_info["use_count"] += 1
-                    
-                    logger.debug(f"归还Runner实例到池，使用次数: {runner_info['use_count']}")
-                    break
+        runner_info = next((r for r in self._pool if r["runner"] is runner), None)
+        if runner_info is None or not runner_info["in_use"]:
+            return
+        
+        runner_info["last_used"] = time.time()
+        runner_info["use_count"] += 1
+        
+        reason = None
+        if discard:
+            reason = "discarded"
+        elif self.max_uses and runner_info["use_count"] >= self.max_uses:
+            reason = "max_uses"
+        elif not await self._is_healthy(runner):
+            reason = "unhealthy"
+        
+        if reason:
+            self._pool.remove(runner_info)
+            self._stats["recycled"] += 1
+            runner_pool_recycled.labels(reason=reason).inc()
+            logger.info(f"回收Runner实例 ({reason})，使用次数: {runner_info['use_count']}")
+            self._release_slot()
+        else:
+            logger.debug(f"归还Runner实例到池，使用次数: {runner_info['use_count']}")
+            self._hand_back(runner_info)
+        
+        self._update_gauges()
+    
+    async def _is_healthy(self, runner: Any) -> bool:
+        """执行健康检查，检查本身出错视为不健康"""
+        if self.health_check is None:
+            return True
+        try:
+            return bool(await self.health_check(runner))
+        except Exception as e:
+            logger.error(f"Runner健康检查失败: {e}")
+            return False
+    
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        """取出队首仍在等待的等待者"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                return waiter
+        return None
+    
+    def _hand_back(self, grant: Optional[Dict[str, Any]]) -> None:
+        """将Runner（或创建名额）交给队首等待者，没有等待者时放回空闲队列"""
+        if grant is None:
+            # 交出的名额已计入 _creating，先收回再转交或释放
+            self._creating -= 1
+            self._release_slot()
+            return
+        
+        waiter = self._next_waiter()
+        if waiter is not None:
+            waiter.set_result(grant)
+            return
+        
+        grant["in_use"] = False
+        self._idle.append(grant)
+    
+    def _release_slot(self) -> None:
+        """Runner被移除后，把空出的名额交给队首等待者"""
+        waiter = self._next_waiter()
+        if waiter is not None:
+            self._creating += 1
+            waiter.set_result(None)
     
     async def _create_new_runner(self) -> Optional[Any]:
         """创建新的Runner实例"""
@@ -107,47 +298,125 @@ class RunnerPool:
             logger.error(f"创建Runner实例失败: {e}")
             return None
     
-    async def _cleanup_expired_runners(self) -> None:
-        """清理过期的Runner实例"""
+    def _cleanup_expired_runners(self) -> None:
+        """清理过期的Runner实例（空闲队列左端最久未使用）"""
         current_time = time.time()
-        expired_runners = []
-        
-        for i, runner_info in enumerate(self._pool):
-            if (not runner_info["in_use"] and 
-                current_time - runner_info["last_used"] > self.idle_timeout):
-                expired_runners.append(i)
         
-        # 从后往前删除，避免索引错位
-        for i in reversed(expired_runners):
-            removed = self._pool.pop(i)
+        while self._idle and current_time - self._idle[0]["last_used"] > self.idle_timeout:
+            removed = self._idle.popleft()
+            self._pool.remove(removed)
             self._stats["expired"] += 1
+            runner_pool_recycled.labels(reason="idle").inc()
             logger.debug(f"清理过期Runner实例，使用次数: {removed['use_count']}")
     
+    def _update_gauges(self) -> None:
+        """更新池状态指标"""
+        runner_pool_size.set(len(self._pool))
+        runner_pool_in_use.set(len(self._pool) - len(self._idle))
+        runner_pool_queue_depth.set(len(self._waiters))
+    
     async def get_stats(self) -> Dict[str, Any]:
         """获取池统计信息"""
-        async with self._lock:
-            return {
-                "pool_size": len(self._pool),
-                "active_runners": sum(1 for r in self._pool if r["in_use"]),
-                "idle_runners": sum(1 for r in self._pool if not r["in_use"]),
-                "max_pool_size": self.max_pool_size,
-                "stats": self._stats.copy()
-            }
+        return {
+            "pool_size": len(self._pool),
+            "active_runners": len(self._pool) - len(self._idle),
+            "idle_runners": len(self._idle),
+            "waiting": len(self._waiters),
+            "max_pool_size": self.max_pool_size,
+            "stats": self._stats.copy()
+        }
     
     async def cleanup(self) -> None:
         """清理所有Runner实例"""
-        async with self._lock:
-            self._pool.clear()
-            logger.info("Runner实例池已清理")
+        while self._waiters:
+            self._waiters.popleft().cancel()
+        self._pool.clear()
+        self._idle.clear()
+        self._update_gauges()
+        logger.info("Runner实例池已清理")
+
+
+# 读取缓存并记录命中/未命中计数
+# KEYS[1]=缓存键 KEYS[2]=统计哈希
+_READ_SCRIPT = """
+local value = redis.call("GET", KEYS[1])
+if value then
+    redis.call("HINCRBY", KEYS[2], "hits", 1)
+else
+    redis.call("HINCRBY", KEYS[2], "misses", 1)
+end
+return value
+"""
+
+# 写入缓存、维护用户索引和全局索引，并按容量上限淘汰最早过期的条目
+# KEYS[1]=缓存键 KEYS[2]=用户索引 KEYS[3]=全局索引 KEYS[4]=统计哈希
+# ARGV[1]=ttl ARGV[2]=值 ARGV[3]=expires_at ARGV[4]=now ARGV[5]=容量上限
+# ARGV[6]=缓存键前缀 ARGV[7]=用户索引前缀
+_WRITE_SCRIPT = """
+local ttl = tonumber(ARGV[1])
+redis.call("SETEX", KEYS[1], ttl, ARGV[2])
+
+redis.call("ZADD", KEYS[2], ARGV[3], KEYS[1])
+redis.call("ZREMRANGEBYSCORE", KEYS[2], "-inf", ARGV[4])
+if redis.call("TTL", KEYS[2]) < ttl then
+    redis.call("EXPIRE", KEYS[2], ttl)
+end
+
+redis.call("ZADD", KEYS[3], ARGV[3], KEYS[1])
+redis.call("ZREMRANGEBYSCORE", KEYS[3], "-inf", ARGV[4])
+redis.call("HINCRBY", KEYS[4], "writes", 1)
+
+local overflow = redis.call("ZCARD", KEYS[3]) - tonumber(ARGV[5])
+if overflow <= 0 then
+    return 0
+end
+
+local victims = redis.call("ZRANGE", KEYS[3], 0, overflow - 1)
+for _, victim in ipairs(victims) do
+    redis.call("DEL", victim)
+    local user_id = string.match(string.sub(victim, #ARGV[6] + 2), "^(.*):[^:]*$")
+    if user_id then
+        redis.call("ZREM", ARGV[7] .. user_id, victim)
+    end
+end
+redis.call("ZREMRANGEBYRANK", KEYS[3], 0, overflow - 1)
+redis.call("HINCRBY", KEYS[4], "evictions", #victims)
+return #victims
+"""
+
+# 删除用户索引中的全部缓存并从全局索引移除
+# KEYS[1]=用户索引 KEYS[2]=全局索引
+_INVALIDATE_USER_SCRIPT = """
+local members = redis.call("ZRANGE", KEYS[1], 0, -1)
+local deleted = 0
+for i = 1, #members, 1000 do
+    local last = math.min(i + 999, #members)
+    deleted = deleted + redis.call("DEL", unpack(members, i, last))
+    redis.call("ZREM", KEYS[2], unpack(members, i, last))
+end
+redis.call("DEL", KEYS[1])
+return deleted
+"""
 
 
 class ResponseCache:
-    """响应缓存管理器"""
+    """
+    响应缓存管理器
+    
+    除缓存条目本身外维护两个按过期时间打分的ZSET索引：
+    - 用户索引：按用户清除缓存时只访问该用户的条目；
+    - 全局索引：O(1)统计条目数，并在超过 ``max_cache_size`` 时
+      按过期时间从早到晚淘汰（TTL相同时即最旧的条目）。
+    命中、未命中、写入和淘汰次数记录在统计哈希中。
+    """
     
     def __init__(self, default_ttl: int = 3600, max_cache_size: int = 1000):
         self.default_ttl = default_ttl  # 默认缓存时间（秒）
         self.max_cache_size = max_cache_size
         self._cache_prefix = "agent_response_cache"
+        self._user_index_prefix = "agent_response_index:user:"
+        self._global_index_key = "agent_response_index:all"
+        self._stats_key = "agent_response_stats"
     
     def _generate_cache_key(self, user_id: str, query: str, context: Dict[str, Any] = None) -> str:
         """
@@ -159,7 +428,7 @@ class ResponseCache:
             context: 查询上下文
             
         Returns:
-            缓存键
+            缓存键（包含用户ID，便于淘汰时定位用户索引）
         """
         # 创建查询指纹
         query_data = {
@@ -171,7 +440,11 @@ class ResponseCache:
         query_json = json.dumps(query_data, sort_keys=True, ensure_ascii=False)
         query_hash = hashlib.md5(query_json.encode('utf-8')).hexdigest()
         
-        return f"{self._cache_prefix}:{query_hash}"
+        return f"{self._cache_prefix}:{user_id}:{query_hash}"
+    
+    def _get_user_index_key(self, user_id: str) -> str:
+        """获取用户索引键"""
+        return f"{self._user_index_prefix}{user_id}"
     
     async def get_cached_response(
         self, 
@@ -194,12 +467,13 @@ class ResponseCache:
             return None
         
         try:
-            redis = await get_redis_client()
             cache_key = self._generate_cache_key(user_id, query, context)
             
-            cached_data = await redis.get(cache_key)
+            cached_data = await redis_client.run_script(
+                _READ_SCRIPT, keys=[cache_key, self._stats_key], decode=False
+            )
             if cached_data:
-                response_data = json.loads(cached_data)
+                response_data = cache_codec.decode(cached_data, self._cache_prefix)
                 
                 # 检查缓存是否过期（双重检查）
                 if response_data.get("expires_at", 0) > time.time():
@@ -237,27 +511,43 @@ class ResponseCache:
             return False
         
         try:
-            redis = await get_redis_client()
             cache_key = self._generate_cache_key(user_id, query, context)
             
             ttl = ttl or self.default_ttl
-            expires_at = time.time() + ttl
+            now = time.time()
+            expires_at = now + ttl
             
             cache_data = {
                 "response": response,
                 "user_id": user_id,
                 "query": query,
                 "context": context,
-                "cached_at": time.time(),
+                "cached_at": now,
                 "expires_at": expires_at
             }
             
-            await redis.setex(
-                cache_key,
-                ttl,
-                json.dumps(cache_data, ensure_ascii=False)
+            evicted = await redis_client.run_script(
+                _WRITE_SCRIPT,
+                keys=[
+                    cache_key,
+                    self._get_user_index_key(user_id),
+                    self._global_index_key,
+                    self._stats_key
+                ],
+                args=[
+                    ttl,
+                    cache_codec.encode(cache_data, self._cache_prefix),
+                    expires_at,
+                    now,
+                    self.max_cache_size,
+                    self._cache_prefix,
+                    self._user_index_prefix
+                ]
             )
             
+            if evicted:
+                logger.info(f"响应缓存超过上限 {self.max_cache_size}，淘汰 {evicted} 条")
+            
             logger.debug(f"缓存响应 - 用户: {user_id}, TTL: {ttl}s")
             return True
             
@@ -276,63 +566,41 @@ class ResponseCache:
             清除的缓存数量
         """
         try:
-            redis = await get_redis_client()
-            pattern = f"{self._cache_prefix}:*"
-            
-            keys = await redis.keys(pattern)
-            if not keys:
-                return 0
-            
-            # 检查每个键是否属于该用户
-            user_keys = []
-            for key in keys:
-                try:
-                    data = await redis.get(key)
-                    if data:
-                        cache_info = json.loads(data)
-                        if cache_info.get("user_id") == user_id:
-                            user_keys.append(key)
-                except:
-                    continue
+            deleted = await redis_client.run_script(
+                _INVALIDATE_USER_SCRIPT,
+                keys=[self._get_user_index_key(user_id), self._global_index_key]
+            )
             
-            if user_keys:
-                await redis.delete(*user_keys)
-                logger.info(f"清除用户 {user_id} 的 {len(user_keys)} 个缓存")
+            if deleted:
+                logger.info(f"清除用户 {user_id} 的 {deleted} 个缓存")
             
-            return len(user_keys)
+            return deleted
             
         except Exception as e:
             logger.error(f"清除用户缓存失败: {e}")
             return 0
     
     async def get_cache_stats(self) -> Dict[str, Any]:
-        """获取缓存统计信息"""
+        """获取缓存统计信息（一次往返，不扫描缓存条目）"""
         try:
             redis = await get_redis_client()
-            pattern = f"{self._cache_prefix}:*"
-            keys = await redis.keys(pattern)
-            
-            total_keys = len(keys)
-            valid_keys = 0
-            expired_keys = 0
             current_time = time.time()
             
-            for key in keys:
-                try:
-                    data = await redis.get(key)
-                    if data:
-                        cache_info = json.loads(data)
-                        if cache_info.get("expires_at", 0) > current_time:
-                            valid_keys += 1
-                        else:
-                            expired_keys += 1
-                except:
-                    expired_keys += 1
+            pipeline = redis.pipeline(transaction=False)
+            pipeline.zcard(self._global_index_key)
+            pipeline.zcount(self._global_index_key, current_time, "+inf")
+            pipeline.hgetall(self._stats_key)
+            total_keys, valid_keys, counters = await pipeline.execute()
             
             return {
                 "total_cached_responses": total_keys,
                 "valid_responses": valid_keys,
-                "expired_responses": expired_keys,
+                "expired_responses": total_keys - valid_keys,
+                "hits": int(counters.get("hits", 0)),
+                "misses": int(counters.get("misses", 0)),
+                "writes": int(counters.get("writes", 0)),
+                "evictions": int(counters.get("evictions", 0)),
+                "max_cache_size": self.max_cache_size,
                 "cache_enabled": settings.AGENT_ENABLE_CACHE,
                 "default_ttl": self.default_ttl
             }
@@ -415,7 +683,9 @@ class AgentPerformanceOptimizer:
     def __init__(self):
         self.runner_pool = RunnerPool(
             max_pool_size=getattr(settings, 'AGENT_RUNNER_POOL_SIZE', 5),
-            idle_timeout=getattr(settings, 'AGENT_RUNNER_IDLE_TIMEOUT', 300)
+            idle_timeout=getattr(settings, 'AGENT_RUNNER_IDLE_TIMEOUT', 300),
+            acquire_timeout=getattr(settings, 'AGENT_RUNNER_ACQUIRE_TIMEOUT', 30.0),
+            max_uses=getattr(settings, 'AGENT_RUNNER_MAX_USES', 100)
         )
         self.response_cache = ResponseCache(
             default_ttl=getattr(settings, 'AGENT_CACHE_TTL', 3600),
@@ -427,9 +697,13 @@ class AgentPerformanceOptimizer:
         """获取优化的Runner实例"""
         return await self.runner_pool.get_runner()
     
-    async def return_runner(self, runner: Any) -> None:
+    async def return_runner(self, runner: Any, discard: bool = False) -> None:
         """归还Runner实例"""
-        await self.runner_pool.return_runner(runner)
+        await self.runner_pool.return_runner(runner, discard)
+    
+    def optimized_runner(self, timeout: Optional[float] = None):
+        """以上下文管理器方式获取Runner实例，退出时自动归还"""
+        return self.runner_pool.acquire(timeout)
     
     async def get_cached_response_or_none(
         self, 
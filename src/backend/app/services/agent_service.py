@@ -4,16 +4,17 @@ TradeFlowAgent服务 - ADK Runner封装整合版
 """
 
 import asyncio
+import inspect
 import os
 import sys
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator, Dict, Any, Optional
+from typing import AsyncGenerator, AsyncIterator, Dict, Any, Optional
 from pathlib import Path
 
 from app.core.logging import get_logger
 from app.config import settings
 from app.services.session_manager import session_manager
-from app.services.sse_converter import SSEConverter, StreamEventProcessor
+from app.services.sse_converter import SSEConverter, SSEEventType, StreamEventProcessor
 from app.services.agent_error_handler import with_retry, AgentError, ErrorType
 from app.services.agent_performance_optimizer import performance_optimizer
 
@@ -146,24 +147,14 @@ class AgentService:
                 user_id, session_id, "user", query
             )
             
-            # 获取优化的Runner实例
-            runner = await performance_optimizer.get_optimized_runner()
-            
-            try:
-                # 构建Content对象
-                from google.adk.core import Content
-                content = Content(role="user", parts=[{"text": query}])
-                
+            # 获取优化的Runner实例，退出时自动归还到池中
+            async with performance_optimizer.optimized_runner() as runner:
                 # 调用Runner执行
                 result = await runner.run_async(
                     agent=self._root_agent,
                     user_id=user_id,
-                    contents=[content]
+                    contents=[self._build_content(query)]
                 )
-                
-            finally:
-                # 归还Runner实例到池中
-                await performance_optimizer.return_runner(runner)
             
             logger.info(f"Agent查询完成 - 用户: {user_id}")
             
@@ -267,52 +258,73 @@ class AgentService:
             # 发送开始事件
             yield stream_processor.start_stream(query)
             
+            # 检查缓存响应
+            context = await session_manager.get_context(user_id, session_id)
+            cached_response = await performance_optimizer.get_cached_response_or_none(
+                user_id, query, context
+            )
+            
+            if cached_response:
+                logger.info(f"返回缓存响应 - 用户: {user_id}")
+                yield SSEConverter.format_sse_event(
+                    SSEEventType.CHUNK,
+                    {"text": cached_response["response"], "index": 0}
+                )
+                yield stream_processor.end_stream(
+                    success=True,
+                    metadata={
+                        "response_length": len(cached_response["response"]),
+                        "chunks_sent": 1,
+                        "cached": True
+                    }
+                )
+                return
+            
             # 添加用户消息到历史
             await session_manager.add_message_to_history(
                 user_id, session_id, "user", query
             )
             
-            # TODO: 这里应该实现真正的ADK流式API
-            # 目前使用同步查询然后分块模拟流式效果
             try:
-                # 构建Content对象
-                from google.adk.core import Content
-                content = Content(role="user", parts=[{"text": query}])
-                
-                # 调用Runner执行（同步版本）
-                result = await self._runner.run_async(
-                    agent=self._root_agent,
-                    user_id=user_id,
-                    contents=[content]
-                )
+                # 边接收ADK事件边转发增量文本
+                response_parts = []
+                chunks_sent = 0
+                partial_since_final = False
                 
-                # 提取响应文本
-                response_text = ""
-                if hasattr(result, 'parts') and result.parts:
-                    for part in result.parts:
-                        if hasattr(part, 'text'):
-                            response_text += part.text
-                else:
-                    response_text = str(result)
-                
-                # 模拟流式输出
-                chunk_size = 30  # 每次输出30字符
-                
-                for i in range(0, len(response_text), chunk_size):
-                    chunk = response_text[i:i+chunk_size]
+                async for event in self._iter_runner_events(self._runner, user_id, query):
+                    is_partial = getattr(event, "partial", None)
                     
-                    # 创建chunk事件并转换为SSE格式
-                    chunk_event = {
-                        "event": "chunk",
-                        "data": {"text": chunk, "index": i // chunk_size}
-                    }
+                    # 流式模式下最终事件携带的是已转发增量的汇总，不再重复发送
+                    if is_partial is False and partial_since_final:
+                        partial_since_final = False
+                        continue
                     
+                    text = self._extract_event_text(event)
+                    if not text:
+                        continue
+                    
+                    if is_partial:
+                        partial_since_final = True
+                    
+                    response_parts.append(text)
                     yield SSEConverter.format_sse_event(
-                        SSEConverter.SSEEventType.CHUNK,
-                        chunk_event["data"]
+                        SSEEventType.CHUNK,
+                        {"text": text, "index": chunks_sent}
                     )
-                    
-                    await asyncio.sleep(0.02)  # 小延迟模拟流式效果
+                    chunks_sent += 1
+                
+                response_text = "".join(response_parts)
+                logger.info(f"流式Agent查询完成 - 用户: {user_id}, 块数: {chunks_sent}")
+                
+                # 缓存响应
+                await performance_optimizer.cache_response_if_enabled(
+                    user_id, query, response_text, context
+                )
+                
+                # Token使用监控（估算值）
+                await performance_optimizer.check_token_usage(
+                    user_id, len(query) // 4, len(response_text) // 4
+                )
                 
                 # 添加Assistant响应到历史
                 await session_manager.add_message_to_history(
@@ -321,7 +333,7 @@ class AgentService:
                 
                 # 更新上下文
                 await session_manager.update_context(user_id, session_id, {
-                    "conversation_turns": (await session_manager.get_context(user_id, session_id)).get("conversation_turns", 0) + 1,
+                    "conversation_turns": context.get("conversation_turns", 0) + 1,
                     "last_query": query,
                     "last_response_length": len(response_text)
                 })
@@ -331,7 +343,7 @@ class AgentService:
                     success=True,
                     metadata={
                         "response_length": len(response_text),
-                        "chunks_sent": (len(response_text) + chunk_size - 1) // chunk_size
+                        "chunks_sent": chunks_sent
                     }
                 )
                 
@@ -350,6 +362,59 @@ class AgentService:
             logger.error(f"流式Agent查询失败: {e}")
             yield SSEConverter.create_error_event(f"流式查询失败: {str(e)}")
     
+    @staticmethod
+    def _build_content(query: str) -> Any:
+        """构建用户消息Content对象"""
+        from google.adk.core import Content
+        return Content(role="user", parts=[{"text": query}])
+    
+    async def _iter_runner_events(
+        self, 
+        runner: Any, 
+        user_id: str, 
+        query: str
+    ) -> AsyncIterator[Any]:
+        """
+        执行Runner并逐个产出ADK事件
+        
+        Runner返回异步事件流时按到达顺序产出；返回一次性结果时将其作为单个事件产出。
+        """
+        result = runner.run_async(
+            agent=self._root_agent,
+            user_id=user_id,
+            contents=[self._build_content(query)]
+        )
+        
+        if inspect.isawaitable(result):
+            result = await result
+        
+        if hasattr(result, "__aiter__"):
+            async for event in result:
+                yield event
+        else:
+            yield result
+    
+    @staticmethod
+    def _extract_event_text(event: Any) -> str:
+        """提取ADK事件或结果中的文本内容"""
+        if isinstance(event, str):
+            return event
+        
+        parts = getattr(event, "parts", None)
+        if not isinstance(parts, (list, tuple)):
+            parts = getattr(getattr(event, "content", None), "parts", None)
+        
+        if isinstance(parts, (list, tuple)):
+            texts = []
+            for part in parts:
+                text = part.get("text") if isinstance(part, dict) else getattr(part, "text", None)
+                if isinstance(text, str):
+                    texts.append(text)
+            return "".join(texts)
+        
+        text = getattr(event, "text", None)
+        return text if isinstance(text, str) else ""
+    
     async def health_check(self) -> Dict[str, Any]:
         """Agent健康检查"""
         try:
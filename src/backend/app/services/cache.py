@@ -1,15 +1,98 @@
 """缓存服务实现."""
 
+import asyncio
+import fnmatch
+import functools
 import json
+import math
 import pickle
+import random
+import re
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Any, Callable, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
+from prometheus_client import Counter, Gauge
+
+from app.config import settings
 from app.core.logging import get_logger
+from app.utils.cache_codec import CacheCodec, cache_codec, key_prefix
 from app.utils.redis_client import redis_client
 
 logger = get_logger(__name__)
 
+# 进程内缓存（L1）指标
+l1_cache_hits = Counter(
+    'cache_l1_hits_total',
+    'Total number of in-process cache hits'
+)
+
+l1_cache_misses = Counter(
+    'cache_l1_misses_total',
+    'Total number of in-process cache misses'
+)
+
+l1_cache_evictions = Counter(
+    'cache_l1_evictions_total',
+    'Total number of in-process cache evictions',
+    ['reason']
+)
+
+l1_cache_entries = Gauge(
+    'cache_l1_entries',
+    'Number of entries in the in-process cache'
+)
+
+l1_cache_bytes = Gauge(
+    'cache_l1_size_bytes',
+    'Approximate size of the in-process cache in bytes'
+)
+
+# 缺失值哨兵（区分“未命中”与“缓存了None”）
+_MISSING = object()
+
+# 写入缓存并登记到标签索引。标签集合的TTL不短于其成员，
+# 保证成员存活期间索引一定存在，成员全部过期后索引也会自然过期。
+# KEYS[1]=缓存键, KEYS[2..]=标签集合; ARGV[1]=ttl, ARGV[2]=值
+_SET_WITH_TAGS_SCRIPT = """
+local ttl = tonumber(ARGV[1])
+redis.call("SETEX", KEYS[1], ttl, ARGV[2])
+for i = 2, #KEYS do
+    redis.call("SADD", KEYS[i], KEYS[1])
+    if redis.call("TTL", KEYS[i]) < ttl then
+        redis.call("EXPIRE", KEYS[i], ttl)
+    end
+end
+return 1
+"""
+
+# 删除标签集合中的所有键及标签集合本身，返回被删除的成员列表。
+# 分批DEL避免超出Lua栈上限。
+_INVALIDATE_TAGS_SCRIPT = """
+local deleted = {}
+for i = 1, #KEYS do
+    local members = redis.call("SMEMBERS", KEYS[i])
+    for j = 1, #members, 1000 do
+        redis.call("DEL", unpack(members, j, math.min(j + 999, #members)))
+    end
+    for _, member in ipairs(members) do
+        table.insert(deleted, member)
+    end
+    redis.call("DEL", KEYS[i])
+end
+return deleted
+"""
+
+# 仅当锁仍由自己持有时才删除
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
 
 class CacheKey:
     """缓存键管理."""
@@ -22,6 +105,7 @@ class CacheKey:
     BUYER = "buyer"
     SUPPLIER = "supplier"
     STATS = "stats"
+    TAG = "cache_tag"
     
     @staticmethod
     def user_profile(user_id: int) -> str:
@@ -72,15 +156,203 @@ class CacheKey:
     def user_stats(user_id: int, stat_type: str) -> str:
         """用户统计缓存键."""
         return f"{CacheKey.STATS}:{stat_type}:{user_id}"
+    
+    @staticmethod
+    def user_tag(user_id: int) -> str:
+        """用户标签（用于按用户批量失效）."""
+        return f"{CacheKey.USER}:{user_id}"
+    
+    @staticmethod
+    def tag_index(tag: str) -> str:
+        """标签索引集合键."""
+        return f"{CacheKey.TAG}:{tag}"
+    
+    @staticmethod
+    def owner_tag(key: str) -> Optional[str]:
+        """
+        由用户相关缓存键推出所属用户标签.
+        
+        覆盖上面各个按用户构造的键（与 ``_user_cache_patterns`` 一致），
+        其他键返回 None。
+        """
+        match = _USER_KEY_PATTERN.match(key)
+        if not match:
+            return None
+        user_id = next(group for group in match.groups() if group)
+        return CacheKey.user_tag(int(user_id))
+
+
+# 按用户构造的缓存键：user:*:{id}、product/conversation:list:{id}:{page}、
+# buyer:recommendations:{id}、stats:*:{id}
+_USER_KEY_PATTERN = re.compile(
+    rf"^(?:{CacheKey.USER}:[^:]+:(\d+)"
+    rf"|(?:{CacheKey.PRODUCT}|{CacheKey.CONVERSATION}):list:(\d+):\d+"
+    rf"|{CacheKey.BUYER}:recommendations:(\d+)"
+    rf"|{CacheKey.STATS}:[^:]+:(\d+))$"
+)
+
+
+class LocalCache:
+    """
+    进程内LRU缓存（L1）.
+    
+    按条目数和字节数双重限制容量，条目带TTL。存放的是反序列化后的对象，
+    调用方不应修改返回值。
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        max_bytes: int = 32 * 1024 * 1024,
+        default_ttl: int = 30
+    ):
+        """
+        初始化进程内缓存.
+        
+        Args:
+            max_entries: 最大条目数
+            max_bytes: 最大占用字节数（按序列化后的大小估算）
+            default_ttl: 默认过期时间（秒）
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        # key -> (value, expires_at, size)
+        self._data: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    @property
+    def size_bytes(self) -> int:
+        """当前占用字节数."""
+        return self._bytes
+    
+    def get(self, key: str) -> Any:
+        """获取缓存值，未命中返回 _MISSING."""
+        entry = self._data.get(key)
+        if entry is None:
+            l1_cache_misses.inc()
+            return _MISSING
+        
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            l1_cache_evictions.labels(reason="expired").inc()
+            l1_cache_misses.inc()
+            return _MISSING
+        
+        self._data.move_to_end(key)
+        l1_cache_hits.inc()
+        return value
+    
+    def set(self, key: str, value: Any, size: int, ttl: Optional[int] = None) -> None:
+        """写入缓存，超出容量时按LRU淘汰."""
+        if size > self.max_bytes:
+            # 单个值过大，不进入L1
+            self.delete(key)
+            return
+        
+        if key in self._data:
+            self._remove(key)
+        
+        ttl = min(ttl or self.default_ttl, self.default_ttl)
+        self._data[key] = (value, time.monotonic() + ttl, size)
+        self._bytes += size
+        
+        while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._data))
+            self._remove(oldest_key)
+            l1_cache_evictions.labels(reason="capacity").inc()
+        
+        self._update_gauges()
+    
+    def delete(self, key: str) -> bool:
+        """删除单个键."""
+        if key not in self._data:
+            return False
+        
+        self._remove(key)
+        l1_cache_evictions.labels(reason="invalidated").inc()
+        self._update_gauges()
+        return True
+    
+    def delete_pattern(self, pattern: str) -> int:
+        """按glob模式删除键（与Redis的MATCH语义一致）."""
+        keys = [k for k in self._data if fnmatch.fnmatchcase(k, pattern)]
+        for key in keys:
+            self._remove(key)
+        
+        if keys:
+            l1_cache_evictions.labels(reason="invalidated").inc(len(keys))
+            self._update_gauges()
+        
+        return len(keys)
+    
+    def clear(self) -> None:
+        """清空缓存."""
+        self._data.clear()
+        self._bytes = 0
+        self._update_gauges()
+    
+    def _remove(self, key: str) -> None:
+        """移除条目并更新字节计数."""
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+    
+    def _update_gauges(self) -> None:
+        """同步Prometheus指标."""
+        l1_cache_entries.set(len(self._data))
+        l1_cache_bytes.set(self._bytes)
 
 
 class CacheService:
-    """缓存服务."""
+    """
+    缓存服务.
+    
+    可选启用进程内L1缓存：命中前缀的热点键（如用户资料、订阅）先查本地，
+    未命中再查Redis。失效操作通过Redis pub/sub广播给其他worker。
+    """
     
-    def __init__(self):
-        """初始化缓存服务."""
+    def __init__(
+        self,
+        enable_local_cache: Optional[bool] = None,
+        codec: Optional[CacheCodec] = None
+    ):
+        """
+        初始化缓存服务.
+        
+        Args:
+            enable_local_cache: 是否启用进程内L1缓存，默认读取配置
+            codec: 值编解码器，默认使用全局 msgpack + 压缩编解码器
+        """
         self.default_ttl = 3600  # 默认1小时
-        self.serializer = "json"  # 默认使用JSON序列化
+        # 默认使用编解码器（msgpack + 超过阈值压缩，兼容读取旧JSON条目）；
+        # "json" / "pickle" 仅在显式设置时使用
+        self.serializer = "codec"
+        self.codec = codec or cache_codec
+        
+        if enable_local_cache is None:
+            enable_local_cache = settings.CACHE_L1_ENABLED
+        
+        self.local_cache: Optional[LocalCache] = None
+        if enable_local_cache:
+            self.local_cache = LocalCache(
+                max_entries=settings.CACHE_L1_MAX_ENTRIES,
+                max_bytes=settings.CACHE_L1_MAX_BYTES,
+                default_ttl=settings.CACHE_L1_TTL
+            )
+        self.local_cache_prefixes = tuple(settings.CACHE_L1_KEY_PREFIXES)
+        self.invalidation_channel = settings.CACHE_INVALIDATION_CHANNEL
+        
+        # 节点标识，用于忽略自己发出的失效广播
+        self.node_id = uuid.uuid4().hex
+        self._invalidation_task: Optional[asyncio.Task] = None
+    
+    def _use_local_cache(self, key: str) -> bool:
+        """判断键是否走L1缓存."""
+        return self.local_cache is not None and key.startswith(self.local_cache_prefixes)
     
     async def get(
         self,
@@ -99,8 +371,19 @@ class CacheService:
         Returns:
             缓存值或默认值
         """
+        use_local = deserializer is None and self._use_local_cache(key)
+        
+        if use_local:
+            local_value = self.local_cache.get(key)
+            if local_value is not _MISSING:
+                return local_value
+        
         try:
-            value = await redis_client.get(key)
+            use_codec = deserializer is None and self.serializer == "codec"
+            if use_codec:
+                value = await redis_client.get_bytes(key)
+            else:
+                value = await redis_client.get(key)
             
             if value is None:
                 return default
@@ -108,12 +391,19 @@ class CacheService:
             # 反序列化
             if deserializer:
                 return deserializer(value)
+            elif use_codec:
+                result = self.codec.decode(value, key_prefix(key))
             elif self.serializer == "json":
-                return json.loads(value)
+                result = json.loads(value)
             elif self.serializer == "pickle":
-                return pickle.loads(value)
+                result = pickle.loads(value)
             else:
-                return value
+                result = value
+            
+            if use_local:
+                self.local_cache.set(key, result, len(value))
+            
+            return result
             
         except Exception as e:
             logger.error(f"Cache get error: {e}")
@@ -124,7 +414,8 @@ class CacheService:
         key: str,
         value: Any,
         ttl: Optional[int] = None,
-        serializer: Optional[Callable] = None
+        serializer: Optional[Callable] = None,
+        tags: Optional[List[str]] = None
     ) -> bool:
         """
         设置缓存.
@@ -134,6 +425,7 @@ class CacheService:
             value: 缓存值
             ttl: 过期时间（秒）
             serializer: 序列化函数
+            tags: 标签列表，键会登记到对应的标签索引，可用 invalidate_tags 批量失效
             
         Returns:
             是否成功
@@ -144,6 +436,8 @@ class CacheService:
             # 序列化
             if serializer:
                 serialized_value = serializer(value)
+            elif self.serializer == "codec":
+                serialized_value = self.codec.encode(value, key_prefix(key))
             elif self.serializer == "json":
                 serialized_value = json.dumps(value, ensure_ascii=False)
             elif self.serializer == "pickle":
@@ -151,7 +445,29 @@ class CacheService:
             else:
                 serialized_value = value
             
-            await redis_client.setex(key, ttl, serialized_value)
+            # 用户相关的键自动登记到用户标签，invalidate_user_cache 无需SCAN
+            owner_tag = CacheKey.owner_tag(key)
+            if owner_tag and owner_tag not in (tags or []):
+                tags = [*(tags or []), owner_tag]
+            
+            if tags:
+                # 写值和登记索引在一次原子调用中完成
+                await redis_client.run_script(
+                    _SET_WITH_TAGS_SCRIPT,
+                    keys=[key, *(CacheKey.tag_index(tag) for tag in tags)],
+                    args=[ttl, serialized_value]
+                )
+            else:
+                await redis_client.setex(key, ttl, serialized_value)
+            
+            if self._use_local_cache(key):
+                if serializer is None:
+                    self.local_cache.set(key, value, len(serialized_value), ttl)
+                else:
+                    self.local_cache.delete(key)
+                # 其他节点的L1副本已过时
+                await self._broadcast_invalidation(keys=[key])
+            
             return True
             
         except Exception as e:
@@ -168,15 +484,24 @@ class CacheService:
         Returns:
             删除的键数量
         """
+        keys = key if isinstance(key, list) else [key]
+        
+        if self.local_cache is not None:
+            for k in keys:
+                self.local_cache.delete(k)
+        
         try:
-            if isinstance(key, list):
-                return await redis_client.delete(*key)
-            else:
-                return await redis_client.delete(key)
+            deleted = await redis_client.delete(*keys)
             
         except Exception as e:
             logger.error(f"Cache delete error: {e}")
             return 0
+        
+        # 先删除L2再通知，避免其他节点在删除前从Redis重新加载旧值
+        if self.local_cache is not None:
+            await self._broadcast_invalidation(keys=keys)
+        
+        return deleted
     
     async def exists(self, key: str) -> bool:
         """
@@ -223,47 +548,195 @@ class CacheService:
         Returns:
             删除的键数量
         """
+        if self.local_cache is not None:
+            self.local_cache.delete_pattern(pattern)
+        
         try:
             keys = []
-            async for key in redis_client.scan_iter(match=pattern):
+            async for key in redis_client.scan_iter(match=pattern, count=1000):
                 keys.append(key)
             
-            if keys:
-                return await redis_client.delete(*keys)
+            deleted = await redis_client.delete(*keys) if keys else 0
             
+        except Exception as e:
+            logger.error(f"Cache invalidate pattern error: {e}")
             return 0
+        
+        # 先删除L2再通知，与 set() 的顺序一致
+        if self.local_cache is not None:
+            await self._broadcast_invalidation(patterns=[pattern])
+        
+        return deleted
+    
+    async def invalidate_tags(self, tags: List[str]) -> int:
+        """
+        按标签批量删除缓存.
+        
+        读取标签索引并删除其全部成员，整个过程在一次原子调用内完成，
+        代价只与标签下的键数量相关，与Redis总键数无关。
+        
+        Args:
+            tags: 标签列表
             
+        Returns:
+            删除的键数量
+        """
+        try:
+            deleted = await redis_client.run_script(
+                _INVALIDATE_TAGS_SCRIPT,
+                keys=[CacheKey.tag_index(tag) for tag in tags]
+            )
         except Exception as e:
-            logger.error(f"Cache invalidate pattern error: {e}")
+            logger.error(f"Cache invalidate tags error: {e}")
             return 0
+        
+        if self.local_cache is not None and deleted:
+            for key in deleted:
+                self.local_cache.delete(key)
+            await self._broadcast_invalidation(keys=deleted)
+        
+        return len(deleted)
     
-    async def invalidate_user_cache(self, user_id: int) -> None:
-        """清除用户相关缓存."""
-        patterns = [
+    async def invalidate_user_cache(self, user_id: int, use_scan: bool = False) -> None:
+        """
+        清除用户相关缓存.
+        
+        默认使用用户标签索引（``set`` 写入用户相关键时自动登记，见 ``CacheKey.owner_tag``）。
+        ``use_scan=True`` 时额外按模式SCAN全库，用于清理未登记标签的旧数据。
+        """
+        await self.invalidate_tags([CacheKey.user_tag(user_id)])
+        
+        if not use_scan:
+            return
+        
+        for pattern in self._user_cache_patterns(user_id):
+            await self.invalidate_pattern(pattern)
+    
+    @staticmethod
+    def _user_cache_patterns(user_id: int) -> List[str]:
+        """用户相关缓存键模式（SCAN兜底使用）."""
+        return [
             f"{CacheKey.USER}:*:{user_id}",
             f"{CacheKey.PRODUCT}:list:{user_id}:*",
             f"{CacheKey.CONVERSATION}:list:{user_id}:*",
             f"{CacheKey.BUYER}:recommendations:{user_id}",
             f"{CacheKey.STATS}:*:{user_id}"
         ]
-        
-        for pattern in patterns:
-            await self.invalidate_pattern(pattern)
     
     async def cache_warmup(self, user_id: int) -> None:
         """缓存预热."""
         # TODO: 实现缓存预热逻辑
         pass
+    
+    async def _broadcast_invalidation(
+        self,
+        keys: Optional[List[str]] = None,
+        patterns: Optional[List[str]] = None
+    ) -> None:
+        """通过Redis pub/sub通知其他节点清除L1缓存."""
+        if self.local_cache is None:
+            return
+        
+        # 只广播可能存在于L1中的键，模式无法判断，全部广播
+        keys = [k for k in keys or [] if k.startswith(self.local_cache_prefixes)]
+        if not keys and not patterns:
+            return
+        
+        message = json.dumps({
+            "origin": self.node_id,
+            "keys": keys,
+            "patterns": patterns or []
+        })
+        
+        try:
+            await redis_client.publish(self.invalidation_channel, message)
+        except Exception as e:
+            logger.error(f"Cache invalidation broadcast error: {e}")
+    
+    def _apply_invalidation(self, raw_message: str) -> None:
+        """应用来自其他节点的失效消息."""
+        try:
+            message = json.loads(raw_message)
+        except (json.JSONDecodeError, TypeError):
+            logger.warning(f"Invalid cache invalidation message: {raw_message}")
+            return
+        
+        if message.get("origin") == self.node_id:
+            return
+        
+        for key in message.get("keys", []):
+            self.local_cache.delete(key)
+        
+        for pattern in message.get("patterns", []):
+            self.local_cache.delete_pattern(pattern)
+    
+    async def start_invalidation_listener(self) -> None:
+        """启动L1失效广播监听任务."""
+        if self.local_cache is None:
+            return
+        
+        if not self._invalidation_task or self._invalidation_task.done():
+            self._invalidation_task = asyncio.create_task(self._invalidation_loop())
+    
+    async def stop_invalidation_listener(self) -> None:
+        """停止L1失效广播监听任务."""
+        if self._invalidation_task:
+            self._invalidation_task.cancel()
+            try:
+                await self._invalidation_task
+            except asyncio.CancelledError:
+                pass
+            self._invalidation_task = None
+    
+    async def _invalidation_loop(self) -> None:
+        """订阅失效频道，断线后自动重连."""
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(self.invalidation_channel)
+                # 订阅中断期间可能漏掉广播，重新订阅后清空L1
+                self.local_cache.clear()
+                
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._apply_invalidation(message["data"])
+                
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cache invalidation listener error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
 
 
 class CacheDecorator:
-    """缓存装饰器."""
+    """
+    缓存装饰器.
+    
+    内置防击穿保护：
+    - 单飞（single-flight）：同一进程内同一个键同时只执行一次被装饰函数，
+      其他调用方等待同一个结果；
+    - 可选Redis分布式锁：跨worker去重，未抢到锁的worker等待缓存被回填；
+    - stale-while-revalidate：过期后的 ``stale_ttl`` 秒内先返回旧值，
+      后台只触发一次刷新；
+    - 概率提前过期（XFetch）：``early_expiration_beta`` > 0 时，临近过期的
+      热点键会被随机提前刷新，避免集中过期。
+    """
     
     def __init__(
         self,
         key_func: Callable,
         ttl: int = 3600,
-        cache_none: bool = False
+        cache_none: bool = False,
+        stale_ttl: int = 0,
+        early_expiration_beta: float = 0.0,
+        distributed_lock: bool = False,
+        lock_timeout: float = 10.0,
+        lock_poll_interval: float = 0.05
     ):
         """
         初始化缓存装饰器.
@@ -272,34 +745,184 @@ class CacheDecorator:
             key_func: 生成缓存键的函数
             ttl: 过期时间
             cache_none: 是否缓存None值
+            stale_ttl: 过期后仍可返回旧值的时间（秒），0表示不启用
+            early_expiration_beta: 概率提前过期系数，0表示不启用，通常取1.0
+            distributed_lock: 是否使用Redis锁做跨worker去重
+            lock_timeout: 分布式锁超时时间（秒）
+            lock_poll_interval: 等待其他worker回填缓存的轮询间隔（秒）
         """
         self.key_func = key_func
         self.ttl = ttl
         self.cache_none = cache_none
-        self.cache_service = CacheService()
+        self.stale_ttl = stale_ttl
+        self.early_expiration_beta = early_expiration_beta
+        self.distributed_lock = distributed_lock
+        self.lock_timeout = lock_timeout
+        self.lock_poll_interval = lock_poll_interval
+        # 装饰器实例不参与失效广播监听，不启用L1
+        self.cache_service = CacheService(enable_local_cache=False)
+        # 进行中的加载任务：cache_key -> Task
+        self._inflight: Dict[str, asyncio.Task] = {}
     
     def __call__(self, func: Callable) -> Callable:
         """装饰器实现."""
+        @functools.wraps(func)
         async def wrapper(*args, **kwargs):
             # 生成缓存键
             cache_key = self.key_func(*args, **kwargs)
             
             # 尝试从缓存获取
-            cached_value = await self.cache_service.get(cache_key)
-            if cached_value is not None or (cached_value is None and self.cache_none):
-                logger.debug(f"Cache hit: {cache_key}")
-                return cached_value
+            envelope = await self._get_envelope(cache_key)
+            if envelope is not None:
+                now = time.time()
+                
+                if now < envelope["expires_at"] and not self._should_refresh_early(envelope, now):
+                    logger.debug(f"Cache hit: {cache_key}")
+                    return envelope["value"]
+                
+                if now < envelope["expires_at"] or self.stale_ttl > 0:
+                    # 旧值仍可用：立即返回，后台刷新（同一个键只刷新一次）
+                    logger.debug(f"Cache stale hit, refreshing: {cache_key}")
+                    self._start_load(cache_key, func, args, kwargs)
+                    return envelope["value"]
             
-            # 执行原函数
+            # 未命中：同一个键的并发调用共享一次加载
+            task = self._start_load(cache_key, func, args, kwargs)
+            return await asyncio.shield(task)
+        
+        return wrapper
+    
+    def _start_load(
+        self,
+        cache_key: str,
+        func: Callable,
+        args: tuple,
+        kwargs: dict
+    ) -> asyncio.Task:
+        """获取或创建键对应的加载任务."""
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.create_task(self._load(cache_key, func, args, kwargs))
+            self._inflight[cache_key] = task
+            task.add_done_callback(
+                lambda t, key=cache_key: self._on_load_done(key, t)
+            )
+        return task
+    
+    def _on_load_done(self, cache_key: str, task: asyncio.Task) -> None:
+        """加载结束后移除任务并记录异常."""
+        if self._inflight.get(cache_key) is task:
+            del self._inflight[cache_key]
+        
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Cache load failed for {cache_key}: {task.exception()}")
+    
+    async def _load(
+        self,
+        cache_key: str,
+        func: Callable,
+        args: tuple,
+        kwargs: dict
+    ) -> Any:
+        """执行被装饰函数并回填缓存."""
+        lock_token: Optional[str] = ""
+        if self.distributed_lock:
+            lock_token = await self._acquire_lock(cache_key)
+            if lock_token is None:
+                # 其他worker正在加载，等待其回填结果
+                envelope = await self._wait_for_peer(cache_key)
+                if envelope is not None:
+                    return envelope["value"]
+        
+        try:
+            start = time.monotonic()
             result = await func(*args, **kwargs)
+            delta = time.monotonic() - start
             
             # 缓存结果
             if result is not None or self.cache_none:
-                await self.cache_service.set(cache_key, result, self.ttl)
+                await self._set_envelope(cache_key, result, delta)
             
             return result
+        finally:
+            if lock_token:
+                await self._release_lock(cache_key, lock_token)
+    
+    async def _get_envelope(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """读取带逻辑过期时间的缓存包装."""
+        envelope = await self.cache_service.get(cache_key)
+        if (
+            isinstance(envelope, dict)
+            and envelope.keys() == {"value", "expires_at", "delta"}
+        ):
+            return envelope
+        return None
+    
+    async def _set_envelope(self, cache_key: str, value: Any, delta: float) -> None:
+        """写入缓存包装，Redis TTL包含旧值可用窗口."""
+        envelope = {
+            "value": value,
+            "expires_at": time.time() + self.ttl,
+            "delta": delta
+        }
+        await self.cache_service.set(cache_key, envelope, self.ttl + self.stale_ttl)
+    
+    def _should_refresh_early(self, envelope: Dict[str, Any], now: float) -> bool:
+        """XFetch：按重算耗时和随机数决定是否提前刷新."""
+        if self.early_expiration_beta <= 0:
+            return False
         
-        return wrapper
+        # 1 - random() 落在 (0, 1]，避免 log(0)
+        gap = -envelope["delta"] * self.early_expiration_beta * math.log(1.0 - random.random())
+        return now + gap >= envelope["expires_at"]
+    
+    def _lock_key(self, cache_key: str) -> str:
+        return f"lock:{cache_key}"
+    
+    async def _acquire_lock(self, cache_key: str) -> Optional[str]:
+        """
+        尝试获取分布式锁.
+        
+        Returns:
+            锁令牌；锁被其他worker持有时返回None；Redis异常时返回空串（不加锁继续执行）
+        """
+        token = uuid.uuid4().hex
+        try:
+            acquired = await redis_client.set(
+                self._lock_key(cache_key),
+                token,
+                px=int(self.lock_timeout * 1000),
+                nx=True
+            )
+            return token if acquired else None
+        except Exception as e:
+            logger.error(f"Cache lock acquire error: {e}")
+            return ""
+    
+    async def _release_lock(self, cache_key: str, token: str) -> None:
+        """释放分布式锁（仅删除自己持有的锁）."""
+        try:
+            await redis_client.run_script(
+                _RELEASE_LOCK_SCRIPT, keys=[self._lock_key(cache_key)], args=[token]
+            )
+        except Exception as e:
+            logger.error(f"Cache lock release error: {e}")
+    
+    async def _wait_for_peer(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """等待持锁worker回填新值，超时或锁释放后仍无新值则返回None."""
+        deadline = time.monotonic() + self.lock_timeout
+        
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.lock_poll_interval)
+            
+            envelope = await self._get_envelope(cache_key)
+            if envelope is not None and envelope["expires_at"] > time.time():
+                return envelope
+            
+            if not await self.cache_service.exists(self._lock_key(cache_key)):
+                break
+        
+        return None
 
 
 # 使用示例
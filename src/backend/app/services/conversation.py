@@ -1,23 +1,53 @@
 """对话管理服务."""
 
+import base64
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 
+from app.config import settings
 from app.core.database import get_mongodb
 from app.core.logging import get_logger
+from app.services.conversation_stats import ConversationStatsBuffer
 from app.models.conversation import (
     Conversation,
     ConversationStats,
     ConversationStatus,
     Message,
+    MessageBucket,
     MessageRole,
     MessageType,
 )
 from app.utils.redis_client import redis_client
+from app.utils.serialization import dumps, loads
 
 logger = get_logger(__name__)
 
+# 需要迁移的旧文档：仍内嵌消息，或使用字符串 _id（旧版本按 str(ObjectId()) 写入）
+LEGACY_CONVERSATION_QUERY: Dict[str, Any] = {
+    "$or": [{"messages": {"$exists": True}}, {"_id": {"$type": "string"}}]
+}
+
+# 合并消息到尾部缓存（有序集合，分数为序号）：已有的序号不重复写入，
+# 只保留序号最大的 tail_size 条，并刷新过期时间。缓存填充和追加消息共用，
+# 两者任意交错都不会丢失或重复消息。
+# KEYS[1]=尾部缓存; ARGV[1]=tail_size ARGV[2]=ttl ARGV[3..]=序号, 消息JSON 成对
+_MERGE_TAIL_SCRIPT = """
+local key = KEYS[1]
+for i = 3, #ARGV, 2 do
+    local seq = ARGV[i]
+    if #redis.call("ZRANGEBYSCORE", key, seq, seq, "LIMIT", 0, 1) == 0 then
+        redis.call("ZADD", key, seq, ARGV[i + 1])
+    end
+end
+redis.call("ZREMRANGEBYRANK", key, 0, -tonumber(ARGV[1]) - 1)
+redis.call("EXPIRE", key, ARGV[2])
+return 1
+"""
+
 
 class ConversationService:
     """对话服务类."""
@@ -25,7 +55,53 @@ class ConversationService:
     def __init__(self):
         """初始化对话服务."""
         self.collection_name = "conversations"
+        self.messages_collection_name = "conversation_messages"
         self.stats_collection_name = "conversation_stats"
+        self.bucket_size = settings.CONVERSATION_MESSAGE_BUCKET_SIZE
+        self.tail_size = settings.CONVERSATION_TAIL_MESSAGES
+        self.stats_buffer = ConversationStatsBuffer(self.stats_collection_name)
+        
+        # 各集合需要的索引，启动时由 ensure_indexes 幂等创建
+        self.indexes: Dict[str, List[IndexModel]] = {
+            self.collection_name: [
+                # 对话列表：按更新时间倒序的键集分页（带/不带状态过滤）
+                IndexModel(
+                    [("user_id", ASCENDING), ("status", ASCENDING),
+                     ("updated_at", DESCENDING), ("_id", DESCENDING)],
+                    name="user_status_updated"
+                ),
+                IndexModel(
+                    [("user_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)],
+                    name="user_updated"
+                ),
+            ],
+            self.messages_collection_name: [
+                IndexModel(
+                    [("conversation_id", ASCENDING), ("seq", ASCENDING)],
+                    name="conversation_seq",
+                    unique=True
+                ),
+            ],
+        }
+    
+    async def ensure_indexes(self) -> None:
+        """创建声明的索引（已存在时不做任何事）."""
+        db = await get_mongodb()
+        for collection_name, indexes in self.indexes.items():
+            await db[collection_name].create_indexes(indexes)
+            logger.info(f"Indexes ensured: {collection_name}")
+    
+    @staticmethod
+    def _id_query(conversation_id: str) -> Dict[str, Any]:
+        """按ID查询对话（同时匹配尚未迁移的字符串 _id）."""
+        return {"_id": {"$in": [ObjectId(conversation_id), conversation_id]}}
+    
+    @staticmethod
+    def _to_conversation(doc: Dict[str, Any]) -> Conversation:
+        """将MongoDB文档转换为对话模型."""
+        doc = dict(doc)
+        doc["_id"] = str(doc["_id"])
+        return Conversation(**doc)
     
     async def create_conversation(
         self,
@@ -44,15 +120,16 @@ class ConversationService:
                 title=title or f"对话 {datetime.utcnow().strftime('%Y-%m-%d %H:%M')}"
             )
             
-            # 插入到MongoDB
-            result = await collection.insert_one(conversation.dict(by_alias=True))
-            conversation.id = str(result.inserted_id)
+            # 插入到MongoDB（对话文档只保存计数，消息写入分桶集合）
+            doc = conversation.dict(by_alias=True, exclude={"messages"})
+            doc["_id"] = ObjectId(conversation.id)
+            await collection.insert_one(doc)
             
             # 更新用户统计
-            await self._update_user_stats(user_id, "conversation_created")
+            self._record_user_stats(user_id, "conversation_created")
             
-            # 缓存到Redis
-            await self._cache_conversation(conversation)
+            # 缓存元数据
+            await self._cache_meta(conversation)
             
             logger.info(f"Conversation created: {conversation.id}")
             return conversation
@@ -61,71 +138,131 @@ class ConversationService:
             logger.error(f"Failed to create conversation: {e}")
             raise
     
-    async def get_conversation(
+    async def get_conversation_meta(
         self,
         conversation_id: str,
-        user_id: Optional[int] = None
+        user_id: Optional[int] = None,
+        use_cache: bool = True
     ) -> Optional[Conversation]:
-        """获取对话."""
+        """
+        获取对话元数据（不含消息），用于归属校验.
+        
+        元数据单独缓存，追加消息不会使其失效，因此缓存中的计数和更新时间
+        可能落后最多 CONVERSATION_META_CACHE_TTL 秒；需要准确计数时传入
+        ``use_cache=False`` 从数据库读取并刷新缓存。
+        """
         try:
-            # 先从缓存获取
-            cached = await self._get_cached_conversation(conversation_id)
+            cached = await self._get_cached_meta(conversation_id) if use_cache else None
             if cached:
+                # 对话归属不会改变，缓存命中时直接校验
+                if user_id and cached.user_id != user_id:
+                    return None
                 return cached
             
-            # 从数据库获取
             db = await get_mongodb()
             collection = db[self.collection_name]
             
-            query = {"_id": ObjectId(conversation_id)}
+            query = self._id_query(conversation_id)
             if user_id:
                 query["user_id"] = user_id
             
-            doc = await collection.find_one(query)
+            doc = await collection.find_one(query, {"messages": 0})
             if doc:
-                conversation = Conversation(**doc)
-                # 缓存结果
-                await self._cache_conversation(conversation)
+                conversation = self._to_conversation(doc)
+                await self._cache_meta(conversation)
                 return conversation
             
             return None
             
         except Exception as e:
-            logger.error(f"Failed to get conversation: {e}")
+            logger.error(f"Failed to get conversation meta: {e}")
             return None
     
+    async def get_conversation(
+        self,
+        conversation_id: str,
+        user_id: Optional[int] = None
+    ) -> Optional[Conversation]:
+        """获取对话（最新的元数据和最近 tail_size 条消息）."""
+        conversation = await self.get_conversation_meta(conversation_id, user_id, use_cache=False)
+        if conversation:
+            conversation.messages = await self.get_recent_messages(conversation_id)
+        return conversation
+    
+    async def get_recent_messages(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None
+    ) -> List[Message]:
+        """
+        获取最近的消息（优先读取尾部缓存）.
+        
+        缓存保存最近 tail_size 条消息，超过该数量的请求直接读取数据库。
+        """
+        limit = limit or self.tail_size
+        if limit > self.tail_size:
+            return await self.get_messages(conversation_id, limit=limit)
+        
+        cached = await self._get_cached_tail(conversation_id)
+        if cached is None:
+            cached = await self.get_messages(conversation_id, limit=self.tail_size)
+            await self._cache_tail(conversation_id, cached)
+        
+        return cached[-limit:]
+    
     async def add_message(
         self,
         conversation_id: str,
         message: Message,
         user_id: Optional[int] = None
     ) -> bool:
-        """添加消息到对话."""
+        """
+        添加消息到对话.
+        
+        先在对话文档上原子递增 message_count 分配序号，再把消息追加到对应的桶。
+        仍内嵌消息的旧文档在第一次写入时迁移到分桶集合。
+        
+        写入桶失败时撤销计数；序号之后已分配给其他消息时无法收回，
+        记录到文档的 ``missing_seqs``（message_count 仍是下一个序号）。
+        """
         try:
             db = await get_mongodb()
             collection = db[self.collection_name]
             
             # 构建更新查询
-            query = {"_id": ObjectId(conversation_id)}
+            query = self._id_query(conversation_id)
             if user_id:
                 query["user_id"] = user_id
             
-            # 更新对话
-            update = {
-                "$push": {"messages": message.dict()},
-                "$inc": {"total_tokens": message.tokens_used or 0},
-                "$set": {"updated_at": datetime.utcnow()}
-            }
+            # 分配序号并更新计数
+            allocate = dict(
+                filter={**query, "messages": {"$exists": False}},
+                update={
+                    "$inc": {"message_count": 1, "total_tokens": message.tokens_used or 0},
+                    "$set": {"updated_at": datetime.utcnow()}
+                },
+                projection={"message_count": 1},
+                return_document=ReturnDocument.AFTER
+            )
             
-            result = await collection.update_one(query, update)
+            doc = await collection.find_one_and_update(**allocate)
+            if doc is None and await self.migrate_conversation_messages(query):
+                # 旧文档已迁移，重新分配序号
+                doc = await collection.find_one_and_update(**allocate)
             
-            if result.modified_count > 0:
-                # 清除缓存
-                await self._invalidate_cache(conversation_id)
+            if doc:
+                try:
+                    await self._append_to_bucket(conversation_id, doc["message_count"] - 1, message)
+                except Exception:
+                    await self._release_seq(conversation_id, doc["message_count"], message)
+                    raise
+                
+                # 追加到尾部缓存（元数据缓存不失效）
+                await self._append_cached_tail(conversation_id, message)
                 
                 # 更新统计
                 if user_id:
-                    await self._update_user_stats(
+                    self._record_user_stats(
                         user_id,
                         "message_added",
                         tokens=message.tokens_used or 0
@@ -139,29 +276,264 @@ class ConversationService:
             logger.error(f"Failed to add message: {e}")
             return False
     
+    async def _release_seq(self, conversation_id: str, message_count: int, message: Message) -> None:
+        """撤销写入失败的消息的计数（仍是最后分配的序号时收回，否则记录缺口）."""
+        db = await get_mongodb()
+        collection = db[self.collection_name]
+        tokens = message.tokens_used or 0
+        
+        try:
+            result = await collection.update_one(
+                {**self._id_query(conversation_id), "message_count": message_count},
+                {"$inc": {"message_count": -1, "total_tokens": -tokens}}
+            )
+            if result.modified_count == 0:
+                await collection.update_one(
+                    self._id_query(conversation_id),
+                    {
+                        "$inc": {"total_tokens": -tokens},
+                        "$addToSet": {"missing_seqs": message_count - 1}
+                    }
+                )
+        except Exception as e:
+            logger.error(f"Failed to release message seq {message_count - 1}: {e}")
+    
+    async def _append_to_bucket(self, conversation_id: str, seq: int, message: Message) -> None:
+        """把消息追加到序号所在的桶（桶不存在时创建）."""
+        db = await get_mongodb()
+        collection = db[self.messages_collection_name]
+        
+        message.seq = seq
+        bucket_query = {"conversation_id": conversation_id, "seq": seq - seq % self.bucket_size}
+        update = {
+            "$push": {"messages": message.dict()},
+            "$inc": {"count": 1},
+            "$setOnInsert": {"created_at": datetime.utcnow()}
+        }
+        
+        try:
+            await collection.update_one(bucket_query, update, upsert=True)
+        except DuplicateKeyError:
+            # 并发创建同一个桶，另一方已插入，直接追加
+            await collection.update_one(bucket_query, update)
+    
+    async def get_messages(
+        self,
+        conversation_id: str,
+        before_seq: Optional[int] = None,
+        limit: int = 50
+    ) -> List[Message]:
+        """
+        从尾部分页读取消息.
+        
+        Args:
+            conversation_id: 对话ID
+            before_seq: 只返回序号小于该值的消息，默认从最新一条开始
+            limit: 最多返回的消息数
+            
+        Returns:
+            按序号升序排列的消息
+        """
+        try:
+            db = await get_mongodb()
+            collection = db[self.messages_collection_name]
+            
+            if limit <= 0:
+                return []
+            
+            query: Dict[str, Any] = {"conversation_id": conversation_id}
+            projection: Dict[str, Any] = {"messages": 1}
+            if before_seq is not None:
+                query["seq"] = {"$lt": before_seq}
+            else:
+                # 读取尾部时每个桶只需要返回最后 limit 条
+                projection = {"messages": {"$slice": -limit}}
+            
+            # 最多需要 limit/bucket_size 个完整桶加上首尾两个不完整的桶
+            cursor = collection.find(query, projection).sort("seq", -1).limit(
+                limit // self.bucket_size + 2
+            )
+            
+            messages = []
+            async for bucket in cursor:
+                messages.extend(
+                    m for m in bucket["messages"]
+                    if before_seq is None or m["seq"] < before_seq
+                )
+                if len(messages) >= limit:
+                    break
+            
+            if not messages and before_seq is None:
+                # 尚未迁移的旧文档：直接截取内嵌消息的尾部
+                doc = await db[self.collection_name].find_one(
+                    {**self._id_query(conversation_id), "messages": {"$exists": True}},
+                    {"messages": {"$slice": -limit}}
+                )
+                return [Message(**m) for m in doc["messages"]] if doc else []
+            
+            messages.sort(key=lambda m: m["seq"])
+            return [Message(**m) for m in messages[-limit:]]
+            
+        except Exception as e:
+            logger.error(f"Failed to get messages: {e}")
+            return []
+    
+    async def migrate_conversation_messages(self, query: Dict[str, Any]) -> bool:
+        """
+        迁移旧的对话文档.
+        
+        内嵌的消息写入分桶集合，字符串 _id 的文档以 ObjectId 重新插入后删除原文档。
+        桶按 (conversation_id, seq) 覆盖写入，可重复执行；只有文档在迁移期间未被修改
+        （消息数组长度和 message_count 不变）时才完成迁移，否则撤销并返回 False，
+        下次写入或再次执行迁移脚本时重试。
+        
+        Returns:
+            是否迁移了文档
+        """
+        db = await get_mongodb()
+        collection = db[self.collection_name]
+        
+        doc = await collection.find_one({"$and": [query, LEGACY_CONVERSATION_QUERY]})
+        if not doc:
+            return False
+        
+        conversation_id = str(doc["_id"])
+        
+        # 迁移期间文档未被修改的条件
+        unchanged: Dict[str, Any] = {"_id": doc["_id"]}
+        if "messages" in doc:
+            messages = doc.pop("messages") or []
+            unchanged["messages"] = {"$size": len(messages)}
+            doc["message_count"] = len(messages)
+            await self._write_buckets(conversation_id, messages)
+        elif "message_count" in doc:
+            unchanged["message_count"] = doc["message_count"]
+        else:
+            unchanged["message_count"] = {"$exists": False}
+        
+        if isinstance(doc["_id"], ObjectId):
+            result = await collection.update_one(
+                unchanged,
+                {"$set": {"message_count": doc["message_count"]}, "$unset": {"messages": ""}}
+            )
+            migrated = bool(result.modified_count)
+        else:
+            # _id 不可修改：插入 ObjectId 副本，再删除未被修改的原文档
+            doc["_id"] = ObjectId(conversation_id)
+            try:
+                await collection.insert_one(doc)
+            except DuplicateKeyError:
+                # 上次迁移在插入后中断，副本已存在
+                await collection.replace_one({"_id": doc["_id"]}, doc)
+            
+            result = await collection.delete_one(unchanged)
+            migrated = bool(result.deleted_count)
+            if not migrated:
+                # 原文档在迁移期间被修改，撤销副本
+                await collection.delete_one({"_id": doc["_id"]})
+        
+        if migrated:
+            await self._invalidate_cache(conversation_id)
+        return migrated
+    
+    async def _write_buckets(self, conversation_id: str, messages: List[Dict[str, Any]]) -> None:
+        """把内嵌消息按序号写入分桶集合（覆盖写入）."""
+        buckets: Dict[int, MessageBucket] = {}
+        for seq, raw in enumerate(messages):
+            message = Message(**{**raw, "seq": seq})
+            start = seq - seq % self.bucket_size
+            bucket = buckets.setdefault(
+                start, MessageBucket(conversation_id=conversation_id, seq=start)
+            )
+            bucket.messages.append(message)
+            bucket.count += 1
+        
+        if buckets:
+            db = await get_mongodb()
+            await db[self.messages_collection_name].bulk_write(
+                [
+                    UpdateOne(
+                        {"conversation_id": conversation_id, "seq": start},
+                        {"$set": bucket.dict()},
+                        upsert=True
+                    )
+                    for start, bucket in buckets.items()
+                ],
+                ordered=False
+            )
+    
+    @staticmethod
+    def encode_cursor(conversation: Conversation) -> str:
+        """生成分页游标（指向该对话之后的位置）."""
+        raw = dumps([conversation.updated_at.isoformat(), conversation.id])
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+        """解析分页游标，格式错误时抛出 ValueError."""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            updated_at, conversation_id = loads(raw)
+            return datetime.fromisoformat(updated_at), ObjectId(conversation_id)
+        except (ValueError, TypeError, InvalidId) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+    
+    def _list_query(
+        self,
+        user_id: int,
+        status: Optional[ConversationStatus] = None,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """构建对话列表查询（游标之后的对话）."""
+        query: Dict[str, Any] = {"user_id": user_id}
+        if status:
+            query["status"] = status.value
+        
+        if cursor:
+            updated_at, last_id = self.decode_cursor(cursor)
+            # 顶层的 $lte 让索引扫描直接从游标位置开始，$or 只排除同一时间戳中已返回的对话
+            query["updated_at"] = {"$lte": updated_at}
+            query["$or"] = [
+                {"updated_at": {"$lt": updated_at}},
+                {"_id": {"$lt": last_id}}
+            ]
+        return query
+    
     async def list_conversations(
         self,
         user_id: int,
-        skip: int = 0,
         limit: int = 20,
-        status: Optional[ConversationStatus] = None
+        status: Optional[ConversationStatus] = None,
+        cursor: Optional[str] = None
     ) -> List[Conversation]:
-        """列出用户的对话."""
+        """
+        按更新时间倒序列出用户的对话（键集分页）.
+        
+        Args:
+            user_id: 用户ID
+            limit: 最多返回的对话数
+            status: 对话状态过滤
+            cursor: 上一页最后一个对话的游标（encode_cursor），为空时从第一页开始
+            
+        Returns:
+            对话列表（不含消息）
+            
+        Raises:
+            ValueError: 游标格式错误
+        """
+        query = self._list_query(user_id, status, cursor)
+        
         try:
             db = await get_mongodb()
             collection = db[self.collection_name]
             
-            query = {"user_id": user_id}
-            if status:
-                query["status"] = status.value
-            
-            cursor = collection.find(query).sort(
-                "updated_at", -1
-            ).skip(skip).limit(limit)
+            docs = collection.find(query, {"messages": 0}).sort(
+                [("updated_at", DESCENDING), ("_id", DESCENDING)]
+            ).limit(limit)
             
             conversations = []
-            async for doc in cursor:
-                conversations.append(Conversation(**doc))
+            async for doc in docs:
+                conversations.append(self._to_conversation(doc))
             
             return conversations
             
@@ -180,7 +552,7 @@ class ConversationService:
             db = await get_mongodb()
             collection = db[self.collection_name]
             
-            query = {"_id": ObjectId(conversation_id)}
+            query = self._id_query(conversation_id)
             if user_id:
                 query["user_id"] = user_id
             
@@ -194,7 +566,7 @@ class ConversationService:
             result = await collection.update_one(query, update)
             
             if result.modified_count > 0:
-                await self._invalidate_cache(conversation_id)
+                await self._invalidate_cache(conversation_id, tail=False)
                 return True
             
             return False
@@ -213,17 +585,20 @@ class ConversationService:
             db = await get_mongodb()
             collection = db[self.collection_name]
             
-            query = {"_id": ObjectId(conversation_id)}
+            query = self._id_query(conversation_id)
             if user_id:
                 query["user_id"] = user_id
             
             result = await collection.delete_one(query)
             
             if result.deleted_count > 0:
+                await db[self.messages_collection_name].delete_many(
+                    {"conversation_id": conversation_id}
+                )
                 await self._invalidate_cache(conversation_id)
                 
                 if user_id:
-                    await self._update_user_stats(user_id, "conversation_deleted")
+                    self._record_user_stats(user_id, "conversation_deleted")
                 
                 return True
             
@@ -234,177 +609,305 @@ class ConversationService:
             return False
     
     async def get_user_stats(self, user_id: int) -> ConversationStats:
-        """获取用户对话统计."""
+        """获取用户对话统计（包含本进程尚未写入的增量）."""
         try:
             db = await get_mongodb()
-            
-            # 获取或创建统计文档
             stats_collection = db[self.stats_collection_name]
             stats_doc = await stats_collection.find_one({"user_id": user_id})
             
-            if stats_doc:
-                return ConversationStats(**stats_doc)
-            
-            # 如果没有统计，计算统计
-            stats = await self._calculate_user_stats(user_id)
-            
-            # 保存统计
-            await stats_collection.insert_one(stats.dict())
+            if not stats_doc:
+                # 首次访问：从对话和消息重建
+                return await self.reconcile_user_stats(user_id)
             
+            stats = ConversationStats(**stats_doc)
+            self._apply_pending_stats(stats, self.stats_buffer.pending(user_id))
+            self._fill_averages(stats)
             return stats
             
         except Exception as e:
             logger.error(f"Failed to get user stats: {e}")
             return ConversationStats(user_id=user_id)
     
-    async def _calculate_user_stats(self, user_id: int) -> ConversationStats:
-        """计算用户统计."""
-        try:
-            db = await get_mongodb()
-            collection = db[self.collection_name]
-            
-            # 聚合统计
-            pipeline = [
-                {"$match": {"user_id": user_id}},
-                {
-                    "$group": {
-                        "_id": None,
-                        "total_conversations": {"$sum": 1},
-                        "active_conversations": {
-                            "$sum": {
-                                "$cond": [
-                                    {"$eq": ["$status", ConversationStatus.ACTIVE.value]},
-                                    1,
-                                    0
-                                ]
-                            }
+    @staticmethod
+    def _apply_pending_stats(stats: ConversationStats, pending: Dict[str, int]) -> None:
+        """把缓冲中的增量叠加到统计上."""
+        for field, value in pending.items():
+            if field.startswith("daily_usage."):
+                day = field.split(".", 1)[1]
+                stats.daily_usage[day] = stats.daily_usage.get(day, 0) + value
+            elif field.startswith("hourly_distribution."):
+                hour = int(field.split(".", 1)[1])
+                stats.hourly_distribution[hour] = stats.hourly_distribution.get(hour, 0) + value
+            else:
+                setattr(stats, field, getattr(stats, field) + value)
+    
+    @staticmethod
+    def _fill_averages(stats: ConversationStats) -> None:
+        """计算平均值."""
+        if stats.total_conversations > 0:
+            stats.avg_tokens_per_conversation = (
+                stats.total_tokens_used / stats.total_conversations
+            )
+            stats.avg_messages_per_conversation = (
+                stats.total_messages / stats.total_conversations
+            )
+    
+    async def reconcile_user_stats(self, user_id: int) -> ConversationStats:
+        """
+        从对话和消息桶重建用户统计并覆盖统计文档.
+        
+        用于首次访问和修复写回缓冲丢失（进程崩溃、写入结果不确定时丢弃）的增量。
+        
+        重建前先写入本进程缓冲的增量。重建读取期间本进程新增的增量对应的数据已写入
+        对话和消息桶，会被重建结果计入，因此重建后丢弃，避免覆盖后再次累加；与读取
+        并发、未被读到的写入会因此少计。其他进程中尚未写入的增量会在覆盖后再次计入。
+        两种误差都不超过一个写入周期的增量，在低峰期执行或再次执行可消除。
+        """
+        await self.stats_buffer.flush()
+        
+        stats = await self._calculate_user_stats(user_id)
+        stats.daily_usage, stats.hourly_distribution = await self._calculate_usage_distribution(
+            user_id
+        )
+        self.stats_buffer.discard(user_id)
+        
+        db = await get_mongodb()
+        doc = stats.dict()
+        # MongoDB文档的键必须是字符串
+        doc["hourly_distribution"] = {str(h): c for h, c in stats.hourly_distribution.items()}
+        await db[self.stats_collection_name].replace_one({"user_id": user_id}, doc, upsert=True)
+        
+        return stats
+    
+    async def reconcile_all_stats(self) -> int:
+        """重建所有用户的统计，返回处理的用户数."""
+        db = await get_mongodb()
+        user_ids = set(await db[self.collection_name].distinct("user_id"))
+        user_ids.update(await db[self.stats_collection_name].distinct("user_id"))
+        
+        for user_id in sorted(user_ids):
+            await self.reconcile_user_stats(user_id)
+        
+        return len(user_ids)
+    
+    async def _calculate_usage_distribution(
+        self,
+        user_id: int
+    ) -> Tuple[Dict[str, int], Dict[int, int]]:
+        """按消息时间统计每日Token用量和每小时消息数."""
+        db = await get_mongodb()
+        conversation_ids = [
+            str(doc["_id"])
+            async for doc in db[self.collection_name].find({"user_id": user_id}, {"_id": 1})
+        ]
+        
+        daily_usage: Dict[str, int] = {}
+        hourly_distribution: Dict[int, int] = {}
+        if not conversation_ids:
+            return daily_usage, hourly_distribution
+        
+        pipeline = [
+            {"$match": {"conversation_id": {"$in": conversation_ids}}},
+            {"$unwind": "$messages"},
+            {
+                "$group": {
+                    "_id": {
+                        "day": {
+                            "$dateToString": {"format": "%Y-%m-%d", "date": "$messages.timestamp"}
                         },
-                        "total_messages": {"$sum": {"$size": "$messages"}},
-                        "total_tokens": {"$sum": "$total_tokens"},
-                        "last_conversation_at": {"$max": "$updated_at"}
-                    }
+                        "hour": {"$hour": "$messages.timestamp"}
+                    },
+                    "tokens": {"$sum": {"$ifNull": ["$messages.tokens_used", 0]}},
+                    "count": {"$sum": 1}
                 }
-            ]
-            
-            cursor = collection.aggregate(pipeline)
-            result = await cursor.to_list(1)
-            
-            if result:
-                data = result[0]
-                stats = ConversationStats(
-                    user_id=user_id,
-                    total_conversations=data.get("total_conversations", 0),
-                    active_conversations=data.get("active_conversations", 0),
-                    total_messages=data.get("total_messages", 0),
-                    total_tokens_used=data.get("total_tokens", 0),
-                    last_conversation_at=data.get("last_conversation_at")
-                )
-                
-                # 计算平均值
-                if stats.total_conversations > 0:
-                    stats.avg_tokens_per_conversation = (
-                        stats.total_tokens_used / stats.total_conversations
-                    )
-                    stats.avg_messages_per_conversation = (
-                        stats.total_messages / stats.total_conversations
-                    )
-                
-                return stats
-            
-            return ConversationStats(user_id=user_id)
-            
-        except Exception as e:
-            logger.error(f"Failed to calculate user stats: {e}")
-            return ConversationStats(user_id=user_id)
+            }
+        ]
+        
+        async for row in db[self.messages_collection_name].aggregate(pipeline):
+            day, hour = row["_id"]["day"], row["_id"]["hour"]
+            daily_usage[day] = daily_usage.get(day, 0) + row["tokens"]
+            hourly_distribution[hour] = hourly_distribution.get(hour, 0) + row["count"]
+        
+        return daily_usage, hourly_distribution
     
-    async def _update_user_stats(
+    async def _calculate_user_stats(self, user_id: int) -> ConversationStats:
+        """聚合计算用户统计（数据库错误向上抛出，避免用空统计覆盖）."""
+        db = await get_mongodb()
+        collection = db[self.collection_name]
+        
+        # 聚合统计
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {
+                "$group": {
+                    "_id": None,
+                    "total_conversations": {"$sum": 1},
+                    "active_conversations": {
+                        "$sum": {
+                            "$cond": [
+                                {"$eq": ["$status", ConversationStatus.ACTIVE.value]},
+                                1,
+                                0
+                            ]
+                        }
+                    },
+                    "total_messages": {
+                        "$sum": {
+                            "$ifNull": [
+                                "$message_count",
+                                {"$size": {"$ifNull": ["$messages", []]}}
+                            ]
+                        }
+                    },
+                    "total_tokens": {"$sum": "$total_tokens"},
+                    "last_conversation_at": {"$max": "$updated_at"}
+                }
+            }
+        ]
+        
+        cursor = collection.aggregate(pipeline)
+        result = await cursor.to_list(1)
+        
+        if result:
+            data = result[0]
+            stats = ConversationStats(
+                user_id=user_id,
+                total_conversations=data.get("total_conversations", 0),
+                active_conversations=data.get("active_conversations", 0),
+                total_messages=data.get("total_messages", 0),
+                total_tokens_used=data.get("total_tokens", 0),
+                last_conversation_at=data.get("last_conversation_at")
+            )
+            self._fill_averages(stats)
+            return stats
+        
+        return ConversationStats(user_id=user_id)
+    
+    def _record_user_stats(
         self,
         user_id: int,
         action: str,
         tokens: int = 0
     ) -> None:
-        """更新用户统计."""
-        try:
-            db = await get_mongodb()
-            stats_collection = db[self.stats_collection_name]
-            
-            update = {}
-            
-            if action == "conversation_created":
-                update = {
-                    "$inc": {
-                        "total_conversations": 1,
-                        "active_conversations": 1
-                    },
-                    "$set": {"last_conversation_at": datetime.utcnow()}
-                }
-            elif action == "conversation_deleted":
-                update = {
-                    "$inc": {
-                        "total_conversations": -1,
-                        "active_conversations": -1
-                    }
-                }
-            elif action == "message_added":
-                update = {
-                    "$inc": {
-                        "total_messages": 1,
-                        "total_tokens_used": tokens
-                    }
-                }
-                
-                # 更新每日使用量
-                today = datetime.utcnow().strftime("%Y-%m-%d")
-                update["$inc"][f"daily_usage.{today}"] = tokens
-                
-                # 更新小时分布
-                hour = datetime.utcnow().hour
-                update["$inc"][f"hourly_distribution.{hour}"] = 1
-            
-            if update:
-                await stats_collection.update_one(
-                    {"user_id": user_id},
-                    update,
-                    upsert=True
-                )
-            
-        except Exception as e:
-            logger.error(f"Failed to update user stats: {e}")
+        """记录用户统计增量（写入缓冲，由后台任务批量写入MongoDB）."""
+        now = datetime.utcnow()
+        
+        if action == "conversation_created":
+            self.stats_buffer.add(
+                user_id,
+                {"total_conversations": 1, "active_conversations": 1},
+                last_conversation_at=now
+            )
+        elif action == "conversation_deleted":
+            self.stats_buffer.add(
+                user_id,
+                {"total_conversations": -1, "active_conversations": -1}
+            )
+        elif action == "message_added":
+            self.stats_buffer.add(user_id, {
+                "total_messages": 1,
+                "total_tokens_used": tokens,
+                # 每日使用量和小时分布
+                f"daily_usage.{now.strftime('%Y-%m-%d')}": tokens,
+                f"hourly_distribution.{now.hour}": 1
+            })
     
-    async def _cache_conversation(self, conversation: Conversation) -> None:
-        """缓存对话到Redis."""
+    @staticmethod
+    def _meta_key(conversation_id: str) -> str:
+        """元数据缓存键."""
+        return f"conversation:meta:{conversation_id}"
+    
+    @staticmethod
+    def _tail_key(conversation_id: str) -> str:
+        """尾部消息缓存键."""
+        return f"conversation:tail:{conversation_id}"
+    
+    async def _cache_meta(self, conversation: Conversation) -> None:
+        """缓存对话元数据（不含消息）."""
         try:
-            key = f"conversation:{conversation.id}"
-            value = conversation.json()
-            await redis_client.setex(key, 3600, value)  # 1小时缓存
+            value = conversation.json(exclude={"messages"})
+            await redis_client.setex(
+                self._meta_key(conversation.id),
+                settings.CONVERSATION_META_CACHE_TTL,
+                value
+            )
         except Exception as e:
-            logger.error(f"Failed to cache conversation: {e}")
+            logger.error(f"Failed to cache conversation meta: {e}")
     
-    async def _get_cached_conversation(
-        self,
-        conversation_id: str
-    ) -> Optional[Conversation]:
-        """从缓存获取对话."""
+    async def _get_cached_meta(self, conversation_id: str) -> Optional[Conversation]:
+        """从缓存获取对话元数据."""
         try:
-            key = f"conversation:{conversation_id}"
-            value = await redis_client.get(key)
+            value = await redis_client.get(self._meta_key(conversation_id))
             
             if value:
                 return Conversation.parse_raw(value)
             
             return None
         except Exception as e:
-            logger.error(f"Failed to get cached conversation: {e}")
+            logger.error(f"Failed to get cached conversation meta: {e}")
             return None
     
-    async def _invalidate_cache(self, conversation_id: str) -> None:
-        """清除缓存."""
+    async def _cache_tail(self, conversation_id: str, messages: List[Message]) -> None:
+        """把从数据库读取的最近消息合并到尾部缓存."""
+        # 未迁移的旧文档中消息没有序号，不缓存
+        if not messages or any(message.seq is None for message in messages):
+            return
+        
         try:
-            key = f"conversation:{conversation_id}"
-            await redis_client.delete(key)
+            await self._merge_tail(conversation_id, messages)
+        except Exception as e:
+            logger.error(f"Failed to cache conversation tail: {e}")
+    
+    async def _get_cached_tail(self, conversation_id: str) -> Optional[List[Message]]:
+        """
+        从缓存获取最近的消息，未命中或不完整时返回 None.
+        
+        缓存完整是指序号连续，且包含从 0 开始或最近 tail_size 条消息；
+        追加在填充之前创建的缓存、或某次追加没有写入缓存时会出现缺口，按未命中处理，
+        由数据库读取的结果合并补齐。
+        """
+        try:
+            values = await redis_client.client.zrange(self._tail_key(conversation_id), 0, -1)
+            if not values:
+                return None
+            
+            messages = [Message.parse_raw(value) for value in values]
+            first, last = messages[0].seq, messages[-1].seq
+            if last - first + 1 != len(messages) or len(messages) != min(self.tail_size, last + 1):
+                return None
+            return messages
+        except Exception as e:
+            logger.error(f"Failed to get cached conversation tail: {e}")
+            return None
+    
+    async def _append_cached_tail(self, conversation_id: str, message: Message) -> None:
+        """合并新消息到尾部缓存."""
+        try:
+            await self._merge_tail(conversation_id, [message])
+        except Exception as e:
+            logger.error(f"Failed to append conversation tail: {e}")
+            await self._invalidate_cache(conversation_id)
+    
+    async def _merge_tail(self, conversation_id: str, messages: List[Message]) -> None:
+        """按序号合并消息到尾部缓存."""
+        args: List[Any] = [self.tail_size, settings.CONVERSATION_TAIL_CACHE_TTL]
+        for message in messages:
+            args.extend((message.seq, message.json()))
+        await redis_client.run_script(
+            _MERGE_TAIL_SCRIPT,
+            keys=[self._tail_key(conversation_id)],
+            args=args
+        )
+    
+    async def _invalidate_cache(self, conversation_id: str, tail: bool = True) -> None:
+        """清除元数据缓存（默认同时清除尾部缓存）."""
+        try:
+            keys = [self._meta_key(conversation_id)]
+            if tail:
+                keys.append(self._tail_key(conversation_id))
+            await redis_client.delete(*keys)
         except Exception as e:
             logger.error(f"Failed to invalidate cache: {e}")
 
-
 # 全局对话服务实例
 conversation_service = ConversationService()
\ No newline at end of file
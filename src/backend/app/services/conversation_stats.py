@@ -0,0 +1,219 @@
+"""对话统计写回缓冲."""
+
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
+
+from app.config import settings
+from app.core.database import get_mongodb
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+stats_pending_users = Gauge(
+    'conversation_stats_pending_users',
+    'Users with conversation stat deltas waiting to be flushed'
+)
+
+stats_flush_seconds = Histogram(
+    'conversation_stats_flush_seconds',
+    'Time spent writing buffered conversation stats to MongoDB',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+stats_flush_errors = Counter(
+    'conversation_stats_flush_errors_total',
+    'Failed flushes of buffered conversation stats'
+)
+
+stats_dropped_users = Counter(
+    'conversation_stats_dropped_users_total',
+    'User stat deltas dropped because a failed flush may already have applied them'
+)
+
+
+class _PendingStats:
+    """单个用户待写入的统计增量."""
+
+    __slots__ = ("inc", "last_conversation_at")
+
+    def __init__(self) -> None:
+        self.inc: Dict[str, int] = defaultdict(int)
+        self.last_conversation_at: Optional[datetime] = None
+
+    def add(self, inc: Dict[str, int], last_conversation_at: Optional[datetime] = None) -> None:
+        """累加增量."""
+        for field, value in inc.items():
+            self.inc[field] += value
+        if last_conversation_at and (
+            self.last_conversation_at is None
+            or last_conversation_at > self.last_conversation_at
+        ):
+            self.last_conversation_at = last_conversation_at
+
+
+class ConversationStatsBuffer:
+    """
+    对话统计的进程内写回缓冲.
+
+    热路径只在内存中累加增量，后台任务每 ``flush_interval`` 秒（或待写入用户数
+    达到 ``max_pending_users`` 时提前）用一次 bulk_write 写入MongoDB。
+
+    ``$inc`` 不是幂等的，因此只重试确定没有生效的增量：批量写入中报告失败的单条更新，
+    以及没有连接到服务器时的整批更新。网络超时等无法确定是否生效的失败会丢弃该批增量
+    并记录日志（重试可能重复累加，计数无限制地偏大）。丢弃的增量和进程崩溃丢失的增量
+    由 ``ConversationService.reconcile_user_stats`` 从对话和消息重建。
+    """
+
+    def __init__(
+        self,
+        collection_name: str = "conversation_stats",
+        flush_interval: Optional[float] = None,
+        max_pending_users: Optional[int] = None
+    ):
+        """
+        初始化统计缓冲.
+
+        Args:
+            collection_name: 统计集合名
+            flush_interval: 写入间隔（秒），默认读取配置
+            max_pending_users: 待写入用户数上限，达到后立即写入，默认读取配置
+        """
+        self.collection_name = collection_name
+        self.flush_interval = flush_interval or settings.CONVERSATION_STATS_FLUSH_INTERVAL
+        self.max_pending_users = max_pending_users or settings.CONVERSATION_STATS_MAX_PENDING_USERS
+
+        self._pending: Dict[int, _PendingStats] = {}
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def add(
+        self,
+        user_id: int,
+        inc: Dict[str, int],
+        last_conversation_at: Optional[datetime] = None
+    ) -> None:
+        """累加一个用户的统计增量（不访问数据库）."""
+        pending = self._pending.get(user_id)
+        if pending is None:
+            pending = self._pending[user_id] = _PendingStats()
+            stats_pending_users.set(len(self._pending))
+            if len(self._pending) >= self.max_pending_users:
+                self._flush_requested.set()
+
+        pending.add(inc, last_conversation_at)
+
+    def pending(self, user_id: int) -> Dict[str, int]:
+        """当前进程中该用户尚未写入的增量."""
+        pending = self._pending.get(user_id)
+        return dict(pending.inc) if pending else {}
+
+    def discard(self, user_id: int) -> None:
+        """丢弃该用户尚未写入的增量."""
+        if self._pending.pop(user_id, None) is not None:
+            stats_pending_users.set(len(self._pending))
+
+    def _requeue(self, batch: Dict[int, _PendingStats]) -> None:
+        """把未写入的增量放回缓冲区，与期间新增的增量合并."""
+        for user_id, pending in batch.items():
+            self._pending.setdefault(user_id, _PendingStats()).add(
+                pending.inc, pending.last_conversation_at
+            )
+        stats_pending_users.set(len(self._pending))
+
+    async def flush(self) -> int:
+        """将缓冲的增量批量写入MongoDB，返回写入的用户数."""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+
+            batch, self._pending = self._pending, {}
+            stats_pending_users.set(0)
+
+            users = []
+            operations = []
+            for user_id, pending in batch.items():
+                update: Dict[str, Any] = {}
+                inc = {field: value for field, value in pending.inc.items() if value}
+                if inc:
+                    update["$inc"] = inc
+                if pending.last_conversation_at:
+                    update["$max"] = {"last_conversation_at": pending.last_conversation_at}
+                if update:
+                    users.append(user_id)
+                    operations.append(UpdateOne({"user_id": user_id}, update, upsert=True))
+
+            if not operations:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                db = await get_mongodb()
+                await db[self.collection_name].bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # 无序批量写入：只有报告错误的单条更新没有生效
+                failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                stats_flush_errors.inc()
+                logger.error(f"Failed to flush conversation stats for {len(failed)} users: {e}")
+                self._requeue({users[i]: batch[users[i]] for i in failed})
+                return len(operations) - len(failed)
+            except ServerSelectionTimeoutError as e:
+                # 没有可用的服务器，写入没有发出，可以重试
+                stats_flush_errors.inc()
+                logger.error(f"Failed to flush conversation stats: {e}")
+                self._requeue(batch)
+                return 0
+            except Exception as e:
+                # 写入可能已经生效（例如响应超时），重试会重复累加，丢弃并等待重建
+                stats_flush_errors.inc()
+                stats_dropped_users.inc(len(operations))
+                logger.error(
+                    f"Dropped conversation stat deltas after ambiguous flush failure "
+                    f"(run reconcile for users {users}): {e}"
+                )
+                return 0
+            finally:
+                stats_flush_seconds.observe(time.perf_counter() - start)
+
+            return len(operations)
+
+    async def start(self) -> None:
+        """启动后台写入任务."""
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """停止后台任务并写入剩余增量."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await self.flush()
+
+    async def _flush_loop(self) -> None:
+        """定期写入缓冲的增量."""
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_requested.clear()
+                # 停止时不中断正在进行的写入，stop() 会等待它完成
+                await asyncio.shield(self.flush())
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Conversation stats flush loop error: {e}")
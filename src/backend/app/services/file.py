@@ -7,7 +7,7 @@ import os
 import uuid
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import BinaryIO, List, Optional, Tuple
+from typing import Any, AsyncIterator, BinaryIO, Dict, List, Optional, Tuple
 from PIL import Image
 import magic
 
@@ -15,6 +15,7 @@ from fastapi import UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
 
+from app.core.exceptions import FileTooLargeError
 from app.core.logging import get_logger
 from app.models.file import File, FileStatus, FileType
 from app.utils.minio_client import minio_client
@@ -23,6 +24,55 @@ from app.config import settings
 logger = get_logger(__name__)
 
 
+class UploadStream:
+    """
+    上传数据的同步读取包装（由MinIO线程池按分片读取）.
+    
+    读取时增量计算SHA-256和大小，累计大小超过 ``max_size`` 时立即抛出
+    FileTooLargeError（中止向MinIO的分片上传）。已读取的首个分块 ``head`` 先被重放。
+    """
+    
+    def __init__(self, raw: BinaryIO, max_size: int, head: bytes = b"") -> None:
+        """
+        初始化读取包装.
+        
+        Args:
+            raw: 原始数据流（已读取 head 之后的位置）
+            max_size: 最大字节数
+            head: 已从 raw 读取的首个分块
+        """
+        self.raw = raw
+        self.max_size = max_size
+        self.size = 0
+        self._pending = head
+        self._sha256 = hashlib.sha256()
+    
+    @property
+    def checksum(self) -> str:
+        """已读取数据的SHA-256."""
+        return self._sha256.hexdigest()
+    
+    def read(self, size: int = -1) -> bytes:
+        """读取数据并更新校验和."""
+        if self._pending:
+            if size < 0:
+                data = self._pending + self.raw.read()
+                self._pending = b""
+            else:
+                data, self._pending = self._pending[:size], self._pending[size:]
+        else:
+            data = self.raw.read(size)
+        
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise FileTooLargeError(
+                details={"max_size": self.max_size, "received": self.size}
+            )
+        
+        self._sha256.update(data)
+        return data
+
+
 class FileService:
     """文件服务类."""
     
@@ -65,6 +115,9 @@ class FileService:
         ".gz": FileType.GZ,
     }
     
+    # MIME类型检测读取的首个分块大小（字节）
+    MIME_SNIFF_SIZE = 8192
+    
     # 最大文件大小（MB）
     MAX_FILE_SIZE = {
         "image": 10,
@@ -84,8 +137,8 @@ class FileService:
         ext = Path(filename).suffix.lower()
         return self.EXTENSION_MAP.get(ext, FileType.OTHER)
     
-    def _validate_file_size(self, file_size: int, file_type: FileType) -> bool:
-        """验证文件大小."""
+    def _get_max_file_size(self, file_type: FileType) -> int:
+        """获取文件类型的大小上限（字节）."""
         max_size_mb = self.MAX_FILE_SIZE.get("default", 10)
         
         if file_type in [FileType.JPG, FileType.JPEG, FileType.PNG, FileType.GIF]:
@@ -97,7 +150,11 @@ class FileService:
         elif file_type in [FileType.ZIP, FileType.RAR, FileType.TAR]:
             max_size_mb = self.MAX_FILE_SIZE["archive"]
         
-        return file_size <= max_size_mb * 1024 * 1024
+        return max_size_mb * 1024 * 1024
+    
+    def _validate_file_size(self, file_size: int, file_type: FileType) -> bool:
+        """验证文件大小."""
+        return file_size <= self._get_max_file_size(file_type)
     
     def _calculate_checksum(self, file_data: bytes) -> str:
         """计算文件校验和."""
@@ -120,29 +177,44 @@ class FileService:
         description: Optional[str] = None,
         tags: Optional[List[str]] = None
     ) -> Optional[File]:
-        """上传文件."""
+        """
+        上传文件.
+        
+        文件按分片写入MinIO，校验和与大小在读取时计算，内存占用与文件大小无关。
+        
+        ``file`` 是Starlette已接收完整请求体后落盘的临时文件，因此大小上限在请求体
+        接收之后才检查：超过上限时中止写入MinIO并拒绝，但不能提前中断客户端的上传
+        （请求体大小需在反向代理上限制）。
+        
+        Raises:
+            FileTooLargeError: 文件超过类型大小上限（413）
+        """
+        storage_key = None
         try:
-            # 读取文件内容
-            file_data = await file.read()
-            file_size = len(file_data)
-            
             # 获取文件类型
             file_type = self._get_file_type(file.filename)
+            max_size = self._get_max_file_size(file_type)
             
-            # 验证文件大小
-            if not self._validate_file_size(file_size, file_type):
-                logger.warning(f"File too large: {file.filename}")
-                return None
+            # 请求中已声明大小时提前拒绝
+            if file.size is not None and file.size > max_size:
+                raise FileTooLargeError(details={"max_size": max_size, "received": file.size})
+            
+            # 只用第一个分块检测MIME类型
+            head = await file.read(self.MIME_SNIFF_SIZE)
+            mime_type = self._detect_mime_type(head)
             
             # 生成存储信息
             file_id = str(uuid.uuid4())
             storage_key = f"{user_id}/{file_id}/{file.filename}"
             
-            # 计算校验和
-            checksum = self._calculate_checksum(file_data)
-            
-            # 检测MIME类型
-            mime_type = self._detect_mime_type(file_data)
+            # 流式上传到MinIO
+            stream = UploadStream(file.file, max_size, head=head)
+            await minio_client.upload_stream(
+                stream,
+                storage_key,
+                bucket_name=self.bucket_name,
+                content_type=mime_type
+            )
             
             # 创建文件记录
             file_record = File(
@@ -150,70 +222,67 @@ class FileService:
                 original_name=file.filename,
                 file_type=file_type,
                 mime_type=mime_type,
-                file_size=file_size,
+                file_size=stream.size,
                 storage_path=f"minio://{self.bucket_name}/{storage_key}",
                 storage_bucket=self.bucket_name,
                 storage_key=storage_key,
                 user_id=user_id,
                 conversation_id=conversation_id,
-                checksum=checksum,
+                checksum=stream.checksum,
                 description=description,
                 tags=",".join(tags) if tags else None,
-                status=FileStatus.UPLOADING
+                status=FileStatus.PROCESSING
             )
             
             db.add(file_record)
-            await db.flush()
+            await db.commit()
             
-            # 上传到MinIO
-            success = await minio_client.upload_file(
-                self.bucket_name,
-                storage_key,
-                io.BytesIO(file_data),
-                file_size,
-                content_type=mime_type
-            )
+            # 处理文件（生成预览等）
+            await self._process_file(db, file_record, file.file)
             
-            if success:
-                # 更新状态
-                file_record.status = FileStatus.PROCESSING
-                await db.commit()
-                
-                # 异步处理文件（生成预览等）
-                await self._process_file(db, file_record, file_data)
-                
-                return file_record
-            else:
-                file_record.status = FileStatus.ERROR
-                file_record.error_message = "Failed to upload to storage"
-                await db.commit()
-                return None
+            return file_record
             
+        except FileTooLargeError as e:
+            logger.warning(f"File too large: {file.filename} ({e.details})")
+            raise
         except Exception as e:
             logger.error(f"Failed to upload file: {e}")
             await db.rollback()
+            if storage_key:
+                await self._delete_orphan(storage_key)
             return None
     
+    async def _delete_orphan(self, storage_key: str) -> None:
+        """删除没有对应文件记录的对象."""
+        try:
+            await minio_client.delete_file(storage_key, bucket_name=self.bucket_name)
+        except Exception as e:
+            logger.error(f"Failed to delete orphaned object {storage_key}: {e}")
+    
+    async def _get_preview_url(self, storage_key: str) -> str:
+        """生成1小时有效的预签名URL."""
+        return await minio_client.generate_presigned_url(
+            storage_key,
+            bucket_name=self.bucket_name,
+            expires=timedelta(hours=1)
+        )
+    
     async def _process_file(
         self,
         db: AsyncSession,
         file_record: File,
-        file_data: bytes
+        source: BinaryIO
     ) -> None:
         """处理文件（生成预览、缩略图等）."""
         try:
             # 根据文件类型进行处理
             if file_record.is_image:
-                await self._process_image(db, file_record, file_data)
+                await self._process_image(db, file_record, source)
             elif file_record.file_type == FileType.PDF:
-                await self._process_pdf(db, file_record, file_data)
+                await self._process_pdf(db, file_record, source)
             
             # 生成预览URL
-            preview_url = await minio_client.get_presigned_url(
-                self.bucket_name,
-                file_record.storage_key,
-                expires=3600  # 1小时
-            )
+            preview_url = await self._get_preview_url(file_record.storage_key)
             
             file_record.preview_url = preview_url
             file_record.status = FileStatus.READY
@@ -231,12 +300,13 @@ class FileService:
         self,
         db: AsyncSession,
         file_record: File,
-        file_data: bytes
+        source: BinaryIO
     ) -> None:
-        """处理图片文件."""
+        """处理图片文件（source 为已上传的原始数据流）."""
         try:
             # 打开图片
-            image = Image.open(io.BytesIO(file_data))
+            source.seek(0)
+            image = Image.open(source)
             
             # 生成缩略图
             thumbnail = image.copy()
@@ -251,19 +321,14 @@ class FileService:
             # 上传缩略图
             thumbnail_key = f"{file_record.storage_key}_thumbnail"
             await minio_client.upload_file(
-                self.bucket_name,
+                thumbnail_data,
                 thumbnail_key,
-                io.BytesIO(thumbnail_data),
-                len(thumbnail_data),
+                bucket_name=self.bucket_name,
                 content_type=f"image/{thumbnail_format.lower()}"
             )
             
             # 生成缩略图URL
-            thumbnail_url = await minio_client.get_presigned_url(
-                self.bucket_name,
-                thumbnail_key,
-                expires=3600
-            )
+            thumbnail_url = await self._get_preview_url(thumbnail_key)
             
             file_record.thumbnail_url = thumbnail_url
             
@@ -274,7 +339,7 @@ class FileService:
         self,
         db: AsyncSession,
         file_record: File,
-        file_data: bytes
+        source: BinaryIO
     ) -> None:
         """处理PDF文件."""
         # TODO: 实现PDF处理（页数统计、缩略图生成等）
@@ -325,33 +390,67 @@ class FileService:
             logger.error(f"Failed to list files: {e}")
             return []
     
-    async def download_file(
+    async def get_download_info(
         self,
         db: AsyncSession,
         file_id: int,
         user_id: Optional[int] = None
-    ) -> Optional[Tuple[BinaryIO, str, str]]:
-        """下载文件."""
+    ) -> Optional[Tuple[File, Dict[str, Any]]]:
+        """获取文件记录和对象信息（大小、ETag、最后修改时间），用于条件请求和范围请求."""
         try:
-            # 获取文件信息
             file_record = await self.get_file(db, file_id, user_id)
-            if not file_record:
+            if not file_record or file_record.status == FileStatus.DELETED:
                 return None
             
-            # 从MinIO下载
-            file_data = await minio_client.download_file(
-                self.bucket_name,
-                file_record.storage_key
+            info = await minio_client.get_file_info(
+                file_record.storage_key,
+                bucket_name=self.bucket_name
             )
+            return file_record, info
             
-            if file_data:
-                return (
-                    io.BytesIO(file_data),
-                    file_record.original_name,
-                    file_record.mime_type or "application/octet-stream"
-                )
-            
+        except Exception as e:
+            logger.error(f"Failed to get download info: {e}")
             return None
+    
+    async def open_stream(
+        self,
+        file_record: File,
+        offset: int = 0,
+        length: int = 0,
+        etag: Optional[str] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        打开文件内容的流式读取（length 为 0 时读到末尾）.
+        
+        传入 ``etag`` 时只读取该版本的对象，对象已被替换时抛出 ConflictError。
+        """
+        return await minio_client.stream_file(
+            file_record.storage_key,
+            bucket_name=self.bucket_name,
+            offset=offset,
+            length=length,
+            etag=etag
+        )
+    
+    async def download_file(
+        self,
+        db: AsyncSession,
+        file_id: int,
+        user_id: Optional[int] = None
+    ) -> Optional[Tuple[AsyncIterator[bytes], str, str]]:
+        """下载文件（按块流式返回内容）."""
+        try:
+            # 获取文件信息
+            file_record = await self.get_file(db, file_id, user_id)
+            if not file_record or file_record.status == FileStatus.DELETED:
+                return None
+            
+            # 从MinIO流式读取
+            return (
+                await self.open_stream(file_record),
+                file_record.original_name,
+                file_record.mime_type or "application/octet-stream"
+            )
             
         except Exception as e:
             logger.error(f"Failed to download file: {e}")
@@ -372,16 +471,16 @@ class FileService:
             
             # 从MinIO删除
             await minio_client.delete_file(
-                self.bucket_name,
-                file_record.storage_key
+                file_record.storage_key,
+                bucket_name=self.bucket_name
             )
             
             # 删除缩略图（如果存在）
             if file_record.thumbnail_url:
                 thumbnail_key = f"{file_record.storage_key}_thumbnail"
                 await minio_client.delete_file(
-                    self.bucket_name,
-                    thumbnail_key
+                    thumbnail_key,
+                    bucket_name=self.bucket_name
                 )
             
             # 标记为删除状态（软删除）
@@ -409,11 +508,7 @@ class FileService:
             
             # 如果预览URL过期，重新生成
             if not file_record.preview_url or self._is_url_expired(file_record.preview_url):
-                preview_url = await minio_client.get_presigned_url(
-                    self.bucket_name,
-                    file_record.storage_key,
-                    expires=3600
-                )
+                preview_url = await self._get_preview_url(file_record.storage_key)
                 
                 file_record.preview_url = preview_url
                 await db.commit()
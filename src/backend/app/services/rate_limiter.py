@@ -1,5 +1,6 @@
 """API限流服务."""
 
+import math
 import time
 from typing import Optional, Tuple
 
@@ -9,14 +10,158 @@ from app.utils.redis_client import redis_client
 logger = get_logger(__name__)
 
 
+# GCRA（通用信元速率算法）：每个标识符只保存一个“理论到达时间”（TAT），
+# 等价于容量为 limit、每 window/limit 毫秒补充一个令牌的令牌桶，内存O(1)。
+# 时间取自Redis服务器，避免多个应用节点之间的时钟偏差。
+# KEYS[1]=限流键; ARGV[1]=limit ARGV[2]=window（秒） ARGV[3]=cost（为0时只查询不记录）
+# 返回 {是否允许, 剩余次数, 完全重置剩余毫秒, 重试等待毫秒}
+_GCRA_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2]) * 1000
+local cost = tonumber(ARGV[3])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + tonumber(time[2]) / 1000
+-- 浮点误差容忍（毫秒）
+local epsilon = 0.001
+
+local interval = window / limit
+local tat = tonumber(redis.call("GET", KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+
+local new_tat = tat + interval * cost
+if new_tat - now > window + epsilon then
+    local remaining = math.floor((window - (tat - now)) / interval + epsilon)
+    local retry_after = new_tat - window - now
+    return {0, math.max(remaining, 0), math.ceil(tat - now), math.ceil(retry_after)}
+end
+
+if cost > 0 then
+    redis.call("SET", KEYS[1], string.format("%.3f", new_tat), "PX", math.max(math.ceil(new_tat - now), 1))
+end
+local remaining = math.floor((window - (new_tat - now)) / interval + epsilon)
+return {1, math.max(remaining, 0), math.ceil(new_tat - now), 0}
+"""
+
+# 多维度GCRA：一次调用判定所有维度，全部允许时才记录。
+# 每个维度可以请求一批配额（cost），不足时至少授予 min_cost，用于全局配额租约。
+# KEYS[i]=各维度限流键; ARGV[(i-1)*4+1..+4]=limit, window（秒）, cost, min_cost
+# 返回每个维度的 {是否允许, 剩余次数, 完全重置剩余毫秒, 重试等待毫秒, 授予数量}
+_MULTI_GCRA_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + tonumber(time[2]) / 1000
+local epsilon = 0.001
+
+local results = {}
+local new_tats = {}
+local available = {}
+local denied = false
+
+for i = 1, #KEYS do
+    local base = (i - 1) * 4
+    local limit = tonumber(ARGV[base + 1])
+    local window = tonumber(ARGV[base + 2]) * 1000
+    local cost = tonumber(ARGV[base + 3])
+    local min_cost = tonumber(ARGV[base + 4])
+    local interval = window / limit
+
+    local tat = tonumber(redis.call("GET", KEYS[i])) or now
+    if tat < now then
+        tat = now
+    end
+    available[i] = math.max(math.floor((window - (tat - now)) / interval + epsilon), 0)
+
+    local granted = math.min(cost, available[i])
+    if granted < min_cost then
+        denied = true
+        local retry_after = tat + interval * min_cost - window - now
+        results[i] = {0, available[i], math.ceil(tat - now), math.ceil(retry_after), 0}
+    else
+        new_tats[i] = tat + interval * granted
+        results[i] = {1, available[i] - granted, math.ceil(new_tats[i] - now), 0, granted}
+    end
+end
+
+for i = 1, #KEYS do
+    if denied then
+        -- 有维度被拒绝时不记录任何维度
+        results[i][2] = available[i]
+        results[i][5] = 0
+    elseif results[i][5] > 0 then
+        redis.call("SET", KEYS[i], string.format("%.3f", new_tats[i]), "PX", math.max(math.ceil(new_tats[i] - now), 1))
+    end
+end
+return results
+"""
+
+# 精确滑动日志：ZSET中记录窗口内每次请求，内存O(limit)，仅在需要精确计数时使用。
+# KEYS[1]=日志ZSET KEYS[2]=成员序号; ARGV同 _GCRA_SCRIPT
+_SLIDING_LOG_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2]) * 1000
+local cost = tonumber(ARGV[3])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + tonumber(time[2]) / 1000
+
+redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now - window)
+local count = redis.call("ZCARD", KEYS[1])
+
+local function reset_after()
+    local oldest = redis.call("ZRANGE", KEYS[1], 0, 0, "WITHSCORES")
+    if #oldest == 0 then
+        return 0
+    end
+    return math.ceil(tonumber(oldest[2]) + window - now)
+end
+
+if count + cost > limit then
+    local retry_after = window
+    local index = count + cost - limit - 1
+    local blocking = redis.call("ZRANGE", KEYS[1], index, index, "WITHSCORES")
+    if #blocking > 0 then
+        retry_after = math.ceil(tonumber(blocking[2]) + window - now)
+    end
+    return {0, math.max(limit - count, 0), reset_after(), retry_after}
+end
+
+if cost > 0 then
+    local seq = redis.call("INCRBY", KEYS[2], cost)
+    for i = 1, cost do
+        redis.call("ZADD", KEYS[1], now, seq - cost + i)
+    end
+    redis.call("PEXPIRE", KEYS[1], math.ceil(window))
+    redis.call("PEXPIRE", KEYS[2], math.ceil(window))
+end
+return {1, limit - count - cost, reset_after(), 0}
+"""
+
+
 class RateLimiter:
-    """限流器实现."""
+    """
+    限流器实现.
+    
+    默认使用GCRA，一次原子脚本调用完成判定和记录；
+    ``algorithm="sliding_log"`` 时使用精确滑动日志。
+    """
+    
+    ALGORITHMS = ("gcra", "sliding_log")
     
     def __init__(
         self,
         key_prefix: str = "rate_limit",
         default_limit: int = 100,
-        default_window: int = 60
+        default_window: int = 60,
+        algorithm: str = "gcra"
     ):
         """
         初始化限流器.
@@ -25,10 +170,35 @@ class RateLimiter:
             key_prefix: Redis键前缀
             default_limit: 默认请求限制
             default_window: 默认时间窗口（秒）
+            algorithm: 限流算法，gcra 或 sliding_log
         """
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(f"Unsupported rate limit algorithm: {algorithm}")
+        
         self.key_prefix = key_prefix
         self.default_limit = default_limit
         self.default_window = default_window
+        self.algorithm = algorithm
+    
+    async def _evaluate(
+        self,
+        identifier: str,
+        limit: int,
+        window: int,
+        cost: int
+    ) -> Tuple[bool, int, int, int]:
+        """执行限流脚本，返回 (是否允许, 剩余次数, 完全重置剩余毫秒, 重试等待毫秒)."""
+        key = f"{self.key_prefix}:{identifier}"
+        
+        if self.algorithm == "gcra":
+            script, keys = _GCRA_SCRIPT, [key]
+        else:
+            script, keys = _SLIDING_LOG_SCRIPT, [key, f"{key}:seq"]
+        
+        allowed, remaining, reset_ms, retry_ms = await redis_client.run_script(
+            script, keys=keys, args=[limit, window, cost]
+        )
+        return bool(allowed), int(remaining), int(reset_ms), int(retry_ms)
     
     async def check_rate_limit(
         self,
@@ -40,6 +210,8 @@ class RateLimiter:
         """
         检查限流.
         
+        判定和记录在同一个原子脚本中完成，并发请求不会同时越过限制。
+        
         Args:
             identifier: 标识符（如用户ID、IP地址）
             limit: 请求限制
@@ -52,37 +224,13 @@ class RateLimiter:
         limit = limit or self.default_limit
         window = window or self.default_window
         
-        key = f"{self.key_prefix}:{identifier}"
-        now = int(time.time())
-        
         try:
-            # 使用滑动窗口算法
-            pipeline = redis_client.pipeline()
-            
-            # 移除过期的记录
-            pipeline.zremrangebyscore(key, 0, now - window)
-            
-            # 获取当前窗口内的请求数
-            pipeline.zcard(key)
-            
-            # 执行管道
-            results = await pipeline.execute()
-            current_count = results[1]
-            
-            # 检查是否超限
-            if current_count + cost > limit:
-                remaining = max(0, limit - current_count)
-                reset_time = now + window
-                return False, remaining, reset_time
-            
-            # 添加新的请求记录
-            await redis_client.zadd(key, {f"{now}:{time.time_ns()}": now})
-            await redis_client.expire(key, window)
-            
-            remaining = limit - current_count - cost
-            reset_time = now + window
+            allowed, remaining, reset_ms, _ = await self._evaluate(
+                identifier, limit, window, cost
+            )
+            reset_time = math.ceil(time.time() + reset_ms / 1000)
             
-            return True, remaining, reset_time
+            return allowed, remaining, reset_time
             
         except Exception as e:
             logger.error(f"Rate limit check failed: {e}")
@@ -109,29 +257,95 @@ class RateLimiter:
         limit = limit or self.default_limit
         window = window or self.default_window
         
-        key = f"{self.key_prefix}:{identifier}"
-        now = int(time.time())
-        
         try:
-            # 移除过期记录并获取当前计数
-            await redis_client.zremrangebyscore(key, 0, now - window)
-            current_count = await redis_client.zcard(key)
-            
-            remaining = max(0, limit - current_count)
-            reset_time = now + window
+            # cost为0时脚本只计算不记录
+            _, remaining, reset_ms, _ = await self._evaluate(identifier, limit, window, 0)
+            reset_time = math.ceil(time.time() + reset_ms / 1000)
             
-            return current_count, remaining, reset_time
+            return limit - remaining, remaining, reset_time
             
         except Exception as e:
             logger.error(f"Failed to get rate limit info: {e}")
             return 0, limit, 0
 
 
+class LocalAllowance:
+    """
+    进程内配额租约.
+    
+    从Redis的全局桶中一次租用一批配额，在本地逐个消耗，租约过期后剩余配额作废。
+    配额在租用时已从全局桶扣除，因此集群整体不会超过全局限制；
+    代价是各进程持有的本地配额（最多约 1.5 × lease_size）对其他进程不可见，
+    全局配额紧张时可能一个进程拒绝、另一个进程仍有余量，
+    租约过期时未用完的配额直接作废，实际通过量会略低于全局限制。
+    lease_size 越大，热点键访问越少，但这部分误差越大；
+    lease_size 小于单进程在一次Redis往返内的请求数时本地配额会频繁断档，
+    未命中的请求退化为逐个访问全局桶（仍在同一次脚本调用中）。
+    """
+    
+    def __init__(self, lease_size: int = 20, lease_ttl: float = 1.0):
+        """
+        初始化配额租约.
+        
+        Args:
+            lease_size: 每次租用的配额数量
+            lease_ttl: 租约有效期（秒）
+        """
+        self.lease_size = lease_size
+        self.lease_ttl = lease_ttl
+        self.tokens = 0
+        self.expires_at = 0.0
+        self.leasing = False  # 是否有租用请求在途，同一时刻只租一批
+        self.remaining_hint = 0  # 最近一次租用时全局桶的剩余配额
+        self.reset_hint = 0  # 最近一次租用时全局桶的重置时间
+    
+    def take(self, cost: int = 1) -> bool:
+        """尝试消耗本地配额."""
+        if self.tokens >= cost and time.monotonic() < self.expires_at:
+            self.tokens -= cost
+            return True
+        return False
+    
+    def needs_refill(self) -> bool:
+        """本地配额低于一半或租约即将过期时需要续租."""
+        return (
+            self.tokens < self.lease_size // 2
+            or time.monotonic() > self.expires_at - self.lease_ttl / 2
+        )
+    
+    def give_back(self, cost: int = 1) -> None:
+        """归还未使用的本地配额（其他维度拒绝时）."""
+        if time.monotonic() < self.expires_at:
+            self.tokens += cost
+    
+    def refill(self, granted: int, remaining: int, reset_time: int) -> None:
+        """登记新租到的配额."""
+        now = time.monotonic()
+        if now >= self.expires_at:
+            self.tokens = 0
+        self.tokens += granted
+        self.expires_at = now + self.lease_ttl
+        self.remaining_hint = remaining
+        self.reset_hint = reset_time
+
+
 class MultiDimensionalRateLimiter:
-    """多维度限流器."""
+    """
+    多维度限流器.
     
-    def __init__(self):
-        """初始化多维度限流器."""
+    用户、IP、端点维度在一次脚本调用中同时判定；全局维度通过
+    LocalAllowance 按批租用，热点键每 lease_size 个请求才访问一次。
+    所有维度的键需位于同一个Redis实例（集群模式下需使用hash tag）。
+    """
+    
+    def __init__(self, global_lease_size: int = 20, global_lease_ttl: float = 1.0):
+        """
+        初始化多维度限流器.
+        
+        Args:
+            global_lease_size: 全局配额每次租用数量，为1时每个请求都访问全局桶
+            global_lease_ttl: 全局配额租约有效期（秒）
+        """
         # 用户级限流
         self.user_limiter = RateLimiter(
             key_prefix="rate_limit:user",
@@ -159,6 +373,7 @@ class MultiDimensionalRateLimiter:
             default_limit=10000,
             default_window=60  # 1分钟
         )
+        self.global_allowance = LocalAllowance(global_lease_size, global_lease_ttl)
     
     async def check_limits(
         self,
@@ -179,75 +394,94 @@ class MultiDimensionalRateLimiter:
         Returns:
             (是否允许, 限流信息)
         """
+        custom_limits = custom_limits or {}
+        
+        # (维度名, 限流键, limit, window, cost, min_cost)
+        dimensions = []
+        for name, limiter, identifier in (
+            ("user", self.user_limiter, str(user_id) if user_id else None),
+            ("ip", self.ip_limiter, ip_address),
+            ("endpoint", self.endpoint_limiter, endpoint)
+        ):
+            if not identifier:
+                continue
+            dimensions.append((
+                name,
+                f"{limiter.key_prefix}:{identifier}",
+                custom_limits.get(f"{name}_limit") or limiter.default_limit,
+                custom_limits.get(f"{name}_window") or limiter.default_window,
+                1,
+                1
+            ))
+        
+        # 全局维度优先使用本地租约。本地配额用完时随本次调用续租；
+        # 低于水位且本次调用本来就要访问Redis时提前续租，避免本地配额断档。
+        # 同一时刻只有一个租用在途，其余未命中本地配额的请求只申请自己的1个配额。
+        allowance = self.global_allowance
+        global_local = allowance.take()
+        leasing = not allowance.leasing and (
+            not global_local or (dimensions and allowance.needs_refill())
+        )
+        if leasing or not global_local:
+            allowance.leasing = allowance.leasing or leasing
+            dimensions.append((
+                "global",
+                f"{self.global_limiter.key_prefix}:global",
+                self.global_limiter.default_limit,
+                self.global_limiter.default_window,
+                allowance.lease_size if leasing else 1,
+                0 if global_local else 1
+            ))
+        
         results = {}
+        allowed = True
         
-        # 检查用户级限流
-        if user_id:
-            user_limit = custom_limits.get("user_limit") if custom_limits else None
-            user_window = custom_limits.get("user_window") if custom_limits else None
-            
-            allowed, remaining, reset = await self.user_limiter.check_rate_limit(
-                str(user_id),
-                limit=user_limit,
-                window=user_window
-            )
+        if dimensions:
+            keys = []
+            args = []
+            for _, key, limit, window, cost, min_cost in dimensions:
+                keys.append(key)
+                args.extend((limit, window, cost, min_cost))
             
-            results["user"] = {
-                "allowed": allowed,
-                "remaining": remaining,
-                "reset": reset
-            }
+            try:
+                evaluated = await redis_client.run_script(
+                    _MULTI_GCRA_SCRIPT, keys=keys, args=args
+                )
+            except Exception as e:
+                logger.error(f"Rate limit check failed: {e}")
+                # 出错时允许请求通过，避免影响服务
+                return True, results
+            finally:
+                if leasing:
+                    allowance.leasing = False
             
-            if not allowed:
-                return False, results
+            now = time.time()
+            for (name, *_), (dim_allowed, remaining, reset_ms, _, granted) in zip(
+                dimensions, evaluated
+            ):
+                reset_time = math.ceil(now + reset_ms / 1000)
+                results[name] = {
+                    "allowed": bool(dim_allowed),
+                    "remaining": remaining,
+                    "reset": reset_time
+                }
+                allowed = allowed and bool(dim_allowed)
+                
+                if name == "global" and leasing and granted:
+                    # 本次请求未使用本地配额时从租到的配额中消耗1个
+                    allowance.refill(
+                        granted - (0 if global_local else 1), remaining, reset_time
+                    )
         
-        # 检查IP级限流
-        if ip_address:
-            ip_limit = custom_limits.get("ip_limit") if custom_limits else None
-            ip_window = custom_limits.get("ip_window") if custom_limits else None
-            
-            allowed, remaining, reset = await self.ip_limiter.check_rate_limit(
-                ip_address,
-                limit=ip_limit,
-                window=ip_window
-            )
-            
-            results["ip"] = {
-                "allowed": allowed,
-                "remaining": remaining,
-                "reset": reset
-            }
-            
+        if global_local:
             if not allowed:
-                return False, results
-        
-        # 检查端点级限流
-        if endpoint:
-            endpoint_limit = custom_limits.get("endpoint_limit") if custom_limits else None
-            endpoint_window = custom_limits.get("endpoint_window") if custom_limits else None
-            
-            allowed, remaining, reset = await self.endpoint_limiter.check_rate_limit(
-                endpoint,
-                limit=endpoint_limit,
-                window=endpoint_window
-            )
-            
-            results["endpoint"] = {
-                "allowed": allowed,
-                "remaining": remaining,
-                "reset": reset
+                allowance.give_back()
+            results["global"] = {
+                "allowed": True,
+                "remaining": allowance.remaining_hint,
+                "reset": allowance.reset_hint,
+                "leased": True
             }
-            
-            if not allowed:
-                return False, results
-        
-        # 检查全局限流
-        allowed, remaining, reset = await self.global_limiter.check_rate_limit("global")
-        results["global"] = {
-            "allowed": allowed,
-            "remaining": remaining,
-            "reset": reset
-        }
         
         return allowed, results
 
@@ -2,27 +2,188 @@
 Agent会话管理器 - 管理用户会话状态和上下文
 """
 
+import asyncio
+import inspect
 import json
+import re
+import time
 import uuid
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable, Union, Awaitable
+
+from redis.exceptions import ResponseError
 
 from app.core.logging import get_logger
-from app.utils.redis_client import get_redis_client
+from app.utils.redis_client import get_redis_client, redis_client
 from app.config import settings
 
 logger = get_logger(__name__)
 
+# 追加历史消息，刷新TTL并累加会话消息计数（会话不存在时不创建）。
+# 超过条数或字节上限时从最旧一端弹出消息直到低水位，返回弹出的消息（从旧到新）
+# 供调用方压缩进滚动摘要；最新一条消息始终保留。
+# KEYS[1]=历史列表 KEYS[2]=会话哈希 KEYS[3]=历史元数据哈希
+# ARGV[1]=消息 ARGV[2]=ttl ARGV[3]=最大条数 ARGV[4]=最大字节数
+# ARGV[5]=压缩后目标条数 ARGV[6]=压缩后目标字节数
+_APPEND_MESSAGE_SCRIPT = """
+local length = redis.call("LPUSH", KEYS[1], ARGV[1])
+local size = redis.call("HINCRBY", KEYS[3], "bytes", #ARGV[1])
+redis.call("EXPIRE", KEYS[1], ARGV[2])
+redis.call("EXPIRE", KEYS[3], ARGV[2])
+if redis.call("EXISTS", KEYS[2]) == 1 then
+    redis.call("EXPIRE", KEYS[2], ARGV[2])
+    redis.call("HINCRBY", KEYS[2], "message_count", 1)
+end
+
+local compacted = {}
+if length > tonumber(ARGV[3]) or size > tonumber(ARGV[4]) then
+    local target_length = tonumber(ARGV[5])
+    local target_size = tonumber(ARGV[6])
+    while length > 1 and (length > target_length or size > target_size) do
+        local message = redis.call("RPOP", KEYS[1])
+        if not message then
+            break
+        end
+        length = length - 1
+        size = size - #message
+        compacted[#compacted + 1] = message
+    end
+    -- 旧版本写入的消息没有计入字节数，避免计数变为负数
+    if size < 0 then
+        size = 0
+    end
+    redis.call("HSET", KEYS[3], "bytes", size)
+end
+return compacted
+"""
+
+# 摘要版本一致时写入新的滚动摘要（乐观并发控制）
+# KEYS[1]=历史元数据哈希; ARGV[1]=读取时的版本 ARGV[2]=新摘要 ARGV[3]=本次压缩条数 ARGV[4]=ttl
+_UPDATE_SUMMARY_SCRIPT = """
+local version = redis.call("HGET", KEYS[1], "summary_version") or "0"
+if version ~= ARGV[1] then
+    return 0
+end
+redis.call("HSET", KEYS[1], "summary", ARGV[2], "summary_version", tonumber(version) + 1)
+redis.call("HINCRBY", KEYS[1], "compacted_messages", ARGV[3])
+redis.call("EXPIRE", KEYS[1], ARGV[4])
+return 1
+"""
+
+# 按活跃时间清理一批过期会话：删除会话相关的全部键并从全局和用户索引中移除。
+# 在脚本内读取索引，期间被重新激活的会话（分数已更新）不会被误删。
+# KEYS[1]=全局活跃索引; ARGV[1]=过期阈值 ARGV[2]=批大小
+# ARGV[3]=用户索引前缀 ARGV[4..]=会话相关键前缀
+_CLEANUP_SESSIONS_SCRIPT = """
+local members = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1], "LIMIT", 0, tonumber(ARGV[2]))
+for _, member in ipairs(members) do
+    for i = 4, #ARGV do
+        redis.call("DEL", ARGV[i] .. ":" .. member)
+    end
+    local user_id, session_id = string.match(member, "^(.*):([^:]*)$")
+    if user_id then
+        redis.call("ZREM", ARGV[3] .. user_id, session_id)
+    end
+end
+if #members > 0 then
+    redis.call("ZREM", KEYS[1], unpack(members))
+end
+return #members
+"""
+
+# 压缩后保留到上限的比例，避免每次追加都触发压缩
+_COMPACTION_TARGET_RATIO = 0.75
+
+# 摘要写入冲突时的最大重试次数
+_SUMMARY_MAX_RETRIES = 5
+
+Summarizer = Callable[[Optional[str], List[Dict[str, Any]]], Union[str, Awaitable[str]]]
+
+
+class ExtractiveSummarizer:
+    """
+    抽取式摘要器（默认）
+    
+    每条被压缩的消息保留角色和首句，追加到已有摘要之后；
+    超过长度上限时丢弃最旧的行。不调用模型，开销可以忽略。
+    """
+    
+    _SENTENCE_END = re.compile(r"[。！？!?\n]|\.\s")
+    
+    def __init__(self, max_chars: int = 4000, max_line_chars: int = 120):
+        self.max_chars = max_chars
+        self.max_line_chars = max_line_chars
+    
+    def _first_sentence(self, text: str) -> str:
+        """提取首句并截断"""
+        text = text.strip()
+        match = self._SENTENCE_END.search(text)
+        sentence = text[:match.end()].strip() if match else text
+        if len(sentence) > self.max_line_chars:
+            sentence = sentence[:self.max_line_chars - 1] + "…"
+        return sentence
+    
+    def __call__(self, previous_summary: Optional[str], messages: List[Dict[str, Any]]) -> str:
+        lines = previous_summary.splitlines() if previous_summary else []
+        
+        for message in messages:
+            sentence = self._first_sentence(str(message.get("content", "")))
+            if sentence:
+                lines.append(f"{message.get('role', 'unknown')}: {sentence}")
+        
+        total = sum(len(line) + 1 for line in lines)
+        start = 0
+        while start < len(lines) - 1 and total > self.max_chars:
+            total -= len(lines[start]) + 1
+            start += 1
+        
+        return "\n".join(lines[start:])
+
+
+# 合并上下文字段：缺失的默认字段用HSETNX补齐，更新字段直接HSET，返回合并后的上下文
+# KEYS[1]=上下文哈希; ARGV[1]=ttl ARGV[2]=默认字段数n
+# ARGV[3..2+2n]=默认字段名/值，其后为更新字段名/值
+_MERGE_CONTEXT_SCRIPT = """
+if redis.call("TYPE", KEYS[1]).ok == "string" then
+    -- 旧版本以JSON字符串存储的上下文无法按字段合并，重新初始化
+    redis.call("DEL", KEYS[1])
+end
+local defaults_end = 2 + 2 * tonumber(ARGV[2])
+for i = 3, defaults_end, 2 do
+    redis.call("HSETNX", KEYS[1], ARGV[i], ARGV[i + 1])
+end
+if #ARGV > defaults_end then
+    redis.call("HSET", KEYS[1], unpack(ARGV, defaults_end + 1))
+end
+redis.call("EXPIRE", KEYS[1], ARGV[1])
+return redis.call("HGETALL", KEYS[1])
+"""
+
 
 class SessionManager:
     """Agent会话管理器"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        max_history_messages: Optional[int] = None,
+        max_history_bytes: Optional[int] = None,
+        summarizer: Optional[Summarizer] = None
+    ):
         self.redis = None
         self._session_prefix = "agent_session"
         self._context_prefix = "agent_context"
         self._history_prefix = "agent_history"
+        self._history_meta_prefix = "agent_history_meta"
+        # 按最后活跃时间排序的会话索引：全局成员为 "user_id:session_id"，用户索引成员为 session_id
+        self._activity_index_key = "agent_session_index:all"
+        self._user_index_prefix = "agent_session_index:user:"
         self.default_ttl = 3600 * 24  # 24小时
+        self.max_history_messages = max_history_messages or settings.AGENT_HISTORY_MAX_MESSAGES
+        self.max_history_bytes = max_history_bytes or settings.AGENT_HISTORY_MAX_BYTES
+        # 摘要器接收 (已有摘要, 被压缩的消息列表)，返回新摘要，可以是同步或异步函数
+        self.summarizer: Summarizer = summarizer or ExtractiveSummarizer(
+            max_chars=settings.AGENT_HISTORY_SUMMARY_MAX_CHARS
+        )
     
     async def _get_redis(self):
         """获取Redis连接"""
@@ -42,6 +203,22 @@ class SessionManager:
         """获取历史记录存储键"""
         return f"{self._history_prefix}:{user_id}:{session_id}"
     
+    def _get_history_meta_key(self, user_id: str, session_id: str) -> str:
+        """获取历史元数据（字节数、滚动摘要）存储键"""
+        return f"{self._history_meta_prefix}:{user_id}:{session_id}"
+    
+    def _get_user_index_key(self, user_id: str) -> str:
+        """获取用户会话活跃索引键"""
+        return f"{self._user_index_prefix}{user_id}"
+    
+    def _index_activity(self, pipe: Any, user_id: str, session_id: str) -> None:
+        """在管道中更新会话活跃索引"""
+        now = time.time()
+        user_index_key = self._get_user_index_key(user_id)
+        pipe.zadd(self._activity_index_key, {f"{user_id}:{session_id}": now})
+        pipe.zadd(user_index_key, {session_id: now})
+        pipe.expire(user_index_key, self.default_ttl)
+    
     async def create_session(
         self, 
         user_id: str, 
@@ -76,17 +253,21 @@ class SessionManager:
             }
             
             session_key = self._get_session_key(user_id, session_id)
+            context_key = self._get_context_key(user_id, session_id)
             
-            # 存储会话信息
-            await redis.hset(
-                session_key,
-                mapping={k: json.dumps(v) if not isinstance(v, str) else v 
-                        for k, v in session_data.items()}
-            )
-            await redis.expire(session_key, self.default_ttl)
-            
-            # 初始化上下文
-            await self._initialize_context(user_id, session_id)
+            # 存储会话信息并初始化上下文（一次往返，原子执行）
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.hset(
+                    session_key,
+                    mapping={k: json.dumps(v) if not isinstance(v, str) else v 
+                            for k, v in session_data.items()}
+                )
+                pipe.expire(session_key, self.default_ttl)
+                pipe.delete(context_key)
+                pipe.hset(context_key, mapping=self._encode_fields(self._default_context()))
+                pipe.expire(context_key, self.default_ttl)
+                self._index_activity(pipe, user_id, session_id)
+                await pipe.execute()
             
             logger.info(f"创建新会话 - 用户: {user_id}, 会话: {session_id}")
             return session_id
@@ -129,47 +310,72 @@ class SessionManager:
             return None
     
     async def update_session_activity(self, user_id: str, session_id: str) -> None:
-        """更新会话活跃时间"""
+        """更新会话活跃时间和活跃索引，并刷新会话相关键的过期时间"""
         try:
             redis = await self._get_redis()
             session_key = self._get_session_key(user_id, session_id)
             
-            # 更新最后活跃时间
-            await redis.hset(
-                session_key,
-                "last_active",
-                datetime.utcnow().isoformat()
-            )
-            
-            # 重新设置过期时间
-            await redis.expire(session_key, self.default_ttl)
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.hset(session_key, "last_active", datetime.utcnow().isoformat())
+                pipe.expire(session_key, self.default_ttl)
+                pipe.expire(self._get_context_key(user_id, session_id), self.default_ttl)
+                pipe.expire(self._get_history_key(user_id, session_id), self.default_ttl)
+                pipe.expire(self._get_history_meta_key(user_id, session_id), self.default_ttl)
+                self._index_activity(pipe, user_id, session_id)
+                await pipe.execute()
             
         except Exception as e:
             logger.error(f"更新会话活跃时间失败: {e}")
     
-    async def _initialize_context(self, user_id: str, session_id: str) -> None:
-        """初始化会话上下文"""
-        try:
-            redis = await self._get_redis()
-            context_key = self._get_context_key(user_id, session_id)
-            
-            initial_context = {
-                "conversation_turns": 0,
-                "current_topic": "",
-                "user_preferences": {},
-                "agent_memory": {},
-                "tool_usage_history": [],
-                "created_at": datetime.utcnow().isoformat()
-            }
-            
-            await redis.set(
-                context_key,
-                json.dumps(initial_context),
-                ex=self.default_ttl
-            )
-            
-        except Exception as e:
-            logger.error(f"初始化上下文失败: {e}")
+    @staticmethod
+    def _default_context() -> Dict[str, Any]:
+        """默认会话上下文"""
+        return {
+            "conversation_turns": 0,
+            "current_topic": "",
+            "user_preferences": {},
+            "agent_memory": {},
+            "tool_usage_history": [],
+            "created_at": datetime.utcnow().isoformat()
+        }
+    
+    @staticmethod
+    def _encode_fields(data: Dict[str, Any]) -> Dict[str, str]:
+        """将上下文字段编码为哈希字段值"""
+        return {k: json.dumps(v, ensure_ascii=False) for k, v in data.items()}
+    
+    @staticmethod
+    def _decode_fields(raw: Dict[str, str]) -> Dict[str, Any]:
+        """解码哈希字段值"""
+        data = {}
+        for key, value in raw.items():
+            try:
+                data[key] = json.loads(value)
+            except (json.JSONDecodeError, TypeError):
+                data[key] = value
+        return data
+    
+    async def _merge_context(
+        self, 
+        user_id: str, 
+        session_id: str, 
+        context_updates: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """原子合并上下文字段，上下文不存在时先以默认值初始化"""
+        defaults = self._encode_fields(self._default_context())
+        updates = self._encode_fields(context_updates)
+        
+        args = [self.default_ttl, len(defaults)]
+        for field_map in (defaults, updates):
+            for key, value in field_map.items():
+                args.extend((key, value))
+        
+        flat = await redis_client.run_script(
+            _MERGE_CONTEXT_SCRIPT,
+            keys=[self._get_context_key(user_id, session_id)],
+            args=args
+        )
+        return self._decode_fields(dict(zip(flat[::2], flat[1::2])))
     
     async def get_context(self, user_id: str, session_id: str) -> Dict[str, Any]:
         """获取会话上下文"""
@@ -177,13 +383,18 @@ class SessionManager:
             redis = await self._get_redis()
             context_key = self._get_context_key(user_id, session_id)
             
-            context_raw = await redis.get(context_key)
+            try:
+                context_raw = await redis.hgetall(context_key)
+            except ResponseError:
+                # 兼容旧版本以JSON字符串存储的上下文
+                legacy_raw = await redis.get(context_key)
+                return json.loads(legacy_raw) if legacy_raw else {}
+            
             if not context_raw:
                 # 如果上下文不存在，创建默认上下文
-                await self._initialize_context(user_id, session_id)
-                context_raw = await redis.get(context_key)
+                return await self._merge_context(user_id, session_id, {})
             
-            return json.loads(context_raw) if context_raw else {}
+            return self._decode_fields(context_raw)
             
         except Exception as e:
             logger.error(f"获取上下文失败: {e}")
@@ -195,24 +406,12 @@ class SessionManager:
         session_id: str, 
         context_updates: Dict[str, Any]
     ) -> None:
-        """更新会话上下文"""
+        """更新会话上下文（按字段合并，并发更新不会互相覆盖）"""
         try:
-            redis = await self._get_redis()
-            context_key = self._get_context_key(user_id, session_id)
-            
-            # 获取当前上下文
-            current_context = await self.get_context(user_id, session_id)
-            
-            # 合并更新
-            current_context.update(context_updates)
-            current_context["updated_at"] = datetime.utcnow().isoformat()
-            
-            # 保存更新后的上下文
-            await redis.set(
-                context_key,
-                json.dumps(current_context),
-                ex=self.default_ttl
-            )
+            await self._merge_context(user_id, session_id, {
+                **context_updates,
+                "updated_at": datetime.utcnow().isoformat()
+            })
             
         except Exception as e:
             logger.error(f"更新上下文失败: {e}")
@@ -225,11 +424,8 @@ class SessionManager:
         content: str,
         metadata: Optional[Dict[str, Any]] = None
     ) -> None:
-        """添加消息到历史记录"""
+        """添加消息到历史记录，超过上限时将最旧的消息压缩进滚动摘要"""
         try:
-            redis = await self._get_redis()
-            history_key = self._get_history_key(user_id, session_id)
-            
             message = {
                 "role": role,
                 "content": content,
@@ -237,32 +433,107 @@ class SessionManager:
                 "metadata": metadata or {}
             }
             
-            # 添加到历史记录列表
-            await redis.lpush(history_key, json.dumps(message))
-            await redis.expire(history_key, self.default_ttl)
+            # 追加消息、刷新TTL、更新会话消息计数并执行上限裁剪（一次往返，原子执行）
+            compacted = await redis_client.run_script(
+                _APPEND_MESSAGE_SCRIPT,
+                keys=[
+                    self._get_history_key(user_id, session_id),
+                    self._get_session_key(user_id, session_id),
+                    self._get_history_meta_key(user_id, session_id)
+                ],
+                args=[
+                    json.dumps(message),
+                    self.default_ttl,
+                    self.max_history_messages,
+                    self.max_history_bytes,
+                    int(self.max_history_messages * _COMPACTION_TARGET_RATIO),
+                    int(self.max_history_bytes * _COMPACTION_TARGET_RATIO)
+                ]
+            )
             
-            # 更新会话消息计数
-            session_key = self._get_session_key(user_id, session_id)
-            await redis.hincrby(session_key, "message_count", 1)
+            if compacted:
+                await self._compact_history(user_id, session_id, compacted)
             
         except Exception as e:
             logger.error(f"添加历史消息失败: {e}")
     
+    async def _compact_history(
+        self, 
+        user_id: str, 
+        session_id: str, 
+        compacted: List[str]
+    ) -> None:
+        """将被裁剪的消息合并进滚动摘要"""
+        messages = []
+        for msg_raw in compacted:
+            try:
+                messages.append(json.loads(msg_raw))
+            except json.JSONDecodeError:
+                continue
+        
+        redis = await self._get_redis()
+        meta_key = self._get_history_meta_key(user_id, session_id)
+        
+        for _ in range(_SUMMARY_MAX_RETRIES):
+            previous_summary, version = await redis.hmget(meta_key, "summary", "summary_version")
+            
+            summary = self.summarizer(previous_summary, messages)
+            if inspect.isawaitable(summary):
+                summary = await summary
+            
+            updated = await redis_client.run_script(
+                _UPDATE_SUMMARY_SCRIPT,
+                keys=[meta_key],
+                args=[version or "0", summary, len(compacted), self.default_ttl]
+            )
+            if updated:
+                logger.debug(f"压缩历史消息 {len(compacted)} 条 - 会话: {session_id}")
+                return
+        
+        logger.warning(f"历史摘要更新冲突，放弃本次压缩 - 会话: {session_id}")
+    
     async def get_message_history(
         self,
         user_id: str,
         session_id: str,
-        limit: int = 50
+        limit: int = 50,
+        include_summary: bool = True
     ) -> List[Dict[str, Any]]:
-        """获取消息历史记录"""
+        """
+        获取消息历史记录
+        
+        Args:
+            user_id: 用户ID
+            session_id: 会话ID
+            limit: 返回最近消息的数量
+            include_summary: 存在滚动摘要时是否作为第一条（system）消息返回
+            
+        Returns:
+            按时间顺序排列的消息列表
+        """
         try:
             redis = await self._get_redis()
             history_key = self._get_history_key(user_id, session_id)
+            meta_key = self._get_history_meta_key(user_id, session_id)
             
-            # 获取最近的消息（Redis列表是LIFO，所以需要反转）
-            messages_raw = await redis.lrange(history_key, 0, limit - 1)
+            # 获取最近的消息和摘要（Redis列表是LIFO，所以需要反转）
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.lrange(history_key, 0, limit - 1)
+                pipe.hmget(meta_key, "summary", "compacted_messages")
+                messages_raw, (summary, compacted_messages) = await pipe.execute()
             
             messages = []
+            if include_summary and summary:
+                messages.append({
+                    "role": "system",
+                    "content": summary,
+                    "timestamp": None,
+                    "metadata": {
+                        "summary": True,
+                        "compacted_messages": int(compacted_messages or 0)
+                    }
+                })
+            
             for msg_raw in reversed(messages_raw):
                 try:
                     message = json.loads(msg_raw)
@@ -284,50 +555,58 @@ class SessionManager:
             session_key = self._get_session_key(user_id, session_id)
             
             # 更新会话状态
-            await redis.hset(session_key, "status", "closed")
-            await redis.hset(session_key, "closed_at", datetime.utcnow().isoformat())
+            await redis.hset(session_key, mapping={
+                "status": "closed",
+                "closed_at": datetime.utcnow().isoformat()
+            })
             
             logger.info(f"会话已关闭 - 用户: {user_id}, 会话: {session_id}")
             
         except Exception as e:
             logger.error(f"关闭会话失败: {e}")
     
-    async def cleanup_expired_sessions(self) -> int:
-        """清理过期会话"""
-        try:
-            redis = await self._get_redis()
-            
-            # 查找所有会话键
-            pattern = f"{self._session_prefix}:*"
-            keys = await redis.keys(pattern)
+    async def cleanup_expired_sessions(
+        self, 
+        max_idle: timedelta = timedelta(days=1), 
+        batch_size: int = 500
+    ) -> int:
+        """
+        清理过期会话
+        
+        按活跃索引分批删除超过 max_idle 未活跃的会话，不遍历键空间。
+        
+        Args:
+            max_idle: 最长空闲时间
+            batch_size: 每批删除的会话数量
             
+        Returns:
+            清理的会话数量
+        """
+        try:
+            threshold = time.time() - max_idle.total_seconds()
             cleaned_count = 0
-            expired_threshold = datetime.utcnow() - timedelta(days=1)
             
-            for key in keys:
-                try:
-                    session_data = await redis.hgetall(key)
-                    if not session_data:
-                        continue
-                    
-                    last_active = session_data.get("last_active")
-                    if last_active:
-                        last_active_dt = datetime.fromisoformat(last_active.replace("Z", "+00:00"))
-                        
-                        if last_active_dt < expired_threshold:
-                            # 删除相关的所有键
-                            parts = key.split(":")
-                            if len(parts) >= 3:
-                                user_id, session_id = parts[1], parts[2]
-                                context_key = self._get_context_key(user_id, session_id)
-                                history_key = self._get_history_key(user_id, session_id)
-                                
-                                await redis.delete(key, context_key, history_key)
-                                cleaned_count += 1
-                                
-                except Exception as e:
-                    logger.error(f"清理会话失败 {key}: {e}")
-                    continue
+            while True:
+                removed = await redis_client.run_script(
+                    _CLEANUP_SESSIONS_SCRIPT,
+                    keys=[self._activity_index_key],
+                    args=[
+                        threshold,
+                        batch_size,
+                        self._user_index_prefix,
+                        self._session_prefix,
+                        self._context_prefix,
+                        self._history_prefix,
+                        self._history_meta_prefix
+                    ]
+                )
+                cleaned_count += removed
+                
+                if removed < batch_size:
+                    break
+                
+                # 批次之间让出事件循环
+                await asyncio.sleep(0)
             
             logger.info(f"清理了 {cleaned_count} 个过期会话")
             return cleaned_count
@@ -336,37 +615,73 @@ class SessionManager:
             logger.error(f"会话清理失败: {e}")
             return 0
     
-    async def get_user_sessions(self, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
-        """获取用户的所有会话"""
+    async def get_user_sessions(
+        self, 
+        user_id: str, 
+        limit: int = 20, 
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        获取用户的会话列表（按最后活跃时间倒序分页）
+        
+        Args:
+            user_id: 用户ID
+            limit: 返回数量
+            offset: 偏移量
+            
+        Returns:
+            会话数据列表
+        """
         try:
             redis = await self._get_redis()
-            pattern = f"{self._session_prefix}:{user_id}:*"
-            keys = await redis.keys(pattern)
+            user_index_key = self._get_user_index_key(user_id)
+            
+            session_ids = await redis.zrevrange(user_index_key, offset, offset + limit - 1)
+            if not session_ids:
+                return []
+            
+            async with redis.pipeline(transaction=False) as pipe:
+                for session_id in session_ids:
+                    pipe.hgetall(self._get_session_key(user_id, session_id))
+                results = await pipe.execute()
             
             sessions = []
-            for key in keys[:limit]:
-                session_data = await redis.hgetall(key)
-                if session_data:
-                    # 反序列化数据
-                    session = {}
-                    for k, v in session_data.items():
-                        try:
-                            session[k] = json.loads(v)
-                        except (json.JSONDecodeError, TypeError):
-                            session[k] = v
-                    sessions.append(session)
-            
-            # 按最后活跃时间排序
-            sessions.sort(
-                key=lambda x: x.get("last_active", ""), 
-                reverse=True
-            )
+            stale_ids = []
+            for session_id, session_data in zip(session_ids, results):
+                if not session_data:
+                    # 会话已按TTL过期，顺便清理索引
+                    stale_ids.append(session_id)
+                    continue
+                
+                # 反序列化数据
+                session = {}
+                for k, v in session_data.items():
+                    try:
+                        session[k] = json.loads(v)
+                    except (json.JSONDecodeError, TypeError):
+                        session[k] = v
+                sessions.append(session)
+            
+            if stale_ids:
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.zrem(user_index_key, *stale_ids)
+                    pipe.zrem(self._activity_index_key, *[f"{user_id}:{sid}" for sid in stale_ids])
+                    await pipe.execute()
             
             return sessions
             
         except Exception as e:
             logger.error(f"获取用户会话失败: {e}")
             return []
+    
+    async def count_user_sessions(self, user_id: str) -> int:
+        """获取用户会话数量"""
+        try:
+            redis = await self._get_redis()
+            return await redis.zcard(self._get_user_index_key(user_id))
+        except Exception as e:
+            logger.error(f"获取用户会话数量失败: {e}")
+            return 0
 
 
 # 全局会话管理器实例
@@ -1,59 +1,306 @@
 """SSE（Server-Sent Events）服务实现."""
 
 import asyncio
-import json
+import random
 import uuid
 from datetime import datetime
-from typing import Any, AsyncGenerator, Dict, Optional, Set
-from collections import defaultdict
+from typing import Any, AsyncGenerator, Deque, Dict, List, Optional, Set, Tuple
+from collections import defaultdict, deque
 
 from fastapi import Request
+from prometheus_client import Counter, Gauge, Histogram
 from sse_starlette.sse import EventSourceResponse
 
+from app.config import settings
 from app.core.logging import get_logger
-from app.utils.redis_client import redis_client
+from app.services.sse_converter import SSEConverter
+from app.utils.redis_client import get_redis_client, redis_client
+from app.utils.serialization import JSONDecodeError, dumps, loads
 
 logger = get_logger(__name__)
 
+# SSE队列指标
+sse_queued_messages = Gauge(
+    'sse_queued_messages',
+    'Messages waiting in SSE connection queues'
+)
+
+sse_dropped_messages = Counter(
+    'sse_dropped_messages_total',
+    'Messages dropped because an SSE connection queue was full',
+    ['policy']
+)
+
+sse_slow_consumer_disconnects = Counter(
+    'sse_slow_consumer_disconnects_total',
+    'SSE connections closed because their queue overflowed'
+)
+
+sse_batch_size = Histogram(
+    'sse_write_batch_messages',
+    'Messages written to the client in one send',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+sse_replayed_events = Counter(
+    'sse_replayed_events_total',
+    'Events replayed to reconnecting SSE clients'
+)
+
+sse_replay_incomplete = Counter(
+    'sse_replay_incomplete_total',
+    'Reconnects whose Last-Event-ID gap could not be replayed'
+)
+
+
+# 事件写入：追加到用户（或广播）事件流、按长度和保留时间裁剪，并发布到频道，一次往返。
+# 事件ID（毫秒时间戳-序号）由所有事件流共用的时钟分配，而不是由各流的XADD自动生成：
+# 用户流和广播流的ID全局唯一且单调递增，补发时可以用同一个 Last-Event-ID 读取两个流。
+# 发布的消息为 {"event_id": 事件ID, "payload": 消息JSON}，消息JSON原样嵌入，不做拼接。
+# KEYS[1]=事件流 KEYS[2]=事件ID时钟; ARGV[1]=频道 ARGV[2]=消息JSON ARGV[3]=最大长度 ARGV[4]=保留毫秒
+# 返回事件ID
+_PUBLISH_EVENT_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local retention = tonumber(ARGV[4])
+
+-- 同一毫秒内（或服务器时钟回拨时）沿用上一个时间戳并递增序号
+local ms, seq = now, 0
+local last = redis.call("HMGET", KEYS[2], "ms", "seq")
+if last[1] and tonumber(last[1]) >= now then
+    ms, seq = tonumber(last[1]), tonumber(last[2]) + 1
+end
+redis.call("HSET", KEYS[2], "ms", string.format("%d", ms), "seq", seq)
+
+local id = redis.call(
+    "XADD", KEYS[1], "MAXLEN", ARGV[3], string.format("%d-%d", ms, seq), "data", ARGV[2]
+)
+redis.call("XTRIM", KEYS[1], "MINID", string.format("%d", now - retention))
+redis.call("PEXPIRE", KEYS[1], retention)
+-- 事件ID只含数字和"-"，无需转义
+redis.call("PUBLISH", ARGV[1], '{"event_id": "' .. id .. '", "payload": ' .. ARGV[2] .. '}')
+return id
+"""
+
+# 事件ID时钟（所有事件流共用）
+_EVENT_CLOCK_KEY = "sse:events:clock"
+
+
+def _event_id_key(event_id: str) -> Optional[Tuple[int, int]]:
+    """把事件ID解析为可比较的 (毫秒, 序号)，格式不合法时返回None."""
+    try:
+        ms, _, seq = event_id.partition("-")
+        return int(ms), int(seq or 0)
+    except (AttributeError, ValueError):
+        return None
+
 
 class SSEConnection:
-    """SSE连接管理."""
+    """
+    SSE连接管理.
+    
+    待发送消息保存在有界队列中，队列满时按溢出策略处理：
+    - drop_oldest：丢弃最早的消息；
+    - coalesce：丢弃队列中同类型（或相同 ``coalesce_key``）的最早消息，没有则丢弃最早的消息；
+    - disconnect：断开连接，由客户端重连。
+    """
+    
+    OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
     
-    def __init__(self, connection_id: str, user_id: int, session_id: str):
+    def __init__(
+        self,
+        connection_id: str,
+        user_id: int,
+        session_id: str,
+        max_queue_size: Optional[int] = None,
+        overflow_policy: Optional[str] = None
+    ):
         """初始化SSE连接."""
+        overflow_policy = overflow_policy or settings.SSE_OVERFLOW_POLICY
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unsupported SSE overflow policy: {overflow_policy}")
+        
         self.connection_id = connection_id
         self.user_id = user_id
         self.session_id = session_id
-        self.queue: asyncio.Queue = asyncio.Queue()
+        self.max_queue_size = max_queue_size or settings.SSE_QUEUE_MAX_SIZE
+        self.overflow_policy = overflow_policy
+        self.queue: Deque[Dict[str, Any]] = deque()
+        self.dropped = 0
         self.connected_at = datetime.utcnow()
         self.last_heartbeat = datetime.utcnow()
         self.is_active = True
+        # Redis注册信息所在的键，断开时直接HDEL
+        self.registry_key: Optional[str] = None
+        # 心跳时间轮中的槽位
+        self.heartbeat_slot: Optional[int] = None
+        # 有新消息或连接关闭时置位，写入端只在此时被唤醒
+        self._wakeup = asyncio.Event()
+    
+    @property
+    def queue_depth(self) -> int:
+        """当前待发送消息数."""
+        return len(self.queue)
     
     async def send_message(self, message: Dict[str, Any]) -> None:
         """发送消息到队列."""
+        self.put_message(message)
+    
+    def put_message(self, message: Dict[str, Any]) -> bool:
+        """消息入队（不阻塞），返回是否入队."""
+        if not self.is_active:
+            return False
+        
+        if len(self.queue) >= self.max_queue_size:
+            if self.overflow_policy == "disconnect":
+                sse_slow_consumer_disconnects.inc()
+                logger.warning(
+                    "SSE queue overflow, disconnecting slow consumer",
+                    connection_id=self.connection_id,
+                    user_id=self.user_id
+                )
+                self._close()
+                return False
+            
+            self._drop_for(message)
+        
+        self.queue.append(message)
+        sse_queued_messages.inc()
+        self._wakeup.set()
+        return True
+    
+    def _drop_for(self, message: Dict[str, Any]) -> None:
+        """队列已满时为新消息腾出一个位置."""
+        index = 0
+        if self.overflow_policy == "coalesce":
+            key = self._coalesce_key(message)
+            for i, queued in enumerate(self.queue):
+                if self._coalesce_key(queued) == key:
+                    index = i
+                    break
+        
+        del self.queue[index]
+        self.dropped += 1
+        sse_queued_messages.dec()
+        sse_dropped_messages.labels(policy=self.overflow_policy).inc()
+    
+    @staticmethod
+    def _coalesce_key(message: Dict[str, Any]) -> Any:
+        """消息合并键."""
+        return message.get("coalesce_key") or message.get("type")
+    
+    async def drain(self) -> List[Dict[str, Any]]:
+        """等待并取出队列中的全部消息，连接关闭时返回空列表."""
+        while self.is_active and not self.queue:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        
+        if not self.is_active:
+            return []
+        
+        messages = list(self.queue)
+        self.queue.clear()
+        sse_queued_messages.dec(len(messages))
+        sse_batch_size.observe(len(messages))
+        return messages
+    
+    def insert_replay(self, messages: List[Dict[str, Any]]) -> None:
+        """
+        把补发的消息插入到队列中实时消息之前.
+        
+        队首的无ID消息（如连接成功消息）保持在最前；补发期间已经到达的实时消息中，
+        ID不大于最后一条补发消息的视为重复并丢弃。
+        """
+        if not messages or not self.is_active:
+            return
+        
+        before = len(self.queue)
+        head = []
+        while self.queue and "event_id" not in self.queue[0]:
+            head.append(self.queue.popleft())
+        
+        last_key = _event_id_key(messages[-1]["event_id"])
+        live = [
+            m for m in self.queue
+            if "event_id" not in m or _event_id_key(m["event_id"]) > last_key
+        ]
+        
+        self.queue = deque(head + messages + live)
+        while len(self.queue) > self.max_queue_size:
+            self.queue.popleft()
+            self.dropped += 1
+            sse_dropped_messages.labels(policy=self.overflow_policy).inc()
+        
+        sse_queued_messages.inc(len(self.queue) - before)
+        self._wakeup.set()
+    
+    def _close(self) -> None:
+        """标记关闭并唤醒写入端."""
         if self.is_active:
-            await self.queue.put(message)
+            self.is_active = False
+            sse_queued_messages.dec(len(self.queue))
+            self.queue.clear()
+        self._wakeup.set()
     
     async def disconnect(self) -> None:
         """断开连接."""
-        self.is_active = False
-        # 发送结束信号
-        await self.queue.put(None)
+        self._close()
 
 
 class SSEManager:
-    """SSE连接管理器."""
+    """
+    SSE连接管理器.
+    
+    多节点部署时通过Redis发布订阅转发消息：每个用户一个频道，
+    节点只订阅本地持有连接的用户，发送消息只需一次PUBLISH，与节点数量无关。
+    
+    心跳使用哈希时间轮：连接随机分配到 ``SSE_HEARTBEAT_WHEEL_SLOTS`` 个槽中，
+    每次只处理一个槽，心跳负载均匀分布在整个间隔内，没有周期性尖峰。
+    """
+    
+    USER_CHANNEL_PREFIX = "sse:user:"
+    BROADCAST_CHANNEL = "sse:broadcast"
+    # 处理一个槽时每发送多少个心跳让出一次事件循环
+    HEARTBEAT_YIELD_EVERY = 256
     
-    def __init__(self):
-        """初始化SSE管理器."""
+    def __init__(
+        self,
+        heartbeat_interval: Optional[float] = None,
+        heartbeat_slots: Optional[int] = None
+    ):
+        """
+        初始化SSE管理器.
+        
+        Args:
+            heartbeat_interval: 每个连接的心跳间隔（秒）
+            heartbeat_slots: 心跳时间轮槽数
+        """
         # 连接池：user_id -> Set[SSEConnection]
         self._connections: Dict[int, Set[SSEConnection]] = defaultdict(set)
         # 连接映射：connection_id -> SSEConnection
         self._connection_map: Dict[str, SSEConnection] = {}
+        # 心跳时间轮：每个槽保存一组connection_id
+        self.heartbeat_interval = heartbeat_interval or settings.SSE_HEARTBEAT_INTERVAL
+        self._wheel: List[Set[str]] = [
+            set() for _ in range(heartbeat_slots or settings.SSE_HEARTBEAT_WHEEL_SLOTS)
+        ]
+        self._tick = 0
         # 心跳任务
         self._heartbeat_task: Optional[asyncio.Task] = None
         # 标记是否已初始化
         self._initialized = False
+        # 待批量清理的Redis注册信息：registry_key -> [connection_id]
+        self._pending_unregister: Dict[str, List[str]] = defaultdict(list)
+        self._cleanup_task: Optional[asyncio.Task] = None
+        # 节点标识，用于忽略自己发布的消息
+        self.node_id = uuid.uuid4().hex
+        # 发布订阅监听任务及当前订阅
+        self._backplane_task: Optional[asyncio.Task] = None
+        self._pubsub = None
+        self._subscribed_users: Set[int] = set()
     
     async def _start_heartbeat(self) -> None:
         """启动心跳任务."""
@@ -63,45 +310,295 @@ class SSEManager:
                 self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
     
     async def _heartbeat_loop(self) -> None:
-        """心跳循环."""
+        """心跳循环：按固定节拍转动时间轮，每次处理一个槽."""
+        loop = asyncio.get_running_loop()
+        tick_interval = self.heartbeat_interval / len(self._wheel)
+        next_tick = loop.time()
+        
         while True:
             try:
-                await asyncio.sleep(30)  # 每30秒发送一次心跳
+                next_tick += tick_interval
+                await asyncio.sleep(max(0.0, next_tick - loop.time()))
                 
-                # 发送心跳到所有活跃连接
-                for connection in list(self._connection_map.values()):
-                    if connection.is_active:
-                        await connection.send_message({
-                            "type": "heartbeat",
-                            "timestamp": datetime.utcnow().isoformat()
-                        })
-                        connection.last_heartbeat = datetime.utcnow()
-                    else:
-                        # 清理非活跃连接
-                        await self.disconnect(connection.connection_id)
+                self._tick = (self._tick + 1) % len(self._wheel)
+                await self._heartbeat_slot(self._wheel[self._tick])
                 
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 logger.error(f"Heartbeat error: {e}")
     
+    async def _heartbeat_slot(self, slot: Set[str]) -> None:
+        """向一个槽中的连接发送心跳，并清理非活跃连接."""
+        now = datetime.utcnow()
+        message = {
+            "type": "heartbeat",
+            "timestamp": now.isoformat()
+        }
+        inactive = []
+        
+        for count, connection_id in enumerate(list(slot), 1):
+            connection = self._connection_map.get(connection_id)
+            if connection is None or not connection.is_active:
+                inactive.append(connection_id)
+                continue
+            
+            connection.put_message(message)
+            connection.last_heartbeat = now
+            
+            if count % self.HEARTBEAT_YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+        
+        for connection_id in inactive:
+            slot.discard(connection_id)
+            await self.disconnect(connection_id)
+    
+    def _user_channel(self, user_id: int) -> str:
+        """用户消息频道."""
+        return f"{self.USER_CHANNEL_PREFIX}{user_id}"
+    
+    async def start_backplane(self) -> None:
+        """启动跨节点消息监听任务."""
+        if not self._backplane_task or self._backplane_task.done():
+            self._backplane_task = asyncio.create_task(self._backplane_loop())
+    
+    async def stop_backplane(self) -> None:
+        """停止跨节点消息监听任务."""
+        if self._backplane_task:
+            self._backplane_task.cancel()
+            try:
+                await self._backplane_task
+            except asyncio.CancelledError:
+                pass
+            self._backplane_task = None
+    
+    async def close(self) -> None:
+        """停止后台任务并清理待删除的Redis注册信息."""
+        await self.stop_backplane()
+        
+        for task in (self._heartbeat_task, self._cleanup_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._heartbeat_task = None
+        self._cleanup_task = None
+        self._initialized = False
+        
+        await self.flush_pending_cleanup()
+    
+    async def _backplane_loop(self) -> None:
+        """订阅广播频道和本地用户频道，断线后自动重连并重新订阅."""
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                users = set(self._connections)
+                await pubsub.subscribe(
+                    self.BROADCAST_CHANNEL,
+                    *[self._user_channel(user_id) for user_id in users]
+                )
+                self._subscribed_users = users
+                self._pubsub = pubsub
+                
+                # 订阅期间新建立连接的用户
+                missing = set(self._connections) - users
+                for user_id in missing:
+                    await self._subscribe_user(user_id)
+                
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        await self._handle_backplane_message(message["data"])
+                
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"SSE backplane listener error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                self._pubsub = None
+                self._subscribed_users = set()
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+    
+    async def _subscribe_user(self, user_id: int) -> None:
+        """订阅用户频道（本节点持有该用户的第一个连接时）."""
+        if self._pubsub is None or user_id in self._subscribed_users:
+            return
+        
+        self._subscribed_users.add(user_id)
+        try:
+            await self._pubsub.subscribe(self._user_channel(user_id))
+        except Exception as e:
+            self._subscribed_users.discard(user_id)
+            logger.error(f"Failed to subscribe SSE channel: {e}")
+    
+    async def _unsubscribe_user(self, user_id: int) -> None:
+        """取消订阅用户频道（本节点不再持有该用户的连接时）."""
+        if self._pubsub is None or user_id not in self._subscribed_users:
+            return
+        
+        self._subscribed_users.discard(user_id)
+        try:
+            await self._pubsub.unsubscribe(self._user_channel(user_id))
+        except Exception as e:
+            logger.error(f"Failed to unsubscribe SSE channel: {e}")
+    
+    async def _handle_backplane_message(self, raw_message: str) -> None:
+        """投递来自其他节点的消息."""
+        try:
+            envelope = loads(raw_message)
+            payload = envelope["payload"]
+            message = payload["message"]
+        except (JSONDecodeError, TypeError, KeyError):
+            logger.warning(f"Invalid SSE backplane message: {raw_message}")
+            return
+        
+        if payload.get("origin") == self.node_id:
+            return
+        
+        if envelope.get("event_id"):
+            message = {**message, "event_id": envelope["event_id"]}
+        
+        user_id = payload.get("user_id")
+        if user_id is None:
+            await self._deliver_all(message)
+        else:
+            await self._deliver_local(user_id, message, payload.get("session_id"))
+    
+    def _stream_key(self, user_id: Optional[int] = None) -> str:
+        """用户（或广播）事件流."""
+        return f"sse:events:{'broadcast' if user_id is None else user_id}"
+    
+    async def _publish(
+        self,
+        channel: str,
+        stream_key: str,
+        payload: Dict[str, Any]
+    ) -> Optional[str]:
+        """写入事件流并发布到其他节点，返回事件ID（失败时为None）."""
+        payload["origin"] = self.node_id
+        try:
+            return await redis_client.run_script(
+                _PUBLISH_EVENT_SCRIPT,
+                keys=[stream_key, _EVENT_CLOCK_KEY],
+                args=[
+                    channel,
+                    dumps(payload),
+                    settings.SSE_REPLAY_MAXLEN,
+                    settings.SSE_REPLAY_RETENTION * 1000
+                ]
+            )
+        except Exception as e:
+            logger.error(f"Failed to publish SSE message: {e}")
+            return None
+    
+    async def _read_replay(
+        self,
+        connection: SSEConnection,
+        last_event_id: str
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        读取 ``last_event_id`` 之后的用户事件和广播事件，按ID合并.
+        
+        Returns:
+            补发的消息列表；缺口已被裁剪或超出队列容量时返回None
+        """
+        last_key = _event_id_key(last_event_id)
+        if last_key is None:
+            logger.warning(f"Invalid Last-Event-ID: {last_event_id}")
+            return None
+        
+        # 补发不超过队列容量的一半，更大的缺口由客户端全量刷新
+        limit = connection.max_queue_size // 2
+        streams = (self._stream_key(connection.user_id), self._stream_key())
+        
+        redis = await get_redis_client()
+        async with redis.pipeline(transaction=False) as pipe:
+            for key in streams:
+                pipe.xrange(key, f"({last_key[0]}-{last_key[1]}", "+", count=limit + 1)
+                pipe.xrange(key, "-", "+", count=1)
+                pipe.xlen(key)
+            # 事件ID和写入时的裁剪都使用Redis服务器时间，这里用同一个时钟判断保留范围
+            pipe.time()
+            *results, (seconds, microseconds) = await pipe.execute()
+        
+        # 缺口超过保留时间，或流已达到长度上限且最早的事件晚于 last_event_id，视为部分事件已被裁剪
+        retention_start = seconds * 1000 + microseconds // 1000 - settings.SSE_REPLAY_RETENTION * 1000
+        if last_key[0] < retention_start:
+            return None
+        
+        events = []
+        for i in range(len(streams)):
+            entries, first, length = results[i * 3:i * 3 + 3]
+            if len(entries) > limit:
+                return None
+            if first and length >= settings.SSE_REPLAY_MAXLEN and _event_id_key(first[0][0]) > last_key:
+                return None
+            events.extend(entries)
+        
+        messages = []
+        for event_id, fields in sorted(events, key=lambda e: _event_id_key(e[0])):
+            payload = loads(fields["data"])
+            session_id = payload.get("session_id")
+            if session_id and session_id != connection.session_id:
+                continue
+            messages.append({**payload["message"], "event_id": event_id})
+        
+        if len(messages) > limit:
+            return None
+        return messages
+    
+    async def _replay(self, connection: SSEConnection, last_event_id: str) -> int:
+        """补发断线期间的事件，无法完整补发时通知客户端全量刷新."""
+        try:
+            messages = await self._read_replay(connection, last_event_id)
+        except Exception as e:
+            logger.error(f"Failed to read SSE replay: {e}")
+            messages = None
+        
+        if messages is None:
+            sse_replay_incomplete.inc()
+            await connection.send_message({
+                "type": "replay_incomplete",
+                "last_event_id": last_event_id,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+            return 0
+        
+        connection.insert_replay(messages)
+        sse_replayed_events.inc(len(messages))
+        return len(messages)
+    
     async def connect(
         self,
         user_id: int,
         session_id: str,
-        request: Request
+        request: Request,
+        last_event_id: Optional[str] = None
     ) -> SSEConnection:
-        """建立SSE连接."""
-        # 确保心跳任务已启动
+        """
+        建立SSE连接.
+        
+        带 ``last_event_id`` 重连时，先加入连接池开始接收实时消息，再补发缺口中的事件，
+        补发的事件排在实时消息之前，重复的实时消息被丢弃。
+        """
+        # 确保心跳任务和跨节点监听已启动
         await self._start_heartbeat()
+        await self.start_backplane()
         
         connection_id = str(uuid.uuid4())
         connection = SSEConnection(connection_id, user_id, session_id)
         
         # 添加到连接池
-        self._connections[user_id].add(connection)
-        self._connection_map[connection_id] = connection
+        if self._add_connection(connection):
+            await self._subscribe_user(user_id)
         
         # 记录到Redis（用于分布式环境）
-        await self._register_connection_redis(connection_id, user_id, session_id)
+        await self._register_connection_redis(connection)
         
         logger.info(
             f"SSE connection established",
@@ -120,8 +617,39 @@ class SSEManager:
             "timestamp": datetime.utcnow().isoformat()
         })
         
+        if last_event_id:
+            await self._replay(connection, last_event_id)
+        
         return connection
     
+    def _add_connection(self, connection: SSEConnection) -> bool:
+        """加入本地连接池和心跳时间轮，返回是否为该用户的第一个连接."""
+        first = connection.user_id not in self._connections
+        self._connections[connection.user_id].add(connection)
+        self._connection_map[connection.connection_id] = connection
+        
+        # 随机分配槽位，心跳在间隔内均匀分布
+        connection.heartbeat_slot = random.randrange(len(self._wheel))
+        self._wheel[connection.heartbeat_slot].add(connection.connection_id)
+        return first
+    
+    def _remove_connection(self, connection: SSEConnection) -> bool:
+        """从本地连接池和心跳时间轮移除，返回是否为该用户的最后一个连接."""
+        self._connection_map.pop(connection.connection_id, None)
+        if connection.heartbeat_slot is not None:
+            self._wheel[connection.heartbeat_slot].discard(connection.connection_id)
+        
+        connections = self._connections.get(connection.user_id)
+        if connections is None:
+            return False
+        
+        connections.discard(connection)
+        if connections:
+            return False
+        
+        del self._connections[connection.user_id]
+        return True
+    
     async def disconnect(self, connection_id: str) -> None:
         """断开SSE连接."""
         connection = self._connection_map.get(connection_id)
@@ -129,20 +657,14 @@ class SSEManager:
             return
         
         # 从连接池移除
-        if connection.user_id in self._connections:
-            self._connections[connection.user_id].discard(connection)
-            if not self._connections[connection.user_id]:
-                del self._connections[connection.user_id]
-        
-        # 从映射移除
-        if connection_id in self._connection_map:
-            del self._connection_map[connection_id]
+        if self._remove_connection(connection):
+            await self._unsubscribe_user(connection.user_id)
         
         # 断开连接
         await connection.disconnect()
         
-        # 从Redis移除
-        await self._unregister_connection_redis(connection_id)
+        # 从Redis移除（批量）
+        self._schedule_unregister(connection)
         
         logger.info(
             f"SSE connection closed",
@@ -158,7 +680,47 @@ class SSEManager:
         message: Dict[str, Any],
         session_id: Optional[str] = None
     ) -> int:
-        """发送消息给用户的所有连接或特定会话."""
+        """
+        发送消息给用户的所有连接或特定会话.
+        
+        消息先写入用户事件流并发布到用户频道（获得事件ID，供其他节点投递和重连补发），
+        再直接投递给本节点的连接。
+        
+        Returns:
+            本节点投递的连接数
+        """
+        event_id = await self._publish(
+            self._user_channel(user_id),
+            self._stream_key(user_id),
+            {"user_id": user_id, "session_id": session_id, "message": message}
+        )
+        if event_id:
+            message = {**message, "event_id": event_id}
+        
+        return await self._deliver_local(user_id, message, session_id)
+    
+    async def broadcast(self, message: Dict[str, Any]) -> int:
+        """
+        广播消息给所有节点的所有连接.
+        
+        Returns:
+            本节点投递的连接数
+        """
+        event_id = await self._publish(
+            self.BROADCAST_CHANNEL, self._stream_key(), {"message": message}
+        )
+        if event_id:
+            message = {**message, "event_id": event_id}
+        
+        return await self._deliver_all(message)
+    
+    async def _deliver_local(
+        self,
+        user_id: int,
+        message: Dict[str, Any],
+        session_id: Optional[str] = None
+    ) -> int:
+        """投递消息给本节点上用户的连接."""
         connections = self._connections.get(user_id, set())
         sent_count = 0
         
@@ -172,11 +734,11 @@ class SSEManager:
         
         return sent_count
     
-    async def broadcast(self, message: Dict[str, Any]) -> int:
-        """广播消息给所有连接."""
+    async def _deliver_all(self, message: Dict[str, Any]) -> int:
+        """投递消息给本节点的所有连接."""
         sent_count = 0
         
-        for connections in self._connections.values():
+        for connections in list(self._connections.values()):
             for connection in list(connections):
                 if connection.is_active:
                     await connection.send_message(message)
@@ -184,41 +746,37 @@ class SSEManager:
         
         return sent_count
     
+    @staticmethod
+    def _format_event(message: Dict[str, Any]) -> bytes:
+        """编码单条SSE消息（带事件ID时写入 id 字段，供客户端重连时回传）."""
+        return SSEConverter.encode_sse_event(
+            message.get("type", "message"), message, message.get("event_id")
+        )
+    
     async def stream_generator(
         self,
         connection: SSEConnection,
         request: Request
-    ) -> AsyncGenerator[str, None]:
-        """生成SSE事件流."""
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        生成SSE事件流.
+        
+        只在有新消息或连接关闭时唤醒；排队的多条消息合并为一次写入。
+        客户端断开由 EventSourceResponse 监听 ``http.disconnect`` 后取消本生成器，
+        不再轮询 ``request.is_disconnected()``。
+        """
         try:
             while connection.is_active:
-                # 检查客户端是否断开
-                if await request.is_disconnected():
+                messages = await connection.drain()
+                if not messages:
+                    # 连接已关闭
                     break
                 
-                try:
-                    # 从队列获取消息（超时1秒）
-                    message = await asyncio.wait_for(
-                        connection.queue.get(),
-                        timeout=1.0
-                    )
-                    
-                    if message is None:
-                        # 收到结束信号
-                        break
-                    
-                    # 格式化SSE消息
-                    event_type = message.get("type", "message")
-                    event_data = json.dumps(message, ensure_ascii=False)
-                    
-                    yield f"event: {event_type}\n"
-                    yield f"data: {event_data}\n"
-                    yield "\n"
-                    
-                except asyncio.TimeoutError:
-                    # 超时继续循环（用于检查断开连接）
-                    continue
+                # 逐条编码为bytes后一次拼接，EventSourceResponse 原样写出
+                yield b"".join([self._format_event(m) for m in messages])
                 
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(
                 f"SSE stream error",
@@ -229,40 +787,61 @@ class SSEManager:
             )
         
         finally:
-            # 确保断开连接
-            await self.disconnect(connection.connection_id)
+            # 确保断开连接（生成器被取消时清理也要完成）
+            await asyncio.shield(self.disconnect(connection.connection_id))
     
-    async def _register_connection_redis(
-        self,
-        connection_id: str,
-        user_id: int,
-        session_id: str
-    ) -> None:
+    async def _register_connection_redis(self, connection: SSEConnection) -> None:
         """在Redis中注册连接（用于分布式环境）."""
         try:
-            key = f"sse:connections:{user_id}"
-            value = json.dumps({
-                "connection_id": connection_id,
-                "session_id": session_id,
-                "connected_at": datetime.utcnow().isoformat()
+            key = f"sse:connections:{connection.user_id}"
+            value = dumps({
+                "connection_id": connection.connection_id,
+                "session_id": connection.session_id,
+                "connected_at": connection.connected_at.isoformat()
             })
             
-            await redis_client.hset(key, connection_id, value)
-            await redis_client.expire(key, 86400)  # 24小时过期
+            redis = await get_redis_client()
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hset(key, connection.connection_id, value)
+                pipe.expire(key, 86400)  # 24小时过期
+                await pipe.execute()
+            connection.registry_key = key
             
         except Exception as e:
             logger.error(f"Failed to register connection in Redis: {e}")
     
-    async def _unregister_connection_redis(self, connection_id: str) -> None:
-        """从Redis中注销连接."""
+    def _schedule_unregister(self, connection: SSEConnection) -> None:
+        """登记待清理的Redis注册信息，稍后批量删除."""
+        if not connection.registry_key:
+            return
+        
+        self._pending_unregister[connection.registry_key].append(connection.connection_id)
+        if not self._cleanup_task or self._cleanup_task.done():
+            self._cleanup_task = asyncio.create_task(self._delayed_cleanup())
+    
+    async def _delayed_cleanup(self) -> None:
+        """等待一小段时间收集更多断开的连接后批量清理."""
+        await asyncio.sleep(settings.SSE_CLEANUP_BATCH_DELAY)
+        await self.flush_pending_cleanup()
+    
+    async def flush_pending_cleanup(self) -> int:
+        """批量删除已断开连接的Redis注册信息（一次往返），返回删除的连接数."""
+        pending = self._pending_unregister
+        if not pending:
+            return 0
+        self._pending_unregister = defaultdict(list)
+        
         try:
-            # 查找并删除连接
-            pattern = "sse:connections:*"
-            async for key in redis_client.scan_iter(match=pattern):
-                await redis_client.hdel(key, connection_id)
+            redis = await get_redis_client()
+            async with redis.pipeline(transaction=False) as pipe:
+                for key, connection_ids in pending.items():
+                    pipe.hdel(key, *connection_ids)
+                await pipe.execute()
             
         except Exception as e:
-            logger.error(f"Failed to unregister connection from Redis: {e}")
+            logger.error(f"Failed to unregister connections from Redis: {e}")
+        
+        return sum(len(connection_ids) for connection_ids in pending.values())
     
     def get_connection_count(self, user_id: Optional[int] = None) -> int:
         """获取连接数."""
@@ -271,6 +850,16 @@ class SSEManager:
         
         return sum(len(conns) for conns in self._connections.values())
     
+    def get_queue_stats(self) -> Dict[str, int]:
+        """获取本节点连接队列统计."""
+        depths = [c.queue_depth for c in self._connection_map.values()]
+        return {
+            "connections": len(depths),
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "dropped_messages": sum(c.dropped for c in self._connection_map.values())
+        }
+    
     def get_active_users(self) -> Set[int]:
         """获取活跃用户ID集合."""
         return set(self._connections.keys())
@@ -2,11 +2,11 @@
 SSE事件转换器 - 将ADK事件转换为标准SSE格式
 """
 
-import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Union
 from enum import Enum
 
 from app.core.logging import get_logger
+from app.utils.serialization import dumps, dumps_bytes
 
 logger = get_logger(__name__)
 
@@ -23,43 +23,69 @@ class SSEEventType(str, Enum):
     DONE = "done"           # 完成事件
 
 
+# 预编码的事件头（"event: xxx\ndata: "），枚举成员与其字符串值均可命中
+_EVENT_HEADERS: Dict[Union[SSEEventType, str], bytes] = {
+    event_type.value: f"event: {event_type.value}\ndata: ".encode("utf-8")
+    for event_type in SSEEventType
+}
+
+
 class SSEConverter:
     """SSE事件转换器"""
     
     @staticmethod
-    def format_sse_event(
-        event_type: SSEEventType,
+    def encode_sse_event(
+        event_type: Union[SSEEventType, str],
         data: Dict[str, Any],
         event_id: Optional[str] = None
-    ) -> str:
+    ) -> bytes:
         """
-        格式化SSE事件
+        编码SSE事件为bytes
+        
+        事件头使用预编码的字节串，数据直接序列化为UTF-8 bytes，整个事件只拼接一次。
         
         Args:
-            event_type: 事件类型
+            event_type: 事件类型（枚举或自定义事件名）
             data: 事件数据
             event_id: 事件ID（可选）
             
         Returns:
-            格式化的SSE事件字符串
+            编码后的SSE事件
         """
         try:
-            # 构建SSE事件
-            sse_lines = []
+            header = _EVENT_HEADERS.get(event_type)
+            if header is None:
+                event_name = event_type.value if isinstance(event_type, SSEEventType) else event_type
+                header = f"event: {event_name}\ndata: ".encode("utf-8")
             
+            body = dumps_bytes(data)
             if event_id:
-                sse_lines.append(f"id: {event_id}")
-            
-            sse_lines.append(f"event: {event_type.value}")
-            sse_lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
-            sse_lines.append("")  # 空行表示事件结束
-            
-            return "\n".join(sse_lines) + "\n"
+                return b"".join((b"id: ", str(event_id).encode("utf-8"), b"\n", header, body, b"\n\n"))
+            return b"".join((header, body, b"\n\n"))
             
         except Exception as e:
             logger.error(f"SSE事件格式化失败: {e}")
             error_data = {"error": f"SSE格式化错误: {str(e)}"}
-            return f"event: error\ndata: {json.dumps(error_data)}\n\n"
+            return _EVENT_HEADERS[SSEEventType.ERROR] + dumps_bytes(error_data) + b"\n\n"
+    
+    @staticmethod
+    def format_sse_event(
+        event_type: Union[SSEEventType, str],
+        data: Dict[str, Any],
+        event_id: Optional[str] = None
+    ) -> str:
+        """
+        格式化SSE事件
+        
+        Args:
+            event_type: 事件类型（枚举或自定义事件名）
+            data: 事件数据
+            event_id: 事件ID（可选）
+            
+        Returns:
+            格式化的SSE事件字符串
+        """
+        return SSEConverter.encode_sse_event(event_type, data, event_id).decode("utf-8")
     
     @staticmethod
     def convert_adk_event(adk_event: Any) -> Dict[str, Any]:
@@ -201,7 +227,7 @@ class SSEConverter:
             "type": "heartbeat",
             "timestamp": SSEConverter._get_timestamp()
         }
-        return f"data: {json.dumps(data)}\n\n"
+        return f"data: {dumps(data)}\n\n"
     
     @staticmethod
     def _get_timestamp() -> str:
@@ -0,0 +1,187 @@
+"""缓存值编解码.
+
+编码格式: 1字节头 + 负载。头的最高位恒为1，bit 4-6 为格式版本，bit 0-3 为压缩算法::
+
+    1 vvv cccc
+    │  │   └── 压缩算法ID（0=不压缩, 1=zstd, 2=lz4, 3=zlib）
+    │  └────── 格式版本（当前为1：msgpack）
+    └───────── 恒为1
+
+旧的JSON条目以ASCII字符开头（最高位为0），读取时按JSON解码，新旧条目可在滚动发布期间共存。
+zstd/lz4 为可选依赖，未安装时使用标准库 zlib；读到本机不支持的算法时抛出 CacheCodecError，
+调用方按未命中处理。
+"""
+
+import time
+import zlib
+from typing import Any, Callable, Dict, NamedTuple, Optional, Union
+
+import msgpack
+from prometheus_client import Histogram
+
+from app.config import settings
+from app.core.logging import get_logger
+from app.utils.serialization import json_default, loads
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 取决于部署环境
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - 取决于部署环境
+    lz4_frame = None
+
+logger = get_logger(__name__)
+
+cache_codec_encode_seconds = Histogram(
+    'cache_codec_encode_seconds',
+    'Time spent encoding cache values',
+    ['prefix'],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+)
+
+cache_codec_decode_seconds = Histogram(
+    'cache_codec_decode_seconds',
+    'Time spent decoding cache values',
+    ['prefix'],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+)
+
+cache_codec_compression_ratio = Histogram(
+    'cache_codec_compression_ratio',
+    'Serialized size divided by stored size for cache values',
+    ['prefix'],
+    buckets=(1, 1.25, 1.5, 2, 3, 4, 6, 10)
+)
+
+FORMAT_VERSION = 1
+
+_HEADER_FLAG = 0x80
+
+
+class CacheCodecError(ValueError):
+    """缓存值无法解码."""
+
+
+class Compressor(NamedTuple):
+    """压缩算法."""
+    codec_id: int
+    name: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+def _available_compressors() -> Dict[str, Compressor]:
+    """已安装的压缩算法."""
+    compressors = {
+        "zlib": Compressor(3, "zlib", lambda data: zlib.compress(data, 6), zlib.decompress),
+    }
+    if lz4_frame is not None:
+        compressors["lz4"] = Compressor(2, "lz4", lz4_frame.compress, lz4_frame.decompress)
+    if zstandard is not None:
+        compressors["zstd"] = Compressor(
+            1,
+            "zstd",
+            zstandard.ZstdCompressor(level=3).compress,
+            zstandard.ZstdDecompressor().decompress
+        )
+    return compressors
+
+
+COMPRESSORS = _available_compressors()
+
+_COMPRESSORS_BY_ID = {c.codec_id: c for c in COMPRESSORS.values()}
+
+
+def _resolve_compressor(name: str) -> Optional[Compressor]:
+    """按配置名称选择压缩算法，未安装时回退."""
+    if name == "none":
+        return None
+    if name != "auto" and name in COMPRESSORS:
+        return COMPRESSORS[name]
+    if name not in ("auto", "zstd", "lz4", "zlib"):
+        logger.warning(f"Unknown cache compression: {name}")
+    for fallback in ("zstd", "lz4", "zlib"):
+        if fallback in COMPRESSORS:
+            return COMPRESSORS[fallback]
+    return None
+
+
+def key_prefix(key: str) -> str:
+    """指标使用的键前缀（第一个冒号之前的部分）."""
+    return key.split(":", 1)[0]
+
+
+class CacheCodec:
+    """
+    msgpack + 可选压缩的缓存编解码器.
+
+    序列化结果不小于 ``threshold`` 字节时压缩，压缩后没有变小则保存原文。
+    """
+
+    def __init__(self, compression: Optional[str] = None, threshold: Optional[int] = None):
+        """
+        初始化编解码器.
+
+        Args:
+            compression: 压缩算法（auto/zstd/lz4/zlib/none），默认读取配置
+            threshold: 压缩阈值（字节），默认读取配置
+        """
+        self.compressor = _resolve_compressor(compression or settings.CACHE_COMPRESSION)
+        self.threshold = threshold if threshold is not None else settings.CACHE_COMPRESSION_THRESHOLD
+
+    def encode(self, value: Any, prefix: str = "default") -> bytes:
+        """编码缓存值."""
+        start = time.perf_counter()
+        payload = msgpack.packb(value, default=json_default, use_bin_type=True)
+        codec_id = 0
+        stored = payload
+
+        if self.compressor is not None and len(payload) >= self.threshold:
+            compressed = self.compressor.compress(payload)
+            if len(compressed) < len(payload):
+                codec_id = self.compressor.codec_id
+                stored = compressed
+
+        data = bytes((_HEADER_FLAG | FORMAT_VERSION << 4 | codec_id,)) + stored
+        cache_codec_encode_seconds.labels(prefix=prefix).observe(time.perf_counter() - start)
+        cache_codec_compression_ratio.labels(prefix=prefix).observe(len(payload) / len(stored))
+        return data
+
+    def decode(self, data: Union[bytes, str], prefix: str = "default") -> Any:
+        """解码缓存值（兼容旧的JSON条目）."""
+        start = time.perf_counter()
+
+        if isinstance(data, str) or not data or not data[0] & _HEADER_FLAG:
+            # 旧格式：JSON文本
+            try:
+                value = loads(data)
+            except ValueError as e:
+                raise CacheCodecError(f"invalid legacy cache value: {e}") from e
+        else:
+            header = data[0]
+            version = (header >> 4) & 0x07
+            codec_id = header & 0x0F
+            if version != FORMAT_VERSION:
+                raise CacheCodecError(f"unsupported cache format version: {version}")
+
+            payload = data[1:]
+            compressor = _COMPRESSORS_BY_ID.get(codec_id)
+            if codec_id and compressor is None:
+                raise CacheCodecError(f"cache compression {codec_id} is not available")
+
+            try:
+                if compressor is not None:
+                    payload = compressor.decompress(payload)
+                value = msgpack.unpackb(payload, raw=False, strict_map_key=False)
+            except Exception as e:
+                raise CacheCodecError(f"invalid cache value: {e}") from e
+
+        cache_codec_decode_seconds.labels(prefix=prefix).observe(time.perf_counter() - start)
+        return value
+
+
+# 全局编解码器实例
+cache_codec = CacheCodec()
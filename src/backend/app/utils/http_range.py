@@ -0,0 +1,115 @@
+"""HTTP条件请求和范围请求工具（RFC 9110）."""
+
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, Tuple
+
+
+class RangeNotSatisfiable(ValueError):
+    """请求的范围超出资源大小."""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析 Range 请求头.
+
+    只支持单个字节范围；请求头缺失、格式无法识别或包含多个范围时返回 None（返回完整内容）。
+
+    Args:
+        header: Range 请求头
+        size: 资源大小
+
+    Returns:
+        (start, end)，end 包含在范围内
+
+    Raises:
+        RangeNotSatisfiable: 范围与资源没有交集
+    """
+    if not header:
+        return None
+
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+
+    first, last = first.strip(), last.strip()
+    if not (first or last) or any(part and not part.isdigit() for part in (first, last)):
+        return None
+
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+        if last and end < start:
+            return None
+    else:
+        # 后缀范围：最后 N 个字节
+        suffix = int(last)
+        if suffix == 0:
+            raise RangeNotSatisfiable(header)
+        start, end = max(size - suffix, 0), size - 1
+
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+
+    return start, min(end, size - 1)
+
+
+def format_http_date(value: datetime) -> str:
+    """格式化为 HTTP 日期."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _parse_http_date(value: str) -> Optional[datetime]:
+    """解析 HTTP 日期，无法解析时返回 None."""
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否匹配（弱比较），匹配时应返回 304."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def if_range_matches(
+    if_range: Optional[str],
+    etag: str,
+    last_modified: Optional[datetime] = None
+) -> bool:
+    """
+    If-Range 是否允许返回部分内容.
+
+    If-Range 为实体标签时要求强匹配，为日期时要求与最后修改时间一致；
+    不匹配时应忽略 Range 返回完整内容。
+    """
+    if not if_range:
+        return True
+
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return not etag.startswith("W/") and if_range == etag
+
+    since = _parse_http_date(if_range)
+    if since is None or last_modified is None:
+        return False
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # HTTP 日期精确到秒
+    return int(last_modified.timestamp()) == int(since.timestamp())
@@ -1,26 +1,57 @@
-"""MinIO客户端配置模块."""
+"""MinIO客户端配置模块.
 
+minio SDK 是同步阻塞的，所有调用都在专用的有界线程池中执行，避免上传下载期间
+阻塞事件循环（以及SSE等其他请求）。
+"""
+
+import asyncio
 import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+from functools import partial
+from typing import (
+    Any, AsyncIterator, BinaryIO, Callable, Dict, List, Optional, Set, Tuple, TypeVar, Union
+)
 
 from minio import Minio
 from minio.error import S3Error
-from urllib3 import HTTPResponse
+from prometheus_client import Histogram
 
 from app.config import settings
-from app.core.exceptions import ExternalServiceError
+from app.core.exceptions import ConflictError, ExternalServiceError
 from app.core.logging import get_logger
 
 logger = get_logger(__name__)
 
+T = TypeVar("T")
+
+minio_operation_seconds = Histogram(
+    'minio_operation_seconds',
+    'MinIO operation latency, including time queued for a worker thread',
+    ['operation', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
 
 class MinIOClient:
     """MinIO客户端管理器."""
     
-    def __init__(self) -> None:
-        """初始化MinIO客户端."""
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        """
+        初始化MinIO客户端.
+        
+        Args:
+            max_workers: 执行MinIO调用的线程数（即最大并发请求数），默认读取配置
+        """
         self._client: Optional[Minio] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.max_workers = max_workers or settings.MINIO_MAX_WORKERS
+        
+        # 已确认存在的存储桶，避免每次上传都请求MinIO
+        self._known_buckets: Set[str] = set()
+        self._bucket_lock = asyncio.Lock()
     
     @property
     def client(self) -> Minio:
@@ -34,37 +65,88 @@ class MinIOClient:
             )
         return self._client
     
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """获取执行MinIO调用的线程池."""
+        if not self._executor:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="minio"
+            )
+        return self._executor
+    
+    async def _run(self, operation: str, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """在线程池中执行同步调用并记录耗时."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            minio_operation_seconds.labels(operation=operation, status=status).observe(
+                time.perf_counter() - start
+            )
+    
+    async def close(self) -> None:
+        """关闭线程池（等待进行中的调用完成）."""
+        if self._executor:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+        
+        logger.info("MinIO client closed")
+    
+    async def bucket_exists(self, bucket_name: Optional[str] = None) -> bool:
+        """检查存储桶是否存在."""
+        bucket = bucket_name or settings.MINIO_BUCKET_NAME
+        return await self._run("bucket_exists", self.client.bucket_exists, bucket)
+    
     async def ensure_bucket_exists(self, bucket_name: Optional[str] = None) -> bool:
-        """确保存储桶存在，不存在则创建."""
+        """确保存储桶存在，不存在则创建（结果在进程内缓存）."""
         bucket = bucket_name or settings.MINIO_BUCKET_NAME
+        if bucket in self._known_buckets:
+            return True
         
         try:
-            if not self.client.bucket_exists(bucket):
-                self.client.make_bucket(bucket)
+            async with self._bucket_lock:
+                # 并发上传只检查一次
+                if bucket in self._known_buckets:
+                    return True
                 
-                # 设置默认存储桶策略（公开读取）
-                policy = {
-                    "Version": "2012-10-17",
-                    "Statement": [
-                        {
-                            "Effect": "Allow",
-                            "Principal": {"AWS": "*"},
-                            "Action": ["s3:GetBucketLocation", "s3:ListBucket"],
-                            "Resource": f"arn:aws:s3:::{bucket}",
-                        },
-                        {
-                            "Effect": "Allow",
-                            "Principal": {"AWS": "*"},
-                            "Action": "s3:GetObject",
-                            "Resource": f"arn:aws:s3:::{bucket}/*",
-                        },
-                    ],
-                }
+                if not await self.bucket_exists(bucket):
+                    await self._run("make_bucket", self.client.make_bucket, bucket)
+                    
+                    # 设置默认存储桶策略（公开读取）
+                    policy = {
+                        "Version": "2012-10-17",
+                        "Statement": [
+                            {
+                                "Effect": "Allow",
+                                "Principal": {"AWS": "*"},
+                                "Action": ["s3:GetBucketLocation", "s3:ListBucket"],
+                                "Resource": f"arn:aws:s3:::{bucket}",
+                            },
+                            {
+                                "Effect": "Allow",
+                                "Principal": {"AWS": "*"},
+                                "Action": "s3:GetObject",
+                                "Resource": f"arn:aws:s3:::{bucket}/*",
+                            },
+                        ],
+                    }
+                    
+                    await self._run(
+                        "set_bucket_policy",
+                        self.client.set_bucket_policy,
+                        bucket,
+                        json.dumps(policy)
+                    )
+                    
+                    logger.info("MinIO bucket created", bucket=bucket)
                 
-                import json
-                self.client.set_bucket_policy(bucket, json.dumps(policy))
-                
-                logger.info("MinIO bucket created", bucket=bucket)
+                self._known_buckets.add(bucket)
             
             return True
             
@@ -76,6 +158,11 @@ class MinIOClient:
                 details={"bucket": bucket, "error": str(e)}
             )
     
+    def _forget_bucket(self, bucket: str, error: S3Error) -> None:
+        """存储桶被删除时清除缓存，下次上传重新检查."""
+        if error.code == "NoSuchBucket":
+            self._known_buckets.discard(bucket)
+    
     async def upload_file(
         self,
         file_data: Union[bytes, BinaryIO],
@@ -110,7 +197,9 @@ class MinIOClient:
             })
             
             # 上传文件
-            result = self.client.put_object(
+            result = await self._run(
+                "put_object",
+                self.client.put_object,
                 bucket,
                 object_name,
                 file_stream,
@@ -133,6 +222,68 @@ class MinIOClient:
             return file_url
             
         except S3Error as e:
+            self._forget_bucket(bucket, e)
+            logger.error(
+                "MinIO file upload failed",
+                bucket=bucket,
+                object_name=object_name,
+                error=str(e)
+            )
+            raise ExternalServiceError(
+                f"Failed to upload file {object_name}",
+                service="MinIO",
+                details={"bucket": bucket, "object": object_name, "error": str(e)}
+            )
+    
+    async def upload_stream(
+        self,
+        stream: BinaryIO,
+        object_name: str,
+        bucket_name: Optional[str] = None,
+        content_type: Optional[str] = None,
+        metadata: Optional[Dict[str, str]] = None,
+        part_size: Optional[int] = None,
+    ) -> str:
+        """
+        流式上传长度未知的数据.
+        
+        在线程池中按 ``part_size`` 读取 stream 并分片上传（不足一个分片时直接上传），
+        内存中最多保留一个分片。读取时抛出的异常会中止分片上传并原样抛出。
+        """
+        bucket = bucket_name or settings.MINIO_BUCKET_NAME
+        
+        try:
+            await self.ensure_bucket_exists(bucket)
+            
+            metadata = dict(metadata or {})
+            metadata.update({
+                "uploaded_at": datetime.utcnow().isoformat(),
+                "uploaded_by": "tradeflow-backend",
+            })
+            
+            result = await self._run(
+                "put_object_stream",
+                self.client.put_object,
+                bucket,
+                object_name,
+                stream,
+                -1,
+                content_type=content_type or "application/octet-stream",
+                metadata=metadata,
+                part_size=part_size or settings.MINIO_UPLOAD_PART_SIZE,
+            )
+            
+            logger.info(
+                "File streamed to MinIO",
+                bucket=bucket,
+                object_name=object_name,
+                etag=result.etag
+            )
+            
+            return f"http://{settings.MINIO_ENDPOINT}/{bucket}/{object_name}"
+            
+        except S3Error as e:
+            self._forget_bucket(bucket, e)
             logger.error(
                 "MinIO file upload failed",
                 bucket=bucket,
@@ -154,12 +305,10 @@ class MinIOClient:
         bucket = bucket_name or settings.MINIO_BUCKET_NAME
         
         try:
-            # 获取文件
-            response: HTTPResponse = self.client.get_object(bucket, object_name)
-            file_data = response.read()
-            
-            # 获取文件信息
-            stat = self.client.stat_object(bucket, object_name)
+            # 获取文件内容和信息
+            file_data, stat = await self._run(
+                "get_object", self._read_object, bucket, object_name
+            )
             metadata = stat.metadata or {}
             
             logger.info(
@@ -183,6 +332,85 @@ class MinIOClient:
                 service="MinIO",
                 details={"bucket": bucket, "object": object_name, "error": str(e)}
             )
+    
+    def _read_object(self, bucket: str, object_name: str) -> Tuple[bytes, Any]:
+        """读取对象内容和信息（在线程池中执行）."""
+        response = self.client.get_object(bucket, object_name)
+        try:
+            file_data = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+        
+        return file_data, self.client.stat_object(bucket, object_name)
+    
+    async def stream_file(
+        self,
+        object_name: str,
+        bucket_name: Optional[str] = None,
+        offset: int = 0,
+        length: int = 0,
+        chunk_size: Optional[int] = None,
+        etag: Optional[str] = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        流式读取对象（可指定字节范围）.
+        
+        先请求对象（对象不存在等错误在返回前抛出），再返回按 ``chunk_size`` 读取的
+        异步迭代器，内存占用与对象大小无关。迭代结束或中断时释放连接。
+        
+        Args:
+            object_name: 对象名
+            bucket_name: 存储桶，默认读取配置
+            offset: 起始字节
+            length: 读取字节数，0 表示读到末尾
+            chunk_size: 每次读取的字节数，默认读取配置
+            etag: 期望的ETag，对象已被替换时不读取
+            
+        Raises:
+            ConflictError: 对象的ETag与 ``etag`` 不一致
+        """
+        bucket = bucket_name or settings.MINIO_BUCKET_NAME
+        
+        try:
+            response = await self._run(
+                "get_object_stream",
+                self.client.get_object,
+                bucket,
+                object_name,
+                offset=offset,
+                length=length,
+                request_headers={"If-Match": f'"{etag}"'} if etag else None
+            )
+        except S3Error as e:
+            if e.code == "PreconditionFailed":
+                raise ConflictError(
+                    f"Object {object_name} changed",
+                    details={"bucket": bucket, "object": object_name, "etag": etag}
+                )
+            logger.error(
+                "MinIO file download failed",
+                bucket=bucket,
+                object_name=object_name,
+                error=str(e)
+            )
+            raise ExternalServiceError(
+                f"Failed to download file {object_name}",
+                service="MinIO",
+                details={"bucket": bucket, "object": object_name, "error": str(e)}
+            )
+        
+        return self._iter_response(response, chunk_size or settings.MINIO_DOWNLOAD_CHUNK_SIZE)
+    
+    async def _iter_response(self, response: Any, chunk_size: int) -> AsyncIterator[bytes]:
+        """在线程池中按块读取响应."""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.executor, response.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
         finally:
             response.close()
             response.release_conn()
@@ -196,7 +424,7 @@ class MinIOClient:
         bucket = bucket_name or settings.MINIO_BUCKET_NAME
         
         try:
-            self.client.remove_object(bucket, object_name)
+            await self._run("remove_object", self.client.remove_object, bucket, object_name)
             
             logger.info(
                 "File deleted from MinIO",
@@ -228,7 +456,7 @@ class MinIOClient:
         bucket = bucket_name or settings.MINIO_BUCKET_NAME
         
         try:
-            stat = self.client.stat_object(bucket, object_name)
+            stat = await self._run("stat_object", self.client.stat_object, bucket, object_name)
             
             return {
                 "size": stat.size,
@@ -262,8 +490,10 @@ class MinIOClient:
         bucket = bucket_name or settings.MINIO_BUCKET_NAME
         
         try:
-            objects = self.client.list_objects(
-                bucket, prefix=prefix, recursive=recursive
+            # list_objects 返回惰性迭代器，翻页请求在迭代时发出，整体在线程池中执行
+            objects = await self._run(
+                "list_objects",
+                lambda: list(self.client.list_objects(bucket, prefix=prefix, recursive=recursive))
             )
             
             files = []
@@ -309,10 +539,23 @@ class MinIOClient:
         bucket = bucket_name or settings.MINIO_BUCKET_NAME
         
         try:
+            # 签名需要存储桶所在区域，第一次调用可能请求MinIO
             if method.upper() == "GET":
-                url = self.client.presigned_get_object(bucket, object_name, expires)
+                url = await self._run(
+                    "presigned_get_object",
+                    self.client.presigned_get_object,
+                    bucket,
+                    object_name,
+                    expires
+                )
             elif method.upper() == "PUT":
-                url = self.client.presigned_put_object(bucket, object_name, expires)
+                url = await self._run(
+                    "presigned_put_object",
+                    self.client.presigned_put_object,
+                    bucket,
+                    object_name,
+                    expires
+                )
             else:
                 raise ValueError(f"Unsupported method: {method}")
             
@@ -357,4 +600,13 @@ async def init_minio() -> None:
         logger.info("MinIO initialized successfully")
     except Exception as e:
         logger.error("MinIO initialization failed", error=str(e))
-        raise
\ No newline at end of file
+        raise
+
+
+async def close_minio() -> None:
+    """关闭MinIO客户端."""
+    try:
+        await minio_client.close()
+    except Exception as e:
+        logger.error("Error closing MinIO client", error=str(e))
+        raise
@@ -1,9 +1,11 @@
 """Redis客户端配置模块."""
 
-from typing import AsyncGenerator, Optional, Union
+import hashlib
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Optional, Sequence, Union
 
 import redis.asyncio as redis
 from redis.asyncio import ConnectionPool
+from redis.exceptions import NoScriptError
 
 from app.config import settings
 from app.core.logging import get_logger
@@ -18,19 +20,30 @@ class RedisClient:
         """初始化Redis客户端."""
         self._pool: Optional[ConnectionPool] = None
         self._client: Optional[redis.Redis] = None
+        # 二进制值（如压缩后的缓存）使用不解码响应的独立连接池
+        self._binary_pool: Optional[ConnectionPool] = None
+        self._binary_client: Optional[redis.Redis] = None
+        # Lua脚本SHA缓存：脚本内容 -> SHA1
+        self._script_shas: Dict[str, str] = {}
+    
+    @staticmethod
+    def _create_pool(decode_responses: bool) -> ConnectionPool:
+        """创建连接池（响应解码方式由连接池决定）."""
+        return ConnectionPool.from_url(
+            settings.redis_url,
+            max_connections=50,
+            retry_on_timeout=True,
+            socket_keepalive=True,
+            socket_keepalive_options={},
+            health_check_interval=30,
+            decode_responses=decode_responses,
+        )
     
     @property
     def pool(self) -> ConnectionPool:
         """获取Redis连接池."""
         if not self._pool:
-            self._pool = ConnectionPool.from_url(
-                settings.redis_url,
-                max_connections=50,
-                retry_on_timeout=True,
-                socket_keepalive=True,
-                socket_keepalive_options={},
-                health_check_interval=30,
-            )
+            self._pool = self._create_pool(decode_responses=True)
         return self._pool
     
     @property
@@ -40,6 +53,14 @@ class RedisClient:
             self._client = redis.Redis(connection_pool=self.pool, decode_responses=True)
         return self._client
     
+    @property
+    def binary_client(self) -> redis.Redis:
+        """获取返回原始bytes的Redis客户端."""
+        if not self._binary_client:
+            self._binary_pool = self._create_pool(decode_responses=False)
+            self._binary_client = redis.Redis(connection_pool=self._binary_pool)
+        return self._binary_client
+    
     async def close(self) -> None:
         """关闭Redis连接."""
         if self._client:
@@ -50,6 +71,14 @@ class RedisClient:
             await self._pool.disconnect()
             self._pool = None
         
+        if self._binary_client:
+            await self._binary_client.close()
+            self._binary_client = None
+        
+        if self._binary_pool:
+            await self._binary_pool.disconnect()
+            self._binary_pool = None
+        
         logger.info("Redis connection closed")
     
     async def ping(self) -> bool:
@@ -76,6 +105,19 @@ class RedisClient:
             logger.error("Redis set failed", key=key, error=str(e))
             raise
     
+    async def setex(
+        self,
+        key: str,
+        time: int,
+        value: Union[str, bytes, int, float],
+    ) -> bool:
+        """设置键值对并指定过期时间."""
+        try:
+            return await self.client.setex(key, time, value)
+        except Exception as e:
+            logger.error("Redis setex failed", key=key, error=str(e))
+            raise
+    
     async def get(self, key: str) -> Optional[str]:
         """获取键值."""
         try:
@@ -84,6 +126,14 @@ class RedisClient:
             logger.error("Redis get failed", key=key, error=str(e))
             raise
     
+    async def get_bytes(self, key: str) -> Optional[bytes]:
+        """获取键值（不解码）."""
+        try:
+            return await self.binary_client.get(key)
+        except Exception as e:
+            logger.error("Redis get failed", key=key, error=str(e))
+            raise
+    
     async def delete(self, *keys: str) -> int:
         """删除键."""
         try:
@@ -147,6 +197,55 @@ class RedisClient:
             logger.error("Redis hdel failed", name=name, keys=keys, error=str(e))
             raise
 
+    
+    async def scan_iter(
+        self,
+        match: Optional[str] = None,
+        count: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        """按模式迭代键（SCAN，非阻塞）."""
+        try:
+            async for key in self.client.scan_iter(match=match, count=count):
+                yield key
+        except Exception as e:
+            logger.error("Redis scan failed", match=match, error=str(e))
+            raise
+    
+    async def publish(self, channel: str, message: Union[str, bytes]) -> int:
+        """发布消息到频道."""
+        try:
+            return await self.client.publish(channel, message)
+        except Exception as e:
+            logger.error("Redis publish failed", channel=channel, error=str(e))
+            raise
+    
+    async def run_script(
+        self,
+        script: str,
+        keys: Sequence[str] = (),
+        args: Sequence[Union[str, bytes, int, float]] = (),
+        decode: bool = True,
+    ) -> Any:
+        """执行Lua脚本（优先EVALSHA，服务端未缓存脚本时回退EVAL）；decode=False 时返回原始bytes."""
+        sha = self._script_shas.get(script)
+        if sha is None:
+            sha = hashlib.sha1(script.encode("utf-8")).hexdigest()
+            self._script_shas[script] = sha
+        
+        client = self.client if decode else self.binary_client
+        try:
+            try:
+                return await client.evalsha(sha, len(keys), *keys, *args)
+            except NoScriptError:
+                return await client.eval(script, len(keys), *keys, *args)
+        except Exception as e:
+            logger.error("Redis script failed", sha=sha, error=str(e))
+            raise
+    
+    def pubsub(self) -> redis.client.PubSub:
+        """创建发布订阅对象."""
+        return self.client.pubsub(ignore_subscribe_messages=True)
+
 
 # 全局Redis客户端实例
 redis_client = RedisClient()
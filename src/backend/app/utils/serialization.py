@@ -0,0 +1,88 @@
+"""JSON序列化模块.
+
+优先使用 orjson（直接输出UTF-8 bytes，原生支持 datetime/UUID/Enum），
+未安装时回退到标准库 json。两种实现输出一致：紧凑分隔符、非ASCII字符不转义、
+datetime 为 ISO 8601 字符串、ObjectId 为十六进制字符串、Enum 取其值。
+"""
+
+import json
+from dataclasses import asdict, is_dataclass
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Union
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 取决于部署环境
+    orjson = None
+
+try:
+    from bson import ObjectId
+except ImportError:  # pragma: no cover - 取决于部署环境
+    ObjectId = None
+
+HAS_ORJSON = orjson is not None
+
+if HAS_ORJSON:
+    # 允许非字符串键（与 json.dumps 行为一致），naive datetime 不追加时区
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+JSONDecodeError = json.JSONDecodeError
+
+
+def json_default(obj: Any) -> Any:
+    """序列化 JSON 原生不支持的类型."""
+    if ObjectId is not None and isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8", errors="replace")
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    if is_dataclass(obj) and not isinstance(obj, type):
+        return asdict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """序列化为UTF-8编码的 JSON bytes."""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, default=json_default, option=_ORJSON_OPTIONS)
+    return json.dumps(
+        obj, default=json_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def dumps(obj: Any) -> str:
+    """序列化为 JSON 字符串."""
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    """反序列化 JSON，解析失败时抛出 JSONDecodeError（ValueError 子类）."""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """使用 dumps_bytes 渲染的 JSON 响应，作为应用的默认响应类."""
+
+    def render(self, content: Any) -> bytes:
+        """渲染响应体."""
+        return dumps_bytes(content)
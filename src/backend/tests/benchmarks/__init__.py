@@ -0,0 +1 @@
+"""性能基准测试脚本（不随pytest运行）."""
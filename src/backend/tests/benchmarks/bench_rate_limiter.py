@@ -0,0 +1,140 @@
+"""
+多维度限流基准测试：逐维度调用 vs 单脚本批量判定 + 全局配额本地租约.
+
+用法:
+    python -m tests.benchmarks.bench_rate_limiter --requests 20000 --concurrency 200
+    python -m tests.benchmarks.bench_rate_limiter --latency-ms 0.5
+    python -m tests.benchmarks.bench_rate_limiter --redis-url redis://localhost:6379/15
+
+未指定 --redis-url 时使用 fakeredis，--latency-ms 为每次Redis往返附加的模拟网络延迟。
+sequential 为此前的实现：每个维度一次 check_rate_limit，依次调用。
+batched 为当前实现：用户/IP/端点在一个脚本中判定，全局桶每 --lease 个请求访问一次。
+使用真实Redis时会清空指定的库，请使用独立的库号。
+
+参考结果（fakeredis，20000请求，0.5ms延迟）:
+    并发20，--lease 50
+    sequential: 472 req/s  round-trips/req=4.00  global-key hits=20000
+       batched: 1021 req/s  round-trips/req=1.00  global-key hits=440
+    并发200，--lease 100（租约小于一次往返内的请求数，本地配额频繁断档）
+       batched: 1013 req/s  round-trips/req=1.01  global-key hits=12330
+    并发200，--lease 500
+       batched: 971 req/s  round-trips/req=1.01  global-key hits=440
+fakeredis的Lua执行是纯CPU开销，吞吐差异主要来自往返次数；真实Redis上热点键访问减少的收益更明显。
+"""
+
+import argparse
+import asyncio
+import time
+
+import fakeredis
+import redis.asyncio as redis
+
+from app.services.rate_limiter import MultiDimensionalRateLimiter
+from app.utils.redis_client import redis_client
+
+GLOBAL_KEY = "rate_limit:global:global"
+
+
+async def check_sequential(limiter: MultiDimensionalRateLimiter, user_id, ip, endpoint) -> bool:
+    """此前的实现：逐维度调用，遇到拒绝即返回."""
+    for dimension, identifier in (
+        (limiter.user_limiter, str(user_id)),
+        (limiter.ip_limiter, ip),
+        (limiter.endpoint_limiter, endpoint),
+        (limiter.global_limiter, "global"),
+    ):
+        allowed, _, _ = await dimension.check_rate_limit(identifier)
+        if not allowed:
+            return False
+    return True
+
+
+async def check_batched(limiter: MultiDimensionalRateLimiter, user_id, ip, endpoint) -> bool:
+    """当前实现."""
+    allowed, _ = await limiter.check_limits(user_id=user_id, ip_address=ip, endpoint=endpoint)
+    return allowed
+
+
+async def bench(client, check, requests: int, concurrency: int, lease: int) -> dict:
+    """执行基准，返回吞吐、往返次数和全局键访问次数."""
+    await client.flushdb()
+    limiter = MultiDimensionalRateLimiter(global_lease_size=lease)
+    # 放宽限制，只测量判定开销
+    for dimension in (
+        limiter.user_limiter, limiter.ip_limiter, limiter.endpoint_limiter, limiter.global_limiter
+    ):
+        dimension.default_limit = 10**7
+
+    counters = {"round_trips": 0, "global_hits": 0}
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        while not queue.empty():
+            i = queue.get_nowait()
+            await check(limiter, i % 1000, f"10.0.{i % 250}.1", f"/api/v1/e{i % 20}")
+
+    start = time.perf_counter()
+    redis_client.stats = counters
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    return {
+        "rps": requests / elapsed,
+        "round_trips": counters["round_trips"] / requests,
+        "global_hits": counters["global_hits"],
+    }
+
+
+def instrument(client, latency: float) -> None:
+    """统计每次命令往返和全局键访问，并附加模拟延迟."""
+    execute_command = client.execute_command
+
+    async def wrapped(*args, **kwargs):
+        stats = getattr(redis_client, "stats", None)
+        if stats is not None and args[0] in ("EVALSHA", "EVAL"):
+            stats["round_trips"] += 1
+            stats["global_hits"] += GLOBAL_KEY in args
+        if latency:
+            await asyncio.sleep(latency)
+        return await execute_command(*args, **kwargs)
+
+    client.execute_command = wrapped
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000, help="请求总数")
+    parser.add_argument("--concurrency", type=int, default=200, help="并发数")
+    parser.add_argument("--lease", type=int, default=20, help="全局配额每次租用数量")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="模拟每次往返的网络延迟")
+    parser.add_argument("--redis-url", default=None, help="Redis地址，默认使用fakeredis")
+    args = parser.parse_args()
+
+    if args.redis_url:
+        client = redis.from_url(args.redis_url, decode_responses=True)
+    else:
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    instrument(client, args.latency_ms / 1000)
+    redis_client._client = client
+
+    print(
+        f"requests={args.requests} concurrency={args.concurrency} lease={args.lease} "
+        f"latency={args.latency_ms}ms backend={args.redis_url or 'fakeredis'}"
+    )
+    for name, check in (("sequential", check_sequential), ("batched", check_batched)):
+        result = await bench(client, check, args.requests, args.concurrency, args.lease)
+        print(
+            f"{name:>10}: {result['rps']:.0f} req/s  "
+            f"round-trips/req={result['round_trips']:.2f}  "
+            f"global-key hits={result['global_hits']}"
+        )
+
+    redis_client.stats = None
+    await client.flushdb()
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""
+SSE事件编码基准测试：json.dumps + 字符串拼接 vs 预编码事件头 + orjson bytes.
+
+用法:
+    python -m tests.benchmarks.bench_serialization --events 200000
+    python -m tests.benchmarks.bench_serialization --batch 8 --no-orjson
+
+legacy 为此前的实现：json.dumps(ensure_ascii=False) 生成字符串，按行拼接事件，
+一批消息拼接为字符串后再整体 encode 为 bytes。
+current 为当前实现：SSEConverter.encode_sse_event 直接生成 bytes，一批消息只做一次 bytes 拼接。
+--no-orjson 强制 serialization 模块使用标准库回退实现。
+
+参考结果（200000事件，每批8条）:
+    chunk（短文本块）
+        legacy:     121k events/s    37.5 MB
+       current:     609k events/s    36.1 MB
+    tool_result（20行查询结果，约1.6KB）
+        legacy:      18k events/s   346.2 MB
+       current:     102k events/s   312.0 MB
+    --no-orjson（标准库回退）
+    chunk current: 146k events/s  tool_result current: 18k events/s
+输出更小来自紧凑分隔符；orjson 同时省去了 str -> bytes 的整体编码，回退实现与此前相当。
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from app.services.sse_converter import SSEConverter, SSEEventType
+from app.utils import serialization
+
+
+def legacy_format(event_type: SSEEventType, data: Dict[str, Any], event_id: Optional[str]) -> str:
+    """此前的 SSEConverter.format_sse_event."""
+    sse_lines = []
+    if event_id:
+        sse_lines.append(f"id: {event_id}")
+    sse_lines.append(f"event: {event_type.value}")
+    sse_lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    sse_lines.append("")
+    return "\n".join(sse_lines) + "\n"
+
+
+def legacy_batch(batch: List[Dict[str, Any]]) -> bytes:
+    """此前 stream_generator 的一次写入."""
+    return "".join(
+        legacy_format(SSEEventType(m["type"]), m, m.get("event_id")) for m in batch
+    ).encode("utf-8")
+
+
+def current_batch(batch: List[Dict[str, Any]]) -> bytes:
+    """当前 stream_generator 的一次写入."""
+    return b"".join([
+        SSEConverter.encode_sse_event(m["type"], m, m.get("event_id")) for m in batch
+    ])
+
+
+def make_events(kind: str, count: int) -> List[Dict[str, Any]]:
+    """生成测试事件."""
+    events = []
+    for i in range(count):
+        if kind == "chunk":
+            data = {"type": "chunk", "text": f"中国对美出口第{i}条数据 ", "timestamp": "2024-01-02T03:04:05.678Z"}
+        else:
+            data = {
+                "type": "tool_result",
+                "tool_name": "trade_data_query",
+                "result": {
+                    "rows": [
+                        {"hs_code": f"8471{j:02d}", "country": "美国", "value": 1234.5 * j, "year": 2023}
+                        for j in range(20)
+                    ]
+                },
+                "success": True,
+                "timestamp": "2024-01-02T03:04:05.678Z",
+            }
+        data["event_id"] = f"1704164645678-{i}"
+        events.append(data)
+    return events
+
+
+def bench(name: str, encode, events: List[Dict[str, Any]], batch_size: int) -> None:
+    """按批编码全部事件并输出吞吐."""
+    total = 0
+    start = time.perf_counter()
+    for i in range(0, len(events), batch_size):
+        total += len(encode(events[i:i + batch_size]))
+    elapsed = time.perf_counter() - start
+    print(f"{name:>14}: {len(events) / elapsed / 1000:7.0f}k events/s  {total / 1e6:6.1f} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=200000, help="每种负载的事件数")
+    parser.add_argument("--batch", type=int, default=8, help="每次写入合并的消息数")
+    parser.add_argument("--no-orjson", action="store_true", help="使用标准库回退实现")
+    args = parser.parse_args()
+
+    if args.no_orjson:
+        serialization.HAS_ORJSON = False
+    print(f"events={args.events} batch={args.batch} orjson={serialization.HAS_ORJSON}")
+
+    for kind in ("chunk", "tool_result"):
+        events = make_events(kind, args.events)
+        assert legacy_batch(events[:1]).count(b"\n") == current_batch(events[:1]).count(b"\n")
+        print(kind)
+        bench("legacy", legacy_batch, events, args.batch)
+        bench("current", current_batch, events, args.batch)
+
+
+if __name__ == "__main__":
+    main()
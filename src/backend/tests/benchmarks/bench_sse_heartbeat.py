@@ -0,0 +1,107 @@
+"""
+SSE心跳基准测试：全量遍历 vs 哈希时间轮.
+
+用法:
+    python -m tests.benchmarks.bench_sse_heartbeat --connections 50000
+    python -m tests.benchmarks.bench_sse_heartbeat --connections 50000 --interval 30 --duration 60
+
+模拟 --connections 个连接（不访问Redis），运行 --duration 秒心跳，同时用探针任务每5ms
+测量一次事件循环延迟（实际唤醒时间 - 预期唤醒时间）。
+full-scan 为此前的实现：每个间隔遍历全部连接并逐个 await 发送心跳。
+
+参考结果（50000连接，间隔6秒，运行12秒）:
+     full-scan: heartbeats sent=50000  lag p50=   0.18 ms  p99=   0.58 ms  max= 195.88 ms
+         wheel: heartbeats sent=98377  lag p50=   0.18 ms  p99=   2.07 ms  max=   9.75 ms
+full-scan 在每个间隔末尾一次性发送全部心跳（第二轮与结束时间重合），事件循环被阻塞约200ms；
+时间轮把同样的工作分散到每个节拍，最大延迟受单个槽的大小和让出频率限制。
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime
+
+from app.services.sse import SSEConnection, SSEManager
+
+PROBE_INTERVAL = 0.005
+
+
+async def full_scan_heartbeat(manager: SSEManager, interval: float) -> None:
+    """此前的心跳循环."""
+    while True:
+        await asyncio.sleep(interval)
+        for connection in list(manager._connection_map.values()):
+            if connection.is_active:
+                await connection.send_message({
+                    "type": "heartbeat",
+                    "timestamp": datetime.utcnow().isoformat()
+                })
+                connection.last_heartbeat = datetime.utcnow()
+
+
+async def probe(lags: list, stop: asyncio.Event) -> None:
+    """测量事件循环延迟."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append((loop.time() - expected) * 1000)
+
+
+async def bench(mode: str, connections: int, interval: float, duration: float, slots: int) -> list:
+    """运行一种心跳实现，返回事件循环延迟样本（毫秒）."""
+    manager = SSEManager(heartbeat_interval=interval, heartbeat_slots=slots)
+    for i in range(connections):
+        connection = SSEConnection(str(i), i, "s", max_queue_size=16)
+        manager._add_connection(connection)
+
+    if mode == "wheel":
+        heartbeat = asyncio.create_task(manager._heartbeat_loop())
+    else:
+        heartbeat = asyncio.create_task(full_scan_heartbeat(manager, interval))
+
+    lags = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(duration)
+    stop.set()
+    await prober
+
+    heartbeat.cancel()
+    try:
+        await heartbeat
+    except asyncio.CancelledError:
+        pass
+
+    received = sum(
+        1 for c in manager._connection_map.values() for m in c.queue if m["type"] == "heartbeat"
+    )
+    print(f"{mode:>10}: heartbeats sent={received}", end="  ")
+    return lags
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--connections", type=int, default=50000, help="模拟连接数")
+    parser.add_argument("--interval", type=float, default=6.0, help="心跳间隔（秒）")
+    parser.add_argument("--duration", type=float, default=12.0, help="运行时间（秒）")
+    parser.add_argument("--slots", type=int, default=30, help="时间轮槽数")
+    args = parser.parse_args()
+
+    print(
+        f"connections={args.connections} interval={args.interval}s "
+        f"duration={args.duration}s slots={args.slots}"
+    )
+    for mode in ("full-scan", "wheel"):
+        start = time.perf_counter()
+        lags = sorted(await bench(mode, args.connections, args.interval, args.duration, args.slots))
+        p99 = lags[int(len(lags) * 0.99)]
+        print(
+            f"lag p50={statistics.median(lags):7.2f} ms  p99={p99:7.2f} ms  "
+            f"max={lags[-1]:7.2f} ms  ({time.perf_counter() - start:.1f}s)"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
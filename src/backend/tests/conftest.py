@@ -3,15 +3,18 @@
 import asyncio
 from typing import AsyncGenerator, Generator
 
+import fakeredis
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.config import settings
-from app.core.database import Base, get_db
+from app.core.database import Base, get_db, mongodb
 from app.main import create_app
+from app.utils.redis_client import redis_client
 
 
 # 设置测试环境
@@ -86,4 +89,52 @@ async def test_app(test_db_session):
 async def test_client(test_app) -> AsyncGenerator[AsyncClient, None]:
     """创建测试HTTP客户端."""
     async with AsyncClient(app=test_app, base_url="http://test") as client:
-        yield client
\ No newline at end of file
+        yield client
+
+
+@pytest.fixture
+def fake_redis_server() -> fakeredis.FakeServer:
+    """创建内存Redis服务器（多个客户端可共享，模拟多节点）."""
+    return fakeredis.FakeServer()
+
+
+@pytest_asyncio.fixture
+async def fake_redis(fake_redis_server):
+    """用fakeredis替换全局Redis客户端."""
+    client = fakeredis.FakeAsyncRedis(
+        server=fake_redis_server, decode_responses=True
+    )
+    binary_client = fakeredis.FakeAsyncRedis(server=fake_redis_server)
+    original_client = redis_client._client
+    original_binary_client = redis_client._binary_client
+    redis_client._client = client
+    redis_client._binary_client = binary_client
+    
+    yield client
+    
+    redis_client._client = original_client
+    redis_client._binary_client = original_binary_client
+    await client.aclose()
+    await binary_client.aclose()
+
+
+@pytest_asyncio.fixture
+async def mongo_db():
+    """使用测试库替换全局MongoDB连接（MongoDB不可用时跳过）."""
+    client = AsyncIOMotorClient(settings.MONGODB_URL, serverSelectionTimeoutMS=1000)
+    try:
+        await client.admin.command("ping")
+    except Exception:
+        client.close()
+        pytest.skip("MongoDB is not available")
+    
+    database = client[settings.MONGODB_TEST_DATABASE]
+    await client.drop_database(settings.MONGODB_TEST_DATABASE)
+    original = (mongodb._client, mongodb._database)
+    mongodb._client, mongodb._database = client, database
+    
+    yield database
+    
+    mongodb._client, mongodb._database = original
+    await client.drop_database(settings.MONGODB_TEST_DATABASE)
+    client.close()
@@ -0,0 +1,316 @@
+"""Agent性能优化器测试."""
+
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.core.exceptions import RunnerPoolTimeoutError
+from app.services.agent_performance_optimizer import ResponseCache, RunnerPool
+
+
+def make_pool(**kwargs) -> RunnerPool:
+    """创建使用假Runner的实例池."""
+    pool = RunnerPool(**kwargs)
+
+    async def create_runner():
+        return object()
+
+    pool._create_new_runner = create_runner
+    return pool
+
+
+class TestRunnerPool:
+    """Runner实例池测试."""
+
+    @pytest.mark.asyncio
+    async def test_waiters_served_in_fifo_order(self):
+        """池满时等待者按到达顺序获得Runner."""
+        pool = make_pool(max_pool_size=1, acquire_timeout=5)
+        order = []
+
+        held = await pool.get_runner()
+
+        async def worker(i: int):
+            async with pool.acquire():
+                order.append(i)
+                await asyncio.sleep(0)
+
+        tasks = []
+        for i in range(10):
+            tasks.append(asyncio.create_task(worker(i)))
+            await asyncio.sleep(0)
+
+        assert (await pool.get_stats())["waiting"] == 10
+
+        await pool.return_runner(held)
+        await asyncio.gather(*tasks)
+
+        assert order == list(range(10))
+        stats = await pool.get_stats()
+        assert stats["pool_size"] == 1
+        assert stats["stats"]["created"] == 1
+
+    @pytest.mark.asyncio
+    async def test_acquire_timeout_raises(self):
+        """等待超时抛出类型化异常，并从等待队列中移除."""
+        pool = make_pool(max_pool_size=1)
+        held = await pool.get_runner()
+
+        with pytest.raises(RunnerPoolTimeoutError) as exc_info:
+            await pool.get_runner(timeout=0.05)
+
+        assert exc_info.value.status_code == 503
+        stats = await pool.get_stats()
+        assert stats["waiting"] == 0
+        assert stats["stats"]["timeouts"] == 1
+
+        # 超时的等待者不会拿走之后归还的Runner
+        await pool.return_runner(held)
+        assert await pool.get_runner(timeout=0.05) is held
+
+    @pytest.mark.asyncio
+    async def test_context_manager_returns_on_error(self):
+        """上下文管理器在异常时也归还Runner."""
+        pool = make_pool(max_pool_size=1)
+
+        with pytest.raises(RuntimeError):
+            async with pool.acquire() as runner:
+                raise RuntimeError("boom")
+
+        stats = await pool.get_stats()
+        assert stats["idle_runners"] == 1
+        async with pool.acquire(timeout=0.05) as again:
+            assert again is runner
+
+    @pytest.mark.asyncio
+    async def test_recycle_after_max_uses(self):
+        """使用满 max_uses 次后回收并创建新的Runner."""
+        pool = make_pool(max_pool_size=1, max_uses=2)
+
+        async with pool.acquire() as first:
+            pass
+        async with pool.acquire() as second:
+            assert second is first
+        async with pool.acquire() as third:
+            assert third is not first
+
+        stats = await pool.get_stats()
+        assert stats["pool_size"] == 1
+        assert stats["stats"]["created"] == 2
+        assert stats["stats"]["recycled"] == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_returns_granted_slot(self):
+        """等待者在获得创建名额后被取消，名额归还，实例池仍可使用."""
+        pool = make_pool(max_pool_size=1, max_uses=1, acquire_timeout=0.2)
+        held = await pool.get_runner()
+
+        waiter = asyncio.create_task(pool.get_runner())
+        await asyncio.sleep(0)
+        assert (await pool.get_stats())["waiting"] == 1
+
+        # 取消请求到达后、等待者被唤醒前，回收Runner把创建名额交给它
+        waiter.cancel()
+        await pool.return_runner(held)
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        assert pool._creating == 0
+        runner = await pool.get_runner()
+        await pool.return_runner(runner)
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_passes_slot_to_next(self):
+        """被取消的等待者获得的名额转交给下一个等待者."""
+        pool = make_pool(max_pool_size=1, max_uses=1, acquire_timeout=1)
+        held = await pool.get_runner()
+
+        first = asyncio.create_task(pool.get_runner())
+        await asyncio.sleep(0)
+        second = asyncio.create_task(pool.get_runner())
+        await asyncio.sleep(0)
+
+        first.cancel()
+        await pool.return_runner(held)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        runner = await second
+        assert pool._creating == 0
+        assert (await pool.get_stats())["pool_size"] == 1
+        await pool.return_runner(runner)
+
+    @pytest.mark.asyncio
+    async def test_cleanup_cancels_pending_waiters(self):
+        """清理时排队的等待者以 CancelledError 结束."""
+        pool = make_pool(max_pool_size=1, acquire_timeout=1)
+        await pool.get_runner()
+
+        waiters = [asyncio.create_task(pool.get_runner()) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert (await pool.get_stats())["waiting"] == 2
+
+        await pool.cleanup()
+        for waiter in waiters:
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        assert (await pool.get_stats())["waiting"] == 0
+
+    @pytest.mark.asyncio
+    async def test_unhealthy_runner_replaced_for_waiter(self):
+        """健康检查失败的Runner被回收，腾出的名额交给等待者."""
+        unhealthy = set()
+
+        async def health_check(runner):
+            return runner not in unhealthy
+
+        pool = make_pool(max_pool_size=1, health_check=health_check)
+        held = await pool.get_runner()
+        waiter = asyncio.create_task(pool.get_runner(timeout=1))
+        await asyncio.sleep(0)
+
+        unhealthy.add(held)
+        await pool.return_runner(held)
+
+        replacement = await waiter
+        assert replacement is not held
+        stats = await pool.get_stats()
+        assert stats["pool_size"] == 1
+        assert stats["active_runners"] == 1
+
+    @pytest.mark.asyncio
+    async def test_bounded_under_load(self):
+        """大量并发获取时不超过池上限，全部完成且记录等待时间."""
+        pool = make_pool(max_pool_size=3, acquire_timeout=5, max_uses=0)
+        in_use = 0
+        peak = 0
+        before = REGISTRY.get_sample_value("agent_runner_pool_wait_seconds_count") or 0
+
+        async def worker():
+            nonlocal in_use, peak
+            async with pool.acquire():
+                in_use += 1
+                peak = max(peak, in_use)
+                await asyncio.sleep(0.001)
+                in_use -= 1
+
+        await asyncio.gather(*[worker() for _ in range(300)])
+
+        assert peak == 3
+        stats = await pool.get_stats()
+        assert stats["pool_size"] == 3
+        assert stats["waiting"] == 0
+        assert stats["active_runners"] == 0
+        after = REGISTRY.get_sample_value("agent_runner_pool_wait_seconds_count")
+        assert after - before == 300
+
+
+class TestResponseCacheIndex:
+    """响应缓存索引测试."""
+
+    @pytest.mark.asyncio
+    async def test_cache_round_trip_and_counters(self, fake_redis):
+        """命中、未命中和写入次数由计数器维护."""
+        cache = ResponseCache(default_ttl=60, max_cache_size=10)
+
+        assert await cache.get_cached_response("u1", "hello") is None
+        assert await cache.cache_response("u1", "hello", "world")
+
+        cached = await cache.get_cached_response("u1", "  HELLO ")
+        assert cached["response"] == "world"
+
+        stats = await cache.get_cache_stats()
+        assert stats["total_cached_responses"] == 1
+        assert stats["valid_responses"] == 1
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["writes"] == 1
+
+    @pytest.mark.asyncio
+    async def test_large_response_stored_compressed(self, fake_redis):
+        """较长的响应压缩后写入，读取结果不变."""
+        cache = ResponseCache(default_ttl=60)
+        response = "2023年中国对美国出口电子产品贸易概况。" * 500
+
+        assert await cache.cache_response("u1", "report", response, context={"year": 2023})
+
+        cache_key = cache._generate_cache_key("u1", "report", {"year": 2023})
+        assert await fake_redis.strlen(cache_key) < len(response.encode()) / 10
+        cached = await cache.get_cached_response("u1", "report", {"year": 2023})
+        assert cached["response"] == response
+        assert cached["context"] == {"year": 2023}
+
+    @pytest.mark.asyncio
+    async def test_stats_do_not_scan_keyspace(self, fake_redis, monkeypatch):
+        """统计信息不使用KEYS/SCAN遍历缓存条目."""
+        cache = ResponseCache(default_ttl=60)
+        await cache.cache_response("u1", "q", "r")
+
+        async def fail(*args, **kwargs):
+            raise AssertionError("keyspace scan should not be used")
+
+        monkeypatch.setattr(fake_redis, "keys", fail)
+        monkeypatch.setattr(fake_redis, "scan", fail)
+
+        stats = await cache.get_cache_stats()
+        assert stats["total_cached_responses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_invalidate_only_touches_user_entries(self, fake_redis):
+        """按用户清除只删除该用户的条目并同步全局索引."""
+        cache = ResponseCache(default_ttl=60)
+        for i in range(3):
+            await cache.cache_response("u1", f"q{i}", "r")
+        await cache.cache_response("u2", "q0", "r")
+
+        assert await cache.invalidate_user_cache("u1") == 3
+
+        assert await cache.get_cached_response("u1", "q0") is None
+        assert (await cache.get_cached_response("u2", "q0"))["response"] == "r"
+        assert not await fake_redis.exists(cache._get_user_index_key("u1"))
+
+        stats = await cache.get_cache_stats()
+        assert stats["total_cached_responses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_max_cache_size_evicts_oldest(self, fake_redis):
+        """超过容量上限时按过期时间淘汰最旧的条目."""
+        cache = ResponseCache(default_ttl=60, max_cache_size=3)
+        for i in range(5):
+            await cache.cache_response(f"u{i % 2}", f"q{i}", f"r{i}")
+
+        assert await cache.get_cached_response("u0", "q0") is None
+        assert await cache.get_cached_response("u1", "q1") is None
+        for i in range(2, 5):
+            cached = await cache.get_cached_response(f"u{i % 2}", f"q{i}")
+            assert cached["response"] == f"r{i}"
+
+        stats = await cache.get_cache_stats()
+        assert stats["total_cached_responses"] == 3
+        assert stats["evictions"] == 2
+
+        # 被淘汰的条目同时从用户索引中移除
+        assert await fake_redis.zcard(cache._get_user_index_key("u0")) == 2
+        assert await fake_redis.zcard(cache._get_user_index_key("u1")) == 1
+
+    @pytest.mark.asyncio
+    async def test_expired_entries_pruned_from_index(self, fake_redis, monkeypatch):
+        """过期条目在下一次写入时从索引中移除."""
+        now = [1000.0]
+        monkeypatch.setattr(
+            "app.services.agent_performance_optimizer.time.time", lambda: now[0]
+        )
+        cache = ResponseCache(default_ttl=60)
+
+        await cache.cache_response("u1", "old", "r", ttl=10)
+        now[0] += 20
+
+        stats = await cache.get_cache_stats()
+        assert stats["expired_responses"] == 1
+
+        await cache.cache_response("u1", "new", "r")
+        stats = await cache.get_cache_stats()
+        assert stats["total_cached_responses"] == 1
+        assert stats["expired_responses"] == 0
+        assert await fake_redis.zcard(cache._get_user_index_key("u1")) == 1
@@ -0,0 +1,131 @@
+"""Agent服务流式查询测试."""
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.agent_performance_optimizer import performance_optimizer
+from app.services.agent_service import AgentService
+from app.services.session_manager import session_manager
+
+
+class FakeStreamingRunner:
+    """按固定间隔产出增量事件的假Runner，最后产出一个汇总事件."""
+
+    def __init__(self, deltas, delay: float):
+        self.deltas = deltas
+        self.delay = delay
+
+    def run_async(self, **kwargs):
+        return self._events()
+
+    async def _events(self):
+        for delta in self.deltas:
+            await asyncio.sleep(self.delay)
+            yield SimpleNamespace(
+                partial=True,
+                content=SimpleNamespace(parts=[SimpleNamespace(text=delta)])
+            )
+        yield SimpleNamespace(
+            partial=False,
+            content=SimpleNamespace(parts=[SimpleNamespace(text="".join(self.deltas))])
+        )
+
+
+def parse_sse(event: str):
+    """解析SSE事件，返回 (事件类型, 数据)."""
+    fields = dict(
+        line.split(": ", 1) for line in event.strip().splitlines() if ": " in line
+    )
+    return fields.get("event"), json.loads(fields.get("data", "null"))
+
+
+@pytest.fixture
+def streaming_service(fake_redis, monkeypatch):
+    """使用假Redis和假Runner的Agent服务."""
+    monkeypatch.setattr(session_manager, "redis", fake_redis)
+    monkeypatch.setattr(AgentService, "_build_content", staticmethod(lambda query: query))
+
+    service = AgentService()
+    service._initialized = True
+    service._root_agent = object()
+    return service
+
+
+class TestAgentStream:
+    """流式查询测试."""
+
+    @pytest.mark.asyncio
+    async def test_first_chunk_arrives_before_agent_finishes(self, streaming_service):
+        """首个文本块在第一个增量产生时即发送，不等待完整响应."""
+        deltas = ["你好", "，这是", "流式", "响应", "。"]
+        delay = 0.1
+        streaming_service._runner = FakeStreamingRunner(deltas, delay)
+
+        start = time.perf_counter()
+        first_chunk_at = None
+        events = []
+        async for sse_event in streaming_service.query_agent_stream("u1", "s1", "查询"):
+            event_type, data = parse_sse(sse_event)
+            if event_type == "chunk" and first_chunk_at is None:
+                first_chunk_at = time.perf_counter() - start
+            events.append((event_type, data))
+        total = time.perf_counter() - start
+
+        # 首块时间约为一个增量间隔，远小于完整响应时间
+        assert first_chunk_at < delay * 2
+        assert total >= delay * len(deltas)
+
+        chunks = [data for event_type, data in events if event_type == "chunk"]
+        assert [c["text"] for c in chunks] == deltas
+        assert [c["index"] for c in chunks] == list(range(len(deltas)))
+
+        assert events[0][0] == "start"
+        assert events[-1][0] == "done"
+        assert events[-1][1]["chunks_sent"] == len(deltas)
+
+    @pytest.mark.asyncio
+    async def test_history_and_cache_filled_from_stream(self, streaming_service):
+        """流结束后用累积文本写入会话历史和响应缓存."""
+        deltas = ["alpha ", "beta ", "gamma"]
+        streaming_service._runner = FakeStreamingRunner(deltas, 0)
+        await session_manager.create_session("u2", "s2")
+        context_before = await session_manager.get_context("u2", "s2")
+
+        events = [e async for e in streaming_service.query_agent_stream("u2", "s2", "q")]
+        assert parse_sse(events[-1])[0] == "done"
+
+        history = await session_manager.get_message_history("u2", "s2")
+        assert [m["role"] for m in history] == ["user", "assistant"]
+        assert history[-1]["content"] == "alpha beta gamma"
+
+        context = await session_manager.get_context("u2", "s2")
+        assert context["conversation_turns"] == 1
+
+        # 缓存键基于查询时的上下文
+        cached = await performance_optimizer.get_cached_response_or_none(
+            "u2", "q", context_before
+        )
+        assert cached["response"] == "alpha beta gamma"
+
+        await performance_optimizer.response_cache.invalidate_user_cache("u2")
+
+    @pytest.mark.asyncio
+    async def test_cached_response_skips_runner(self, streaming_service):
+        """命中缓存时直接返回，不调用Runner."""
+        await session_manager.create_session("u3", "s3")
+        context = await session_manager.get_context("u3", "s3")
+        await performance_optimizer.cache_response_if_enabled("u3", "q", "cached text", context)
+        streaming_service._runner = None
+
+        events = [parse_sse(e) async for e in streaming_service.query_agent_stream("u3", "s3", "q")]
+
+        chunks = [data for event_type, data in events if event_type == "chunk"]
+        assert [c["text"] for c in chunks] == ["cached text"]
+        assert events[-1][0] == "done"
+        assert events[-1][1]["cached"] is True
+
+        await performance_optimizer.response_cache.invalidate_user_cache("u3")
@@ -0,0 +1,399 @@
+"""缓存服务测试."""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.services.cache import (
+    CacheDecorator,
+    CacheKey,
+    CacheService,
+    LocalCache,
+    _MISSING,
+)
+from app.utils.redis_client import redis_client
+
+
+class TestLocalCache:
+    """进程内LRU缓存测试."""
+
+    def test_lru_eviction_by_entries(self):
+        """超过条目上限时淘汰最久未使用的键."""
+        cache = LocalCache(max_entries=2, max_bytes=1024, default_ttl=60)
+        cache.set("a", 1, size=1)
+        cache.set("b", 2, size=1)
+
+        # 访问a使其成为最近使用
+        assert cache.get("a") == 1
+        cache.set("c", 3, size=1)
+
+        assert cache.get("b") is _MISSING
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+    def test_eviction_by_bytes(self):
+        """超过字节上限时淘汰，并正确维护字节计数."""
+        cache = LocalCache(max_entries=100, max_bytes=10, default_ttl=60)
+        cache.set("a", "x", size=6)
+        cache.set("b", "y", size=6)
+
+        assert cache.get("a") is _MISSING
+        assert cache.size_bytes == 6
+
+        # 单个值超过上限时不缓存
+        cache.set("c", "z", size=11)
+        assert cache.get("c") is _MISSING
+        assert cache.size_bytes == 6
+
+    def test_ttl_expiry(self, monkeypatch):
+        """过期条目视为未命中."""
+        now = [1000.0]
+        monkeypatch.setattr("app.services.cache.time.monotonic", lambda: now[0])
+
+        cache = LocalCache(default_ttl=30)
+        cache.set("a", 1, size=1, ttl=10)
+        assert cache.get("a") == 1
+
+        now[0] += 11
+        assert cache.get("a") is _MISSING
+        assert len(cache) == 0
+
+    def test_delete_pattern(self):
+        """按Redis glob模式删除."""
+        cache = LocalCache()
+        cache.set(CacheKey.user_profile(1), {}, size=2)
+        cache.set(CacheKey.user_subscription(1), {}, size=2)
+        cache.set(CacheKey.user_profile(2), {}, size=2)
+
+        assert cache.delete_pattern("user:*:1") == 2
+        assert len(cache) == 1
+
+
+class TestCacheServiceL1:
+    """两级缓存测试."""
+
+    @pytest.mark.asyncio
+    async def test_get_served_from_local_cache(self, fake_redis, monkeypatch):
+        """热点键第二次读取不访问Redis."""
+        service = CacheService(enable_local_cache=True)
+        key = CacheKey.user_profile(1)
+        await fake_redis.set(key, '{"name": "alice"}')
+
+        assert await service.get(key) == {"name": "alice"}
+
+        async def fail_get(*args, **kwargs):
+            raise AssertionError("Redis should not be called")
+
+        monkeypatch.setattr(redis_client, "get_bytes", fail_get)
+        assert await service.get(key) == {"name": "alice"}
+
+    @pytest.mark.asyncio
+    async def test_non_hot_keys_bypass_local_cache(self, fake_redis):
+        """不匹配前缀的键不进入L1."""
+        service = CacheService(enable_local_cache=True)
+        key = CacheKey.product_detail(1)
+
+        await service.set(key, {"id": 1})
+        assert await service.get(key) == {"id": 1}
+        assert len(service.local_cache) == 0
+
+    @pytest.mark.asyncio
+    async def test_cross_node_invalidation(self, fake_redis):
+        """一个节点的删除通过pub/sub清除另一个节点的L1."""
+        node_a = CacheService(enable_local_cache=True)
+        node_b = CacheService(enable_local_cache=True)
+        key = CacheKey.user_subscription(7)
+
+        await node_b.start_invalidation_listener()
+        try:
+            # 等待订阅建立
+            await asyncio.sleep(0.05)
+
+            await node_a.set(key, {"plan": "pro"})
+            assert await node_b.get(key) == {"plan": "pro"}
+            assert len(node_b.local_cache) == 1
+
+            await node_a.delete(key)
+            for _ in range(50):
+                if len(node_b.local_cache) == 0:
+                    break
+                await asyncio.sleep(0.01)
+
+            assert len(node_b.local_cache) == 0
+            assert await node_b.get(key) is None
+        finally:
+            await node_b.stop_invalidation_listener()
+
+    @pytest.mark.asyncio
+    async def test_broadcast_after_redis_delete(self, fake_redis, monkeypatch):
+        """删除和按模式删除先删Redis再通知，收到通知的节点不会重新加载旧值."""
+        service = CacheService(enable_local_cache=True)
+        key = CacheKey.user_subscription(8)
+        await service.set(key, {"plan": "pro"})
+        remaining = []
+
+        async def broadcast(keys=None, patterns=None):
+            remaining.append(await fake_redis.exists(key))
+
+        monkeypatch.setattr(service, "_broadcast_invalidation", broadcast)
+
+        assert await service.delete(key) == 1
+        assert remaining == [0]
+
+        await service.set(key, {"plan": "pro"})
+        remaining.clear()
+        assert await service.invalidate_pattern("user:subscription:*") == 1
+        assert remaining == [0]
+
+        # Redis删除失败时不通知
+        async def fail_delete(*keys):
+            raise ConnectionError("redis unavailable")
+
+        monkeypatch.setattr(fake_redis, "delete", fail_delete)
+        assert await service.delete(key) == 0
+        assert remaining == [0]
+
+    @pytest.mark.asyncio
+    async def test_invalidate_user_cache_clears_local(self, fake_redis):
+        """清除用户缓存同时清除本地副本."""
+        service = CacheService(enable_local_cache=True)
+
+        tags = [CacheKey.user_tag(3)]
+        await service.set(CacheKey.user_profile(3), {"id": 3}, tags=tags)
+        await service.set(CacheKey.user_subscription(3), {"plan": "free"}, tags=tags)
+        assert len(service.local_cache) == 2
+
+        await service.invalidate_user_cache(3)
+
+        assert len(service.local_cache) == 0
+        assert await fake_redis.get(CacheKey.user_profile(3)) is None
+
+
+class TestCacheTagIndex:
+    """标签索引失效测试."""
+
+    @pytest.mark.asyncio
+    async def test_invalidate_user_cache_only_touches_tagged_keys(self, fake_redis):
+        """按用户标签删除，不影响其他用户的键."""
+        service = CacheService(enable_local_cache=False)
+
+        for user_id in (1, 2):
+            tags = [CacheKey.user_tag(user_id)]
+            await service.set(CacheKey.user_profile(user_id), {"id": user_id}, tags=tags)
+            await service.set(CacheKey.product_list(user_id, 1), [], tags=tags)
+            await service.set(CacheKey.user_stats(user_id, "daily"), {}, tags=tags)
+
+        async def fail_scan(*args, **kwargs):
+            raise AssertionError("SCAN should not be used")
+            yield  # pragma: no cover
+
+        fake_redis.scan_iter = fail_scan
+        await service.invalidate_user_cache(1)
+
+        assert await fake_redis.exists(
+            CacheKey.user_profile(1),
+            CacheKey.product_list(1, 1),
+            CacheKey.user_stats(1, "daily"),
+            CacheKey.tag_index(CacheKey.user_tag(1))
+        ) == 0
+        assert await fake_redis.exists(
+            CacheKey.user_profile(2),
+            CacheKey.product_list(2, 1),
+            CacheKey.user_stats(2, "daily")
+        ) == 3
+
+    @pytest.mark.asyncio
+    async def test_user_keys_tagged_automatically(self, fake_redis):
+        """不传 tags 写入的用户相关键也会被 invalidate_user_cache 清除."""
+        service = CacheService(enable_local_cache=False)
+
+        user_keys = [
+            CacheKey.user_profile(5),
+            CacheKey.user_subscription(5),
+            CacheKey.product_list(5, 2),
+            CacheKey.conversation_list(5, 1),
+            CacheKey.buyer_recommendations(5),
+            CacheKey.user_stats(5, "monthly"),
+        ]
+        for key in user_keys:
+            await service.set(key, {"v": 1})
+        await service.set(CacheKey.user_profile(6), {"v": 1})
+        await service.set(CacheKey.product_detail(5), {"v": 1})
+
+        async def fail_scan(*args, **kwargs):
+            raise AssertionError("SCAN should not be used")
+            yield  # pragma: no cover
+
+        fake_redis.scan_iter = fail_scan
+        await service.invalidate_user_cache(5)
+
+        assert await fake_redis.exists(*user_keys) == 0
+        assert await fake_redis.exists(
+            CacheKey.user_profile(6), CacheKey.product_detail(5)
+        ) == 2
+
+    @pytest.mark.asyncio
+    async def test_tag_index_ttl_covers_members(self, fake_redis):
+        """标签索引的TTL不短于其最长的成员，并随成员过期而过期."""
+        service = CacheService(enable_local_cache=False)
+        tag_key = CacheKey.tag_index("report")
+
+        await service.set("report:a", 1, ttl=100, tags=["report"])
+        assert 90 < await fake_redis.ttl(tag_key) <= 100
+
+        await service.set("report:b", 2, ttl=500, tags=["report"])
+        assert 490 < await fake_redis.ttl(tag_key) <= 500
+
+        # 较短TTL的写入不会缩短索引的TTL
+        await service.set("report:c", 3, ttl=10, tags=["report"])
+        assert 490 < await fake_redis.ttl(tag_key) <= 500
+
+        assert await service.invalidate_tags(["report"]) == 3
+        assert await fake_redis.exists(tag_key, "report:a", "report:b", "report:c") == 0
+
+    @pytest.mark.asyncio
+    async def test_invalidate_large_tag(self, fake_redis):
+        """超过单批大小的标签也能一次删除."""
+        service = CacheService(enable_local_cache=False)
+        keys = [f"bulk:{i}" for i in range(2500)]
+
+        async with fake_redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.set(key, "1")
+            pipe.sadd(CacheKey.tag_index("bulk"), *keys)
+            await pipe.execute()
+
+        assert await service.invalidate_tags(["bulk"]) == 2500
+        assert await fake_redis.dbsize() == 0
+
+
+class TestCacheDecoratorStampede:
+    """缓存装饰器防击穿测试."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_run_once(self, fake_redis):
+        """N个并发调用同一个未缓存键，被装饰函数只执行一次."""
+        calls = 0
+
+        @CacheDecorator(key_func=lambda item_id: f"test:item:{item_id}", ttl=60)
+        async def load_item(item_id: int):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return {"id": item_id}
+
+        results = await asyncio.gather(*[load_item(1) for _ in range(50)])
+
+        assert calls == 1
+        assert all(r == {"id": 1} for r in results)
+
+        # 后续调用命中缓存
+        assert await load_item(1) == {"id": 1}
+        assert calls == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_across_workers_run_once(self, fake_redis):
+        """分布式锁：两个“worker”各自并发调用，被装饰函数只执行一次."""
+        calls = 0
+
+        async def load_item(item_id: int):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.1)
+            return {"id": item_id}
+
+        def key_func(item_id: int) -> str:
+            return f"test:item:{item_id}"
+
+        worker_a = CacheDecorator(
+            key_func=key_func, ttl=60, distributed_lock=True, lock_poll_interval=0.01
+        )(load_item)
+        worker_b = CacheDecorator(
+            key_func=key_func, ttl=60, distributed_lock=True, lock_poll_interval=0.01
+        )(load_item)
+
+        results = await asyncio.gather(
+            *[worker_a(2) for _ in range(20)],
+            *[worker_b(2) for _ in range(20)]
+        )
+
+        assert calls == 1
+        assert all(r == {"id": 2} for r in results)
+        assert not await fake_redis.exists("lock:test:item:2")
+
+    @pytest.mark.asyncio
+    async def test_stale_while_revalidate(self, fake_redis):
+        """过期值在窗口内直接返回，后台只刷新一次."""
+        calls = 0
+        refreshed = asyncio.Event()
+
+        @CacheDecorator(key_func=lambda: "test:stale", ttl=60, stale_ttl=30)
+        async def load_value():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            refreshed.set()
+            return "fresh"
+
+        await fake_redis.set("test:stale", json.dumps({
+            "value": "old",
+            "expires_at": time.time() - 1,
+            "delta": 0.02
+        }))
+
+        results = await asyncio.gather(*[load_value() for _ in range(20)])
+        assert results == ["old"] * 20
+
+        await asyncio.wait_for(refreshed.wait(), timeout=1)
+        await asyncio.sleep(0.01)
+
+        assert calls == 1
+        assert await load_value() == "fresh"
+
+    @pytest.mark.asyncio
+    async def test_early_expiration(self, fake_redis):
+        """临近过期时按概率提前刷新，并继续返回旧值."""
+        calls = 0
+
+        @CacheDecorator(
+            key_func=lambda: "test:early", ttl=60, early_expiration_beta=1e9
+        )
+        async def load_value():
+            nonlocal calls
+            calls += 1
+            return "fresh"
+
+        await fake_redis.set("test:early", json.dumps({
+            "value": "old",
+            "expires_at": time.time() + 5,
+            "delta": 1.0
+        }))
+
+        assert await load_value() == "old"
+        await asyncio.sleep(0.01)
+        assert calls == 1
+
+    @pytest.mark.asyncio
+    async def test_failure_is_shared_and_not_cached(self, fake_redis):
+        """加载失败时所有等待者收到同一个异常，下一次调用重新执行."""
+        calls = 0
+
+        @CacheDecorator(key_func=lambda: "test:fail", ttl=60)
+        async def load_value():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            if calls == 1:
+                raise RuntimeError("boom")
+            return "ok"
+
+        results = await asyncio.gather(
+            *[load_value() for _ in range(10)], return_exceptions=True
+        )
+        assert calls == 1
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+        assert await load_value() == "ok"
+        assert calls == 2
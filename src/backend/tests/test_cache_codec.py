@@ -0,0 +1,118 @@
+"""缓存编解码测试."""
+
+import json
+from datetime import datetime
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.services.cache import CacheKey, CacheService
+from app.utils import cache_codec as codec_module
+from app.utils.cache_codec import CacheCodec, CacheCodecError, FORMAT_VERSION
+
+LARGE_VALUE = {
+    "summary": "2023年中国对美国出口电子产品贸易概况。" * 200,
+    "rows": [{"hs_code": f"8471{i:02d}", "value": i * 1.5} for i in range(50)],
+}
+
+
+class TestCacheCodec:
+    """编解码器测试."""
+
+    def test_small_value_not_compressed(self):
+        """小于阈值的值只做 msgpack 编码."""
+        codec = CacheCodec(compression="zlib", threshold=1024)
+        data = codec.encode({"id": 1, "name": "张三"})
+
+        assert data[0] == 0x80 | FORMAT_VERSION << 4
+        assert codec.decode(data) == {"id": 1, "name": "张三"}
+
+    def test_large_value_compressed(self):
+        """超过阈值的值压缩，头部记录压缩算法."""
+        codec = CacheCodec(compression="zlib", threshold=1024)
+        data = codec.encode(LARGE_VALUE)
+
+        assert data[0] & 0x0F == codec_module.COMPRESSORS["zlib"].codec_id
+        assert len(data) * 5 < len(json.dumps(LARGE_VALUE, ensure_ascii=False).encode())
+        assert codec.decode(data) == LARGE_VALUE
+
+    def test_extended_types(self):
+        """datetime 等类型按 JSON 语义编码，整数键保留."""
+        codec = CacheCodec(compression="none")
+        value = {"at": datetime(2024, 1, 2, 3, 4, 5), 1: (1, 2), "raw": b"\x00\xff"}
+
+        assert codec.decode(codec.encode(value)) == {
+            "at": "2024-01-02T03:04:05", 1: [1, 2], "raw": b"\x00\xff"
+        }
+
+    def test_legacy_json_readable(self):
+        """旧的JSON条目（str 或 bytes）仍可读取."""
+        codec = CacheCodec()
+        legacy = json.dumps({"name": "alice"})
+
+        assert codec.decode(legacy) == {"name": "alice"}
+        assert codec.decode(legacy.encode()) == {"name": "alice"}
+        assert codec.decode(b"42") == 42
+
+    def test_unavailable_compression_raises(self):
+        """本机未安装的压缩算法、未知版本和损坏的数据抛出 CacheCodecError."""
+        codec = CacheCodec()
+        missing = {1, 2, 3, 4} - set(codec_module._COMPRESSORS_BY_ID)
+        for codec_id in missing:
+            with pytest.raises(CacheCodecError):
+                codec.decode(bytes((0x90 | codec_id,)) + b"payload")
+
+        with pytest.raises(CacheCodecError):
+            codec.decode(b"\xf0payload")
+        with pytest.raises(CacheCodecError):
+            codec.decode(bytes((0x93,)) + b"not zlib")
+        with pytest.raises(CacheCodecError):
+            codec.decode(b"{broken")
+
+    def test_unknown_compression_falls_back(self):
+        """配置的压缩算法未安装时回退到已安装的实现."""
+        codec = CacheCodec(compression="brotli")
+        assert codec.compressor is not None
+        assert CacheCodec(compression="none").compressor is None
+
+    def test_metrics_per_prefix(self):
+        """按键前缀记录编解码耗时和压缩率."""
+        codec = CacheCodec(compression="zlib", threshold=1024)
+        labels = {"prefix": "codec_test"}
+        before = REGISTRY.get_sample_value("cache_codec_compression_ratio_count", labels) or 0
+
+        data = codec.encode(LARGE_VALUE, "codec_test")
+        codec.decode(data, "codec_test")
+
+        assert REGISTRY.get_sample_value("cache_codec_compression_ratio_count", labels) == before + 1
+        assert REGISTRY.get_sample_value("cache_codec_compression_ratio_sum", labels) > 5
+        assert REGISTRY.get_sample_value("cache_codec_decode_seconds_count", labels) >= 1
+        assert REGISTRY.get_sample_value("cache_codec_encode_seconds_count", labels) >= 1
+
+
+class TestCacheServiceCodec:
+    """缓存服务使用编解码器的测试."""
+
+    @pytest.mark.asyncio
+    async def test_values_stored_with_codec(self, fake_redis):
+        """默认写入带头部的二进制值，并能读取旧的JSON条目."""
+        service = CacheService(enable_local_cache=False)
+        key = CacheKey.product_detail(1)
+
+        await service.set(key, LARGE_VALUE)
+        stored_size = await fake_redis.strlen(key)
+        assert stored_size < len(json.dumps(LARGE_VALUE, ensure_ascii=False).encode()) / 5
+        assert await service.get(key) == LARGE_VALUE
+
+        legacy_key = CacheKey.product_detail(2)
+        await fake_redis.set(legacy_key, json.dumps({"id": 2}))
+        assert await service.get(legacy_key) == {"id": 2}
+
+    @pytest.mark.asyncio
+    async def test_undecodable_value_is_miss(self, fake_redis):
+        """无法解码的值按未命中处理，不会反序列化 pickle."""
+        service = CacheService(enable_local_cache=False)
+        key = CacheKey.product_detail(3)
+        await fake_redis.set(key, b"\x80\x04\x95pickled")
+
+        assert await service.get(key, default="miss") == "miss"
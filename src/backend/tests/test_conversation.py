@@ -0,0 +1,446 @@
+"""对话服务测试（需要MongoDB）."""
+
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.models.conversation import ConversationStatus, Message, MessageRole
+from app.services.conversation import ConversationService
+
+
+def make_service(bucket_size: int = 10) -> ConversationService:
+    """创建使用小桶的服务实例."""
+    service = ConversationService()
+    service.bucket_size = bucket_size
+    service.tail_size = 5
+    return service
+
+
+async def add_messages(service: ConversationService, conversation_id: str, count: int) -> None:
+    """依次写入 count 条消息."""
+    for i in range(count):
+        message = Message(role=MessageRole.USER, content=f"m{i}", tokens_used=2)
+        assert await service.add_message(conversation_id, message, user_id=1)
+
+
+class TestMessageBuckets:
+    """消息分桶存储测试."""
+
+    @pytest.mark.asyncio
+    async def test_messages_stored_in_buckets(self, mongo_db, fake_redis):
+        """消息按序号写入桶，对话文档只保存计数."""
+        service = make_service()
+        await service.ensure_indexes()
+        conversation = await service.create_conversation(1, "s")
+        await add_messages(service, conversation.id, 25)
+
+        doc = await mongo_db.conversations.find_one({"_id": ObjectId(conversation.id)})
+        assert "messages" not in doc
+        assert doc["message_count"] == 25
+        assert doc["total_tokens"] == 50
+
+        buckets = await mongo_db.conversation_messages.find(
+            {"conversation_id": conversation.id}
+        ).sort("seq", 1).to_list(None)
+        assert [(b["seq"], b["count"]) for b in buckets] == [(0, 10), (10, 10), (20, 5)]
+
+    @pytest.mark.asyncio
+    async def test_failed_bucket_write_releases_seq(self, mongo_db, fake_redis, monkeypatch):
+        """写入桶失败时撤销计数；序号已被之后的消息占用时记录缺口."""
+        service = make_service()
+        conversation = await service.create_conversation(1, "s")
+        await add_messages(service, conversation.id, 2)
+        append = service._append_to_bucket
+
+        async def failing_append(conversation_id, seq, message):
+            raise ConnectionError("mongo unavailable")
+
+        monkeypatch.setattr(service, "_append_to_bucket", failing_append)
+        message = Message(role=MessageRole.USER, content="lost", tokens_used=2)
+        assert not await service.add_message(conversation.id, message, user_id=1)
+
+        doc = await mongo_db.conversations.find_one({"_id": ObjectId(conversation.id)})
+        assert (doc["message_count"], doc["total_tokens"]) == (2, 4)
+
+        # 写入桶期间另一条消息已分配下一个序号
+        async def overtaken_append(conversation_id, seq, message):
+            monkeypatch.setattr(service, "_append_to_bucket", append)
+            assert await service.add_message(
+                conversation_id, Message(role=MessageRole.USER, content="next", tokens_used=2)
+            )
+            raise ConnectionError("mongo unavailable")
+
+        monkeypatch.setattr(service, "_append_to_bucket", overtaken_append)
+        assert not await service.add_message(conversation.id, message, user_id=1)
+
+        doc = await mongo_db.conversations.find_one({"_id": ObjectId(conversation.id)})
+        assert (doc["message_count"], doc["total_tokens"]) == (4, 6)
+        assert doc["missing_seqs"] == [2]
+        assert [m.seq for m in await service.get_messages(conversation.id)] == [0, 1, 3]
+
+    @pytest.mark.asyncio
+    async def test_tail_paging(self, mongo_db, fake_redis):
+        """从尾部分页读取，跨桶时顺序正确."""
+        service = make_service()
+        conversation = await service.create_conversation(1, "s")
+        await add_messages(service, conversation.id, 25)
+
+        tail = await service.get_messages(conversation.id, limit=7)
+        assert [m.seq for m in tail] == list(range(18, 25))
+
+        page = await service.get_messages(conversation.id, before_seq=18, limit=12)
+        assert [m.content for m in page] == [f"m{i}" for i in range(6, 18)]
+
+        assert [m.seq for m in await service.get_messages(conversation.id, before_seq=3)] == [0, 1, 2]
+
+        loaded = await service.get_conversation(conversation.id, user_id=1)
+        assert loaded.message_count == 25
+        assert [m.seq for m in loaded.messages] == list(range(20, 25))
+
+    @pytest.mark.asyncio
+    async def test_legacy_conversation_migrated(self, mongo_db, fake_redis):
+        """内嵌消息、字符串 _id 的旧文档可迁移，写入旧文档时自动迁移."""
+        service = make_service(bucket_size=2)
+        legacy_ids = []
+        for _ in range(2):
+            # 与旧版本一致：_id 为 str(ObjectId())
+            conversation_id = str(ObjectId())
+            await mongo_db.conversations.insert_one({
+                "_id": conversation_id,
+                "user_id": 1,
+                "session_id": "s",
+                "messages": [
+                    Message(role=MessageRole.USER, content=f"old{i}").dict() for i in range(3)
+                ],
+                "total_tokens": 0,
+            })
+            legacy_ids.append(conversation_id)
+
+        assert (await service.get_conversation(legacy_ids[0], user_id=1)).id == legacy_ids[0]
+
+        assert await service.migrate_conversation_messages({"_id": legacy_ids[0]})
+        # 重复执行不做任何事
+        assert not await service.migrate_conversation_messages({"_id": legacy_ids[0]})
+
+        await add_messages(service, legacy_ids[1], 1)
+
+        assert await mongo_db.conversations.count_documents({"_id": {"$type": "string"}}) == 0
+        for conversation_id in legacy_ids:
+            doc = await mongo_db.conversations.find_one({"_id": ObjectId(conversation_id)})
+            assert "messages" not in doc
+            messages = await service.get_messages(conversation_id)
+            assert [m.seq for m in messages] == list(range(doc["message_count"]))
+        assert [m.content for m in messages] == ["old0", "old1", "old2", "m0"]
+
+        stats = await service._calculate_user_stats(1)
+        assert stats.total_messages == 7
+
+    @pytest.mark.asyncio
+    async def test_string_id_without_messages(self, mongo_db, fake_redis):
+        """已移除内嵌消息但仍为字符串 _id 的文档可读写，迁移后转换为 ObjectId."""
+        service = make_service()
+        conversation_id = str(ObjectId())
+        await mongo_db.conversations.insert_one({
+            "_id": conversation_id,
+            "user_id": 1,
+            "session_id": "s",
+            "message_count": 0,
+            "total_tokens": 0,
+        })
+
+        await add_messages(service, conversation_id, 2)
+        assert (await service.get_conversation(conversation_id, user_id=1)).message_count == 2
+
+        assert await service.migrate_conversation_messages({"_id": conversation_id})
+        doc = await mongo_db.conversations.find_one({"_id": ObjectId(conversation_id)})
+        assert doc["message_count"] == 2
+        assert await mongo_db.conversations.count_documents({}) == 1
+
+        await add_messages(service, conversation_id, 1)
+        assert [m.seq for m in await service.get_messages(conversation_id)] == [0, 1, 2]
+        assert await service.delete_conversation(conversation_id, user_id=1)
+        assert await mongo_db.conversations.count_documents({}) == 0
+
+    @pytest.mark.asyncio
+    async def test_delete_removes_buckets(self, mongo_db, fake_redis):
+        """删除对话同时删除消息桶."""
+        service = make_service()
+        conversation = await service.create_conversation(1, "s")
+        await add_messages(service, conversation.id, 3)
+
+        assert await service.delete_conversation(conversation.id, user_id=1)
+        assert await mongo_db.conversation_messages.count_documents({}) == 0
+        assert not await service.add_message(
+            conversation.id, Message(role=MessageRole.USER, content="x"), user_id=1
+        )
+
+
+def plan_nodes(plan):
+    """遍历执行计划中的所有节点."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan
+        for value in plan.values():
+            yield from plan_nodes(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from plan_nodes(value)
+
+
+class TestConversationListing:
+    """对话列表键集分页测试."""
+
+    async def insert_conversations(self, mongo_db, count: int) -> list:
+        """插入对话，每3个共享同一个更新时间，返回按 (updated_at, _id) 倒序的ID."""
+        base = datetime(2024, 1, 1)
+        docs = [
+            {
+                "_id": ObjectId(),
+                "user_id": 1,
+                "session_id": "s",
+                "status": "archived" if i % 5 == 0 else "active",
+                "message_count": 0,
+                "total_tokens": 0,
+                "created_at": base,
+                "updated_at": base + timedelta(minutes=i // 3),
+            }
+            for i in range(count)
+        ]
+        # 其他用户的对话不应出现在结果中
+        docs.append({**docs[0], "_id": ObjectId(), "user_id": 2})
+        await mongo_db.conversations.insert_many(docs)
+        ordered = sorted(
+            (d for d in docs if d["user_id"] == 1),
+            key=lambda d: (d["updated_at"], d["_id"]),
+            reverse=True
+        )
+        return [str(d["_id"]) for d in ordered], docs
+
+    @pytest.mark.asyncio
+    async def test_cursor_pages_cover_all_once(self, mongo_db, fake_redis):
+        """按游标翻页不重复、不遗漏（更新时间相同时按ID排序）."""
+        service = make_service()
+        expected, _ = await self.insert_conversations(mongo_db, 25)
+
+        seen, cursor = [], None
+        while True:
+            page = await service.list_conversations(1, limit=10, cursor=cursor)
+            seen.extend(c.id for c in page)
+            if len(page) < 10:
+                break
+            cursor = service.encode_cursor(page[-1])
+
+        assert seen == expected
+
+        active = await service.list_conversations(1, limit=100, status=ConversationStatus.ACTIVE)
+        assert len(active) == 20
+
+        with pytest.raises(ValueError):
+            await service.list_conversations(1, cursor="not-a-cursor")
+
+    @pytest.mark.asyncio
+    async def test_listing_uses_index(self, mongo_db, fake_redis):
+        """列表查询（首页、翻页、状态过滤）走索引，只检查返回的文档."""
+        service = make_service()
+        await service.ensure_indexes()
+        _, docs = await self.insert_conversations(mongo_db, 300)
+        last = service._to_conversation(docs[150])
+
+        for status, cursor in [
+            (None, None),
+            (None, service.encode_cursor(last)),
+            (ConversationStatus.ACTIVE, service.encode_cursor(last)),
+        ]:
+            query = service._list_query(1, status, cursor)
+            plan = await mongo_db.conversations.find(query, {"messages": 0}).sort(
+                [("updated_at", -1), ("_id", -1)]
+            ).limit(10).explain()
+
+            nodes = list(plan_nodes(plan["queryPlanner"]["winningPlan"]))
+            stages = {node["stage"] for node in nodes}
+            assert "COLLSCAN" not in stages
+            assert "IXSCAN" in stages
+            assert {node["indexName"] for node in nodes if "indexName" in node} <= {
+                "user_updated", "user_status_updated"
+            }
+            # 与页深无关（skip 到第150个需要检查160个文档）
+            assert plan["executionStats"]["totalDocsExamined"] <= 15
+
+    def test_cursor_round_trip(self):
+        """游标可还原为 (updated_at, _id)，格式错误时抛出 ValueError."""
+        service = make_service()
+        conversation = service._to_conversation({
+            "_id": ObjectId(), "user_id": 1, "session_id": "s",
+            "updated_at": datetime(2024, 1, 2, 3, 4, 5, 678000),
+        })
+
+        cursor = service.encode_cursor(conversation)
+        assert service.decode_cursor(cursor) == (conversation.updated_at, ObjectId(conversation.id))
+        for invalid in ["", "not-a-cursor", service.encode_cursor(conversation)[:-4]]:
+            with pytest.raises(ValueError):
+                service.decode_cursor(invalid)
+
+
+class TestConversationStats:
+    """对话统计写回和重建测试."""
+
+    @pytest.mark.asyncio
+    async def test_stats_written_behind_and_reconciled(self, mongo_db, fake_redis):
+        """统计增量批量写入，丢失的增量可由重建恢复."""
+        service = make_service()
+        conversation = await service.create_conversation(1, "s")
+        await add_messages(service, conversation.id, 3)
+
+        # 热路径不写统计集合
+        assert await mongo_db.conversation_stats.count_documents({}) == 0
+        assert await service.stats_buffer.flush() == 1
+
+        doc = await mongo_db.conversation_stats.find_one({"user_id": 1})
+        assert doc["total_conversations"] == 1
+        assert doc["total_messages"] == 3
+        assert sum(doc["daily_usage"].values()) == 6
+        assert sum(doc["hourly_distribution"].values()) == 3
+
+        # 未写入的增量计入读取结果
+        await add_messages(service, conversation.id, 1)
+        assert (await service.get_user_stats(1)).total_messages == 4
+
+        # 模拟进程崩溃丢失缓冲（两条消息的增量）
+        await add_messages(service, conversation.id, 1)
+        service.stats_buffer._pending.clear()
+        assert (await service.get_user_stats(1)).total_messages == 3
+
+        stats = await service.reconcile_user_stats(1)
+        assert stats.total_messages == 5
+        assert stats.total_tokens_used == 10
+        assert sum(stats.daily_usage.values()) == 10
+        assert sum(stats.hourly_distribution.values()) == 5
+        assert (await service.get_user_stats(1)).total_messages == 5
+        assert stats.avg_messages_per_conversation == 5
+
+        # 重建期间写入的消息已计入重建结果，对应的缓冲增量被丢弃
+        original = service._calculate_user_stats
+
+        async def calculate_with_concurrent_write(user_id):
+            result = await original(user_id)
+            await add_messages(service, conversation.id, 1)
+            return result
+
+        service._calculate_user_stats = calculate_with_concurrent_write
+        await service.reconcile_user_stats(1)
+        assert service.stats_buffer.pending(1) == {}
+
+
+class TestConversationCache:
+    """元数据和尾部消息分开缓存的测试."""
+
+    @pytest.mark.asyncio
+    async def test_append_keeps_meta_and_updates_tail(self, mongo_db, fake_redis):
+        """追加消息只更新尾部缓存，元数据缓存保留."""
+        service = make_service()
+        conversation = await service.create_conversation(1, "s")
+        meta_key = service._meta_key(conversation.id)
+        tail_key = service._tail_key(conversation.id)
+
+        await add_messages(service, conversation.id, 3)
+        assert await fake_redis.exists(meta_key)
+        assert await fake_redis.zcard(tail_key) == 3
+        # 缓存缺少最早的消息时视为未命中，读取数据库后合并补齐
+        await fake_redis.zremrangebyrank(tail_key, 0, 0)
+
+        loaded = await service.get_conversation(conversation.id, user_id=1)
+        assert loaded.message_count == 3
+        assert [m.seq for m in loaded.messages] == [0, 1, 2]
+        assert await fake_redis.zcard(tail_key) == 3
+        # 归属校验读取缓存的元数据，计数可能滞后
+        await add_messages(service, conversation.id, 1)
+        assert (await service.get_conversation_meta(conversation.id, user_id=1)).message_count == 3
+
+        await add_messages(service, conversation.id, 3)
+        assert await fake_redis.exists(meta_key)
+        assert [m.seq for m in await service.get_recent_messages(conversation.id)] == [2, 3, 4, 5, 6]
+        assert [m.seq for m in await service.get_recent_messages(conversation.id, 2)] == [5, 6]
+        # 超过缓存长度时读取数据库
+        assert len(await service.get_recent_messages(conversation.id, 20)) == 7
+
+        assert await service.get_conversation_meta(conversation.id, user_id=2) is None
+
+        assert await service.update_conversation_status(
+            conversation.id, ConversationStatus.ARCHIVED, user_id=1
+        )
+        assert not await fake_redis.exists(meta_key)
+        assert await fake_redis.exists(tail_key)
+
+    @pytest.mark.asyncio
+    async def test_tail_of_legacy_conversation(self, mongo_db, fake_redis):
+        """未迁移的旧文档只截取内嵌消息的尾部."""
+        service = make_service()
+        result = await mongo_db.conversations.insert_one({
+            "user_id": 1,
+            "session_id": "s",
+            "messages": [
+                Message(role=MessageRole.USER, content=f"old{i}").dict() for i in range(8)
+            ],
+        })
+
+        loaded = await service.get_conversation(str(result.inserted_id), user_id=1)
+        assert [m.content for m in loaded.messages] == [f"old{i}" for i in range(3, 8)]
+
+    @pytest.mark.asyncio
+    async def test_cached_meta_checks_owner(self, fake_redis):
+        """缓存命中时仍校验对话归属，不读取数据库."""
+        service = make_service()
+        conversation = service._to_conversation({"_id": ObjectId(), "user_id": 1, "session_id": "s"})
+        await service._cache_meta(conversation)
+
+        assert (await service.get_conversation_meta(conversation.id, user_id=1)).id == conversation.id
+        assert await service.get_conversation_meta(conversation.id, user_id=2) is None
+
+    @pytest.mark.asyncio
+    async def test_tail_cache_ordered_and_trimmed(self, fake_redis):
+        """尾部缓存按序号返回，只保留 tail_size 条."""
+        service = make_service()
+        conversation_id = str(ObjectId())
+        messages = [
+            Message(role=MessageRole.USER, content=f"m{i}", seq=i) for i in range(4)
+        ]
+
+        await service._cache_tail(conversation_id, messages)
+        for seq in (5, 4, 6):
+            await service._append_cached_tail(
+                conversation_id, Message(role=MessageRole.USER, content=f"m{seq}", seq=seq)
+            )
+
+        cached = await service._get_cached_tail(conversation_id)
+        assert [m.seq for m in cached] == [2, 3, 4, 5, 6]
+        assert cached[0].content == "m2"
+
+    @pytest.mark.asyncio
+    async def test_tail_fill_interleaved_with_append(self, fake_redis):
+        """缓存填充与追加消息交错时既不丢失也不重复消息，有缺口时视为未命中."""
+        service = make_service()
+        messages = [
+            Message(role=MessageRole.USER, content=f"m{i}", seq=i) for i in range(6)
+        ]
+
+        # 读取数据库（不含 m4）后，写入方先追加 m4，填充随后才写入缓存
+        lost = str(ObjectId())
+        await service._append_cached_tail(lost, messages[4])
+        assert await service._get_cached_tail(lost) is None
+        await service._cache_tail(lost, messages[:4])
+        assert [m.seq for m in await service._get_cached_tail(lost)] == [0, 1, 2, 3, 4]
+
+        # 读取数据库时已包含 m4，写入方随后又追加 m4
+        duplicated = str(ObjectId())
+        await service._cache_tail(duplicated, messages[:5])
+        await service._append_cached_tail(duplicated, messages[4])
+        assert [m.seq for m in await service._get_cached_tail(duplicated)] == [0, 1, 2, 3, 4]
+
+        # 某次追加没有写入缓存，之后的追加留下缺口
+        gap = str(ObjectId())
+        await service._cache_tail(gap, messages[:4])
+        await service._append_cached_tail(gap, messages[5])
+        assert await service._get_cached_tail(gap) is None
+        await service._cache_tail(gap, messages[1:5])
+        assert [m.seq for m in await service._get_cached_tail(gap)] == [1, 2, 3, 4, 5]
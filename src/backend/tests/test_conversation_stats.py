@@ -0,0 +1,155 @@
+"""对话统计写回缓冲测试."""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
+
+from app.services import conversation_stats
+from app.services.conversation_stats import ConversationStatsBuffer
+
+
+class RecordingCollection:
+    """记录 bulk_write 调用的集合，可设置为抛出指定异常."""
+
+    def __init__(self):
+        self.batches = []
+        self.fail = None
+
+    async def bulk_write(self, operations, ordered=True):
+        if self.fail:
+            raise self.fail
+        self.batches.append([(op._filter, op._doc) for op in operations])
+
+
+@pytest.fixture
+def stats_collection(monkeypatch):
+    """替换统计缓冲使用的数据库."""
+    collection = RecordingCollection()
+
+    async def get_db():
+        return {"conversation_stats": collection}
+
+    monkeypatch.setattr(conversation_stats, "get_mongodb", get_db)
+    return collection
+
+
+class TestConversationStatsBuffer:
+    """统计缓冲测试."""
+
+    @pytest.mark.asyncio
+    async def test_deltas_merged_into_one_bulk_write(self, stats_collection):
+        """多次增量合并，每个用户一条更新，一次批量写入."""
+        buffer = ConversationStatsBuffer(flush_interval=60)
+        first, last = datetime(2024, 1, 1), datetime(2024, 1, 2)
+
+        for _ in range(100):
+            buffer.add(1, {"total_messages": 1, "total_tokens_used": 5, "hourly_distribution.9": 1})
+        buffer.add(1, {"total_conversations": 1}, last_conversation_at=last)
+        buffer.add(1, {"total_conversations": 1}, last_conversation_at=first)
+        buffer.add(2, {"total_conversations": 1, "active_conversations": 1})
+        buffer.add(2, {"total_conversations": -1, "active_conversations": -1})
+        assert buffer.pending(1)["total_messages"] == 100
+
+        assert await buffer.flush() == 1
+        assert stats_collection.batches == [[
+            ({"user_id": 1}, {
+                "$inc": {
+                    "total_messages": 100,
+                    "total_tokens_used": 500,
+                    "hourly_distribution.9": 100,
+                    "total_conversations": 2,
+                },
+                "$max": {"last_conversation_at": last},
+            }),
+        ]]
+        assert buffer.pending(1) == {}
+        assert await buffer.flush() == 0
+
+    @pytest.mark.asyncio
+    async def test_unsent_flush_keeps_deltas(self, stats_collection):
+        """没有发出的写入保留增量，并与之后的增量合并重试."""
+        buffer = ConversationStatsBuffer(flush_interval=60)
+        buffer.add(1, {"total_messages": 2})
+
+        stats_collection.fail = ServerSelectionTimeoutError("mongo unavailable")
+        assert await buffer.flush() == 0
+        buffer.add(1, {"total_messages": 3})
+
+        stats_collection.fail = None
+        assert await buffer.flush() == 1
+        assert stats_collection.batches[0][0][1]["$inc"] == {"total_messages": 5}
+
+    @pytest.mark.asyncio
+    async def test_partial_failure_requeues_failed_ops_only(self, stats_collection):
+        """批量写入部分失败时只重试失败的更新，已生效的增量不重复累加."""
+        buffer = ConversationStatsBuffer(flush_interval=60)
+        for user_id in (1, 2, 3):
+            buffer.add(user_id, {"total_messages": user_id})
+
+        stats_collection.fail = BulkWriteError({
+            "writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate key"}],
+            "nInserted": 0,
+            "nUpserted": 0,
+            "nMatched": 2,
+            "nModified": 2,
+            "nRemoved": 0,
+            "upserted": [],
+        })
+        assert await buffer.flush() == 2
+        assert buffer.pending(1) == {}
+        assert buffer.pending(2) == {"total_messages": 2}
+        assert buffer.pending(3) == {}
+
+        stats_collection.fail = None
+        assert await buffer.flush() == 1
+        assert stats_collection.batches == [[
+            ({"user_id": 2}, {"$inc": {"total_messages": 2}}),
+        ]]
+
+    @pytest.mark.asyncio
+    async def test_ambiguous_failure_drops_batch(self, stats_collection):
+        """无法确定是否生效的失败丢弃该批增量，不重试."""
+        buffer = ConversationStatsBuffer(flush_interval=60)
+        buffer.add(1, {"total_messages": 2})
+
+        stats_collection.fail = ConnectionError("connection reset")
+        assert await buffer.flush() == 0
+        assert buffer.pending(1) == {}
+
+        stats_collection.fail = None
+        assert await buffer.flush() == 0
+        assert stats_collection.batches == []
+
+    @pytest.mark.asyncio
+    async def test_discard(self, stats_collection):
+        """丢弃单个用户的增量."""
+        buffer = ConversationStatsBuffer(flush_interval=60)
+        buffer.add(1, {"total_messages": 1})
+        buffer.add(2, {"total_messages": 1})
+
+        buffer.discard(1)
+        buffer.discard(3)
+        assert await buffer.flush() == 1
+        assert stats_collection.batches == [[
+            ({"user_id": 2}, {"$inc": {"total_messages": 1}}),
+        ]]
+
+    @pytest.mark.asyncio
+    async def test_background_flush(self, stats_collection):
+        """后台任务定期写入，用户数达到上限时提前写入，停止时写入剩余增量."""
+        buffer = ConversationStatsBuffer(flush_interval=60, max_pending_users=3)
+        await buffer.start()
+
+        for user_id in range(3):
+            buffer.add(user_id, {"total_messages": 1})
+        await asyncio.sleep(0.05)
+        assert len(stats_collection.batches) == 1
+        assert len(stats_collection.batches[0]) == 3
+
+        buffer.add(9, {"total_messages": 1})
+        await buffer.stop()
+        assert stats_collection.batches[-1] == [
+            ({"user_id": 9}, {"$inc": {"total_messages": 1}})
+        ]
@@ -0,0 +1,375 @@
+"""文件服务流式上传和下载测试."""
+
+import hashlib
+import io
+import tracemalloc
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI, UploadFile
+from httpx import AsyncClient
+from minio.error import S3Error
+from minio.helpers import read_part_data
+
+from app.api.v1.files import router as files_router
+from app.config import settings
+from app.core.database import get_db
+from app.core.exceptions import FileTooLargeError
+from app.dependencies.auth import get_current_user
+from app.models.file import File, FileStatus, FileType
+from app.services import file as file_module
+from app.services.file import FileService, UploadStream
+from app.utils.minio_client import MinIOClient
+
+MB = 1024 * 1024
+PART_SIZE = 5 * MB
+
+
+class ZeroStream(io.RawIOBase):
+    """按需生成数据的输入流（不占用与总大小成比例的内存）."""
+
+    def __init__(self, size: int, head: bytes = b""):
+        self.remaining = size
+        self.head = head
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = self.remaining
+        if self.head:
+            data, self.head = self.head[:size], self.head[size:]
+        else:
+            data = b"\x00" * min(size, self.remaining)
+        self.remaining -= len(data)
+        return data
+
+
+class StreamingMinio:
+    """按分片读取并丢弃数据的 minio.Minio 替身."""
+
+    def __init__(self):
+        self.buckets = {"tradeflow-storage"}
+        self.uploads = []
+        self.removed = []
+
+    def bucket_exists(self, bucket):
+        return bucket in self.buckets
+
+    def put_object(self, bucket, object_name, data, length, content_type=None,
+                   metadata=None, part_size=0):
+        assert length == -1
+        parts = 0
+        while read_part_data(data, part_size):
+            parts += 1
+        self.uploads.append({"object": object_name, "content_type": content_type, "parts": parts})
+        return SimpleNamespace(etag="etag")
+
+    def remove_object(self, bucket, object_name):
+        self.removed.append(object_name)
+
+    def presigned_get_object(self, bucket, object_name, expires):
+        return f"http://minio/{bucket}/{object_name}"
+
+
+class FakeSession:
+    """记录提交和回滚的数据库会话."""
+
+    def __init__(self):
+        self.added = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    """替换文件服务使用的MinIO客户端."""
+    fake = StreamingMinio()
+    client = MinIOClient(max_workers=2)
+    client._client = fake
+    monkeypatch.setattr(file_module, "minio_client", client)
+    yield fake
+
+
+class TestUploadStream:
+    """上传读取包装测试."""
+
+    def test_checksum_and_size_incremental(self):
+        """分块读取时累计校验和与大小，首个分块先被重放."""
+        data = b"trade,flow\n" * 10000
+        raw = io.BytesIO(data)
+        head = raw.read(100)
+        stream = UploadStream(raw, max_size=len(data), head=head)
+
+        chunks = []
+        while chunk := stream.read(4096):
+            chunks.append(chunk)
+
+        assert b"".join(chunks) == data
+        assert stream.size == len(data)
+        assert stream.checksum == hashlib.sha256(data).hexdigest()
+
+    def test_rejected_when_limit_crossed(self):
+        """累计大小超过上限时立即抛出，不再读取剩余数据."""
+        raw = ZeroStream(100 * MB)
+        stream = UploadStream(raw, max_size=MB)
+
+        with pytest.raises(FileTooLargeError):
+            while stream.read(256 * 1024):
+                pass
+        assert raw.remaining == 100 * MB - MB - 256 * 1024
+
+
+class TestStreamingUpload:
+    """文件服务流式上传和下载测试."""
+
+    @pytest.mark.asyncio
+    async def test_upload_streams_in_parts(self, storage):
+        """上传按分片写入存储，只用首个分块检测类型，内存与文件大小无关."""
+        service = FileService()
+        db = FakeSession()
+        size = 18 * MB
+        upload = UploadFile(ZeroStream(size, head=b"%PDF-1.4\n"), filename="report.csv")
+
+        tracemalloc.start()
+        record = await service.upload_file(db, upload, user_id=1)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert record.file_size == size
+        assert record.file_type == FileType.CSV
+        assert record.mime_type == "application/pdf"
+        assert record.status == FileStatus.READY
+        assert record.checksum == hashlib.sha256(
+            b"%PDF-1.4\n" + b"\x00" * (size - 9)
+        ).hexdigest()
+        assert storage.uploads[0]["parts"] == 4
+        assert storage.uploads[0]["content_type"] == "application/pdf"
+        assert peak < 3 * PART_SIZE
+
+    @pytest.mark.asyncio
+    async def test_oversized_upload_rejected_early(self, storage):
+        """超过类型大小上限时中止写入存储并抛出 FileTooLargeError，不创建记录."""
+        service = FileService()
+        db = FakeSession()
+        upload = UploadFile(ZeroStream(200 * MB), filename="data.xlsx")
+
+        with pytest.raises(FileTooLargeError) as exc_info:
+            await service.upload_file(db, upload, user_id=1)
+        assert exc_info.value.status_code == 413
+        assert db.added == []
+        assert storage.uploads == []
+        # 上限20MB，最多多读一个分片
+        assert upload.file.remaining >= 200 * MB - 20 * MB - PART_SIZE
+
+        declared = UploadFile(ZeroStream(0), filename="a.png", size=11 * MB)
+        with pytest.raises(FileTooLargeError):
+            await service.upload_file(db, declared, user_id=1)
+
+    @pytest.mark.asyncio
+    async def test_failed_record_removes_object(self, storage):
+        """创建文件记录失败时删除已上传的对象."""
+        service = FileService()
+        db = FakeSession()
+
+        async def fail_commit():
+            raise RuntimeError("database unavailable")
+
+        db.commit = fail_commit
+        upload = UploadFile(io.BytesIO(b"hello"), filename="a.txt")
+
+        assert await service.upload_file(db, upload, user_id=1) is None
+        assert storage.removed == [storage.uploads[0]["object"]]
+
+
+class ObjectResponse:
+    """get_object 返回的流式响应，记录每次读取的大小."""
+
+    def __init__(self, data: bytes, reads: list):
+        self.stream = io.BytesIO(data)
+        self.reads = reads
+        self.released = False
+
+    def read(self, amt=None):
+        self.reads.append(amt)
+        return self.stream.read(amt)
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        self.released = True
+
+
+class ObjectMinio:
+    """保存单个对象并支持范围读取和 If-Match 的 minio.Minio 替身."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.etag = "d41d8cd9"
+        self.reads = []
+        self.responses = []
+        # 每次 stat 之后执行（模拟对象在两次请求之间被替换）
+        self.after_stat = None
+
+    def stat_object(self, bucket, object_name):
+        stat = SimpleNamespace(
+            size=len(self.data),
+            etag=self.etag,
+            content_type="text/csv",
+            last_modified=datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+            metadata={},
+            version_id=None,
+        )
+        if self.after_stat:
+            self.after_stat()
+        return stat
+
+    def get_object(self, bucket, object_name, offset=0, length=0, request_headers=None):
+        if_match = (request_headers or {}).get("If-Match")
+        if if_match and if_match != f'"{self.etag}"':
+            raise S3Error(None, "PreconditionFailed", "etag mismatch", object_name, "req", "host")
+        end = offset + length if length else len(self.data)
+        response = ObjectResponse(self.data[offset:end], self.reads)
+        self.responses.append(response)
+        return response
+
+
+class TestStreamingDownload:
+    """文件流式下载接口测试."""
+
+    DATA = bytes(range(256)) * 4096  # 1MB
+
+    @pytest_asyncio.fixture
+    async def client(self, monkeypatch):
+        """只挂载文件路由的应用，存储和文件记录使用替身."""
+        storage = ObjectMinio(self.DATA)
+        minio = MinIOClient(max_workers=2)
+        minio._client = storage
+        monkeypatch.setattr(file_module, "minio_client", minio)
+
+        record = File(
+            id=1,
+            original_name="报表.csv",
+            mime_type="text/csv",
+            storage_key="1/abc/报表.csv",
+            status=FileStatus.READY,
+        )
+
+        async def get_file(db, file_id, user_id=None):
+            return record if file_id == 1 else None
+
+        monkeypatch.setattr(file_module.file_service, "get_file", get_file)
+
+        app = FastAPI()
+        app.include_router(files_router, prefix="/files")
+        app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=1)
+        app.dependency_overrides[get_db] = lambda: None
+
+        async with AsyncClient(app=app, base_url="http://test") as http:
+            yield http, storage
+        await minio.close()
+
+    @pytest.mark.asyncio
+    async def test_full_download_streamed(self, client):
+        """完整下载按块读取，返回 ETag 和文件名."""
+        http, storage = client
+        response = await http.get("/files/1/download")
+
+        assert response.status_code == 200
+        assert response.content == self.DATA
+        assert response.headers["content-length"] == str(len(self.DATA))
+        assert response.headers["etag"] == '"d41d8cd9"'
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["last-modified"] == "Tue, 02 Jan 2024 03:04:05 GMT"
+        assert "filename*=UTF-8''%E6%8A%A5%E8%A1%A8.csv" in response.headers["content-disposition"]
+        assert max(storage.reads) == settings.MINIO_DOWNLOAD_CHUNK_SIZE
+        assert storage.responses[0].released
+
+        assert (await http.get("/files/2/download")).status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_range_requests(self, client):
+        """Range 返回 206，If-Range 不匹配时返回完整内容，越界返回 416."""
+        http, _ = client
+
+        response = await http.get("/files/1/download", headers={"Range": "bytes=1000-1999"})
+        assert response.status_code == 206
+        assert response.content == self.DATA[1000:2000]
+        assert response.headers["content-range"] == f"bytes 1000-1999/{len(self.DATA)}"
+
+        response = await http.get("/files/1/download", headers={"Range": "bytes=-10"})
+        assert response.content == self.DATA[-10:]
+
+        response = await http.get(
+            "/files/1/download", headers={"Range": "bytes=0-9", "If-Range": '"d41d8cd9"'}
+        )
+        assert response.status_code == 206
+
+        response = await http.get(
+            "/files/1/download", headers={"Range": "bytes=0-9", "If-Range": '"changed"'}
+        )
+        assert response.status_code == 200
+        assert len(response.content) == len(self.DATA)
+
+        response = await http.get(
+            "/files/1/download", headers={"Range": f"bytes={len(self.DATA)}-"}
+        )
+        assert response.status_code == 416
+        assert response.headers["content-range"] == f"bytes */{len(self.DATA)}"
+
+    @pytest.mark.asyncio
+    async def test_not_modified(self, client):
+        """If-None-Match 匹配时返回 304，不读取对象."""
+        http, storage = client
+        response = await http.get("/files/1/download", headers={"If-None-Match": '"d41d8cd9"'})
+
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == '"d41d8cd9"'
+        assert storage.responses == []
+
+    @pytest.mark.asyncio
+    async def test_object_replaced_between_stat_and_get(self, client):
+        """对象在读取信息后被替换时重新读取，响应头与内容属于同一版本."""
+        http, storage = client
+        new_data = b"replaced"
+
+        def replace_once():
+            storage.after_stat = None
+            storage.data, storage.etag = new_data, "feedbeef"
+
+        storage.after_stat = replace_once
+        response = await http.get("/files/1/download")
+
+        assert response.status_code == 200
+        assert response.content == new_data
+        assert response.headers["etag"] == '"feedbeef"'
+        assert response.headers["content-length"] == str(len(new_data))
+
+    @pytest.mark.asyncio
+    async def test_object_keeps_changing(self, client):
+        """对象持续被替换时返回 409."""
+        http, storage = client
+        versions = iter(range(100))
+
+        def replace():
+            storage.etag = f"v{next(versions)}"
+
+        storage.after_stat = replace
+        response = await http.get("/files/1/download", headers={"Range": "bytes=0-9"})
+
+        assert response.status_code == 409
+        assert storage.responses == []
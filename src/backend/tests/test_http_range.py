@@ -0,0 +1,71 @@
+"""HTTP范围请求工具测试."""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from app.utils.http_range import (
+    RangeNotSatisfiable,
+    etag_matches,
+    format_http_date,
+    if_range_matches,
+    parse_range,
+)
+
+
+class TestParseRange:
+    """Range 请求头解析测试."""
+
+    @pytest.mark.parametrize("header,expected", [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 999)),
+        ("bytes=-200", (800, 999)),
+        ("bytes=-5000", (0, 999)),
+        ("bytes=900-5000", (900, 999)),
+        ("bytes= 10 - 20", (10, 20)),
+    ])
+    def test_single_range(self, header, expected):
+        """单个范围（含后缀范围和越界的结束位置）."""
+        assert parse_range(header, 1000) == expected
+
+    @pytest.mark.parametrize("header", [
+        None, "", "items=0-1", "bytes=0-1,5-6", "bytes=abc", "bytes=5-1", "bytes=-", "bytes=-1-2",
+    ])
+    def test_ignored(self, header):
+        """缺失、无法识别或多个范围时返回完整内容."""
+        assert parse_range(header, 1000) is None
+
+    @pytest.mark.parametrize("header", ["bytes=1000-", "bytes=2000-3000", "bytes=-0"])
+    def test_unsatisfiable(self, header):
+        """范围与资源没有交集."""
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range(header, 1000)
+
+
+class TestConditionalHeaders:
+    """条件请求头测试."""
+
+    def test_etag_matches(self):
+        """If-None-Match 使用弱比较，支持列表和 *."""
+        assert etag_matches('"abc"', '"abc"')
+        assert etag_matches('W/"abc"', '"abc"')
+        assert etag_matches('"x", "abc"', '"abc"')
+        assert etag_matches("*", '"abc"')
+        assert not etag_matches('"abcd"', '"abc"')
+        assert not etag_matches(None, '"abc"')
+
+    def test_if_range(self):
+        """If-Range 实体标签要求强匹配，日期要求与最后修改时间一致."""
+        modified = datetime(2024, 1, 2, 3, 4, 5, 600000, tzinfo=timezone.utc)
+
+        assert if_range_matches(None, '"abc"', modified)
+        assert if_range_matches('"abc"', '"abc"', modified)
+        assert not if_range_matches('W/"abc"', '"abc"', modified)
+        assert not if_range_matches('"old"', '"abc"', modified)
+        assert if_range_matches(format_http_date(modified), '"abc"', modified)
+        assert not if_range_matches("Mon, 01 Jan 2024 00:00:00 GMT", '"abc"', modified)
+        assert not if_range_matches("not a date", '"abc"', modified)
+
+    def test_format_http_date(self):
+        """HTTP 日期使用 GMT，无时区时按 UTC 处理."""
+        assert format_http_date(datetime(2024, 1, 2, 3, 4, 5)) == "Tue, 02 Jan 2024 03:04:05 GMT"
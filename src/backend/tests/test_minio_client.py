@@ -0,0 +1,152 @@
+"""MinIO客户端测试（使用本地替身模拟阻塞的 minio SDK）."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from minio.error import S3Error
+from prometheus_client import REGISTRY
+
+from app.core.exceptions import ExternalServiceError
+from app.utils.minio_client import MinIOClient
+
+CHUNK = 1024 * 1024
+
+
+class FakeResponse:
+    """get_object 返回的响应."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.closed = False
+        self.released = False
+
+    def read(self) -> bytes:
+        return self.data
+
+    def close(self) -> None:
+        self.closed = True
+
+    def release_conn(self) -> None:
+        self.released = True
+
+
+class FakeMinio:
+    """同步阻塞的 minio.Minio 替身，按块读取上传数据并模拟网络耗时."""
+
+    def __init__(self, chunk_delay: float = 0.0):
+        self.chunk_delay = chunk_delay
+        self.buckets = set()
+        self.objects = {}
+        self.calls = []
+        self.responses = []
+
+    def bucket_exists(self, bucket):
+        self.calls.append("bucket_exists")
+        time.sleep(0.01)
+        return bucket in self.buckets
+
+    def make_bucket(self, bucket):
+        self.calls.append("make_bucket")
+        self.buckets.add(bucket)
+
+    def set_bucket_policy(self, bucket, policy):
+        self.calls.append("set_bucket_policy")
+
+    def put_object(self, bucket, object_name, data, length, content_type=None, metadata=None):
+        self.calls.append("put_object")
+        if bucket not in self.buckets:
+            raise S3Error(None, "NoSuchBucket", "bucket removed", bucket, "req", "host")
+        received = bytearray()
+        while chunk := data.read(CHUNK):
+            received.extend(chunk)
+            time.sleep(self.chunk_delay)
+        self.objects[(bucket, object_name)] = bytes(received)
+        return SimpleNamespace(etag="etag")
+
+    def get_object(self, bucket, object_name):
+        response = FakeResponse(self.objects[(bucket, object_name)])
+        self.responses.append(response)
+        return response
+
+    def stat_object(self, bucket, object_name):
+        return SimpleNamespace(metadata={"uploaded_by": "test"})
+
+
+def make_client(fake: FakeMinio) -> MinIOClient:
+    """创建使用替身的客户端."""
+    client = MinIOClient(max_workers=4)
+    client._client = fake
+    return client
+
+
+class TestMinIOClient:
+    """MinIO客户端测试."""
+
+    @pytest.mark.asyncio
+    async def test_large_upload_does_not_block_loop(self):
+        """上传大文件期间事件循环保持响应."""
+        fake = FakeMinio(chunk_delay=0.01)
+        client = make_client(fake)
+        await client.ensure_bucket_exists("bucket")
+
+        max_lag = 0.0
+        done = asyncio.Event()
+
+        async def ticker():
+            nonlocal max_lag
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                max_lag = max(max_lag, time.perf_counter() - start - 0.005)
+
+        ticker_task = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        await client.upload_file(b"x" * (32 * CHUNK), "big.bin", bucket_name="bucket")
+        elapsed = time.perf_counter() - start
+        done.set()
+        await ticker_task
+        await client.close()
+
+        assert len(fake.objects[("bucket", "big.bin")]) == 32 * CHUNK
+        # 上传本身耗时约 0.3 秒，直接在事件循环中调用时延迟等于整个上传时间
+        assert elapsed > 0.3
+        assert max_lag < 0.1
+
+    @pytest.mark.asyncio
+    async def test_bucket_check_cached(self):
+        """存储桶检查只执行一次（包括并发上传），被删除后重新检查."""
+        fake = FakeMinio()
+        client = make_client(fake)
+
+        await asyncio.gather(*(
+            client.upload_file(b"data", f"f{i}", bucket_name="bucket") for i in range(5)
+        ))
+        assert fake.calls.count("bucket_exists") == 1
+        assert fake.calls.count("make_bucket") == 1
+
+        fake.buckets.clear()
+        with pytest.raises(ExternalServiceError):
+            await client.upload_file(b"data", "f", bucket_name="bucket")
+
+        await client.upload_file(b"data", "f", bucket_name="bucket")
+        assert fake.calls.count("bucket_exists") == 2
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_download_releases_connection_and_records_metrics(self):
+        """下载后释放连接，并按操作记录耗时."""
+        fake = FakeMinio()
+        fake.objects[("bucket", "a.txt")] = b"hello"
+        client = make_client(fake)
+        labels = {"operation": "get_object", "status": "ok"}
+        before = REGISTRY.get_sample_value("minio_operation_seconds_count", labels) or 0
+
+        data, metadata = await client.download_file("a.txt", bucket_name="bucket")
+        await client.close()
+
+        assert data == b"hello"
+        assert metadata == {"uploaded_by": "test"}
+        assert fake.responses[0].closed and fake.responses[0].released
+        assert REGISTRY.get_sample_value("minio_operation_seconds_count", labels) == before + 1
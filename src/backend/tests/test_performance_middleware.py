@@ -0,0 +1,113 @@
+"""性能中间件测试."""
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.middleware.performance import RateLimitMiddleware
+
+
+async def ok_app(scope, receive, send):
+    """总是返回200的ASGI应用."""
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def call(middleware: RateLimitMiddleware, client_ip: str):
+    """以指定客户端IP调用中间件，返回 (状态码, 响应头)."""
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [],
+        "client": (client_ip, 12345),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    start = messages[0]
+    headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    return start["status"], headers
+
+
+class TestRateLimitMiddleware:
+    """进程内速率限制测试."""
+
+    @pytest.mark.asyncio
+    async def test_limit_and_headers(self):
+        """超过限制返回429，通过的请求带剩余次数头."""
+        middleware = RateLimitMiddleware(ok_app, requests_per_minute=3)
+
+        remaining = []
+        for _ in range(3):
+            status, headers = await call(middleware, "1.1.1.1")
+            assert status == 200
+            assert headers["x-ratelimit-limit"] == "3"
+            remaining.append(headers["x-ratelimit-remaining"])
+        assert remaining == ["2", "1", "0"]
+
+        status, headers = await call(middleware, "1.1.1.1")
+        assert status == 429
+        assert 0 < int(headers["retry-after"]) <= 60
+
+        # 其他IP不受影响
+        assert (await call(middleware, "2.2.2.2"))[0] == 200
+
+    @pytest.mark.asyncio
+    async def test_previous_window_weighted(self, monkeypatch):
+        """上一个窗口的计数按剩余比例计入估计值."""
+        now = [6000.0]
+        monkeypatch.setattr("app.middleware.performance.time.monotonic", lambda: now[0])
+        middleware = RateLimitMiddleware(ok_app, requests_per_minute=10)
+
+        for _ in range(10):
+            assert (await call(middleware, "ip"))[0] == 200
+        assert (await call(middleware, "ip"))[0] == 429
+
+        # 下一个窗口过去一半：上一窗口计为 10 * 0.5 = 5
+        now[0] += 90
+        statuses = [(await call(middleware, "ip"))[0] for _ in range(6)]
+        assert statuses == [200] * 5 + [429]
+
+        # 两个窗口之后计数清零
+        now[0] += 120
+        assert (await call(middleware, "ip"))[1]["x-ratelimit-remaining"] == "9"
+
+    @pytest.mark.asyncio
+    async def test_client_table_is_bounded(self):
+        """客户端表按LRU淘汰，内存有上限并记录淘汰次数."""
+        middleware = RateLimitMiddleware(ok_app, requests_per_minute=50, max_clients=100)
+        before = REGISTRY.get_sample_value("http_rate_limit_evictions_total") or 0
+
+        await call(middleware, "keep")
+        for i in range(1000):
+            await call(middleware, f"10.0.{i // 256}.{i % 256}")
+            if i % 50 == 0:
+                await call(middleware, "keep")
+
+        assert len(middleware.clients) == 100
+        assert "keep" in middleware.clients
+        assert middleware.clients["keep"].current == 21
+        after = REGISTRY.get_sample_value("http_rate_limit_evictions_total")
+        assert after - before == 1001 - 100
+        assert REGISTRY.get_sample_value("http_rate_limit_tracked_clients") == 100
+
+    @pytest.mark.asyncio
+    async def test_non_http_passthrough(self):
+        """非HTTP请求直接透传."""
+        seen = []
+
+        async def app(scope, receive, send):
+            seen.append(scope["type"])
+
+        middleware = RateLimitMiddleware(app, requests_per_minute=1)
+        for _ in range(3):
+            await middleware({"type": "lifespan"}, None, None)
+
+        assert seen == ["lifespan"] * 3
+        assert not middleware.clients
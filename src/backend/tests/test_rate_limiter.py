@@ -0,0 +1,184 @@
+"""限流服务测试."""
+
+import asyncio
+
+import pytest
+
+from app.services.rate_limiter import MultiDimensionalRateLimiter, RateLimiter
+
+
+class TestRateLimiter:
+    """单维度限流测试."""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("algorithm", ["gcra", "sliding_log"])
+    async def test_concurrent_requests_never_exceed_limit(self, fake_redis, algorithm):
+        """大量并发请求（跨多个限流器实例）通过数恰好等于限制."""
+        limiters = [
+            RateLimiter(key_prefix="test", default_limit=50, default_window=60, algorithm=algorithm)
+            for _ in range(4)
+        ]
+
+        results = await asyncio.gather(*[
+            limiters[i % 4].check_rate_limit("user:1") for i in range(400)
+        ])
+
+        allowed = [r for r in results if r[0]]
+        assert len(allowed) == 50
+        assert sorted(r[1] for r in allowed) == list(range(50))
+        assert all(r[1] == 0 for r in results if not r[0])
+
+    @pytest.mark.asyncio
+    async def test_gcra_uses_constant_memory(self, fake_redis):
+        """GCRA每个标识符只保存一个字符串键."""
+        limiter = RateLimiter(key_prefix="test", default_limit=1000, default_window=3600)
+
+        for _ in range(200):
+            await limiter.check_rate_limit("user:1")
+
+        assert await fake_redis.keys("test:*") == ["test:user:1"]
+        assert await fake_redis.type("test:user:1") == "string"
+        assert 0 < await fake_redis.pttl("test:user:1") <= 3600 * 1000
+
+    @pytest.mark.asyncio
+    async def test_gcra_remaining_and_reset(self, fake_redis):
+        """返回剩余次数和重置时间，令牌按速率补充."""
+        limiter = RateLimiter(key_prefix="test", default_limit=5, default_window=1)
+
+        for expected in (4, 3, 2, 1, 0):
+            allowed, remaining, reset_time = await limiter.check_rate_limit("ip")
+            assert allowed and remaining == expected
+
+        allowed, remaining, _ = await limiter.check_rate_limit("ip")
+        assert not allowed and remaining == 0
+
+        used, remaining, _ = await limiter.get_rate_limit_info("ip")
+        assert (used, remaining) == (5, 0)
+
+        # 每200ms补充一个令牌
+        await asyncio.sleep(0.25)
+        allowed, remaining, _ = await limiter.check_rate_limit("ip")
+        assert allowed and remaining == 0
+
+    @pytest.mark.asyncio
+    async def test_cost_and_info_do_not_record(self, fake_redis):
+        """查询不消耗配额；超过剩余配额的请求不记录."""
+        limiter = RateLimiter(key_prefix="test", default_limit=10, default_window=60)
+
+        assert (await limiter.get_rate_limit_info("k"))[1] == 10
+        assert (await limiter.check_rate_limit("k", cost=4))[:2] == (True, 6)
+        assert (await limiter.check_rate_limit("k", cost=7))[:2] == (False, 6)
+        assert (await limiter.check_rate_limit("k", cost=6))[:2] == (True, 0)
+
+    @pytest.mark.asyncio
+    async def test_sliding_log_expires_entries(self, fake_redis):
+        """滑动日志在窗口过后释放配额."""
+        limiter = RateLimiter(
+            key_prefix="test", default_limit=2, default_window=1, algorithm="sliding_log"
+        )
+
+        assert (await limiter.check_rate_limit("k"))[0]
+        assert (await limiter.check_rate_limit("k"))[0]
+        assert not (await limiter.check_rate_limit("k"))[0]
+
+        await asyncio.sleep(1.05)
+        assert (await limiter.check_rate_limit("k"))[:2] == (True, 1)
+
+    def test_unknown_algorithm(self):
+        """未知算法直接报错."""
+        with pytest.raises(ValueError):
+            RateLimiter(algorithm="leaky")
+
+
+class TestMultiDimensionalRateLimiter:
+    """多维度限流测试."""
+
+    @pytest.mark.asyncio
+    async def test_single_round_trip_per_request(self, fake_redis, monkeypatch):
+        """所有维度在一次脚本调用中判定，全局键每批请求只访问一次."""
+        limiter = MultiDimensionalRateLimiter(global_lease_size=10)
+        calls = []
+        execute_command = fake_redis.execute_command
+
+        async def counting(*args, **kwargs):
+            calls.append(args)
+            return await execute_command(*args, **kwargs)
+
+        monkeypatch.setattr(fake_redis, "execute_command", counting)
+
+        for _ in range(20):
+            allowed, results = await limiter.check_limits(
+                user_id=1, ip_address="1.2.3.4", endpoint="/api"
+            )
+            assert allowed
+            assert set(results) == {"user", "ip", "endpoint", "global"}
+
+        scripts = [c for c in calls if c[0] == "EVALSHA"]
+        assert len(scripts) == 20
+        # 首次租用后，本地配额低于一半时随其他维度的调用提前续租
+        global_calls = [c for c in scripts if "rate_limit:global:global" in c]
+        assert len(global_calls) == 3
+
+        # 全局桶按租约批量扣减
+        assert results["global"]["leased"]
+        assert results["ip"]["remaining"] == 80
+
+    @pytest.mark.asyncio
+    async def test_denied_dimension_records_nothing(self, fake_redis):
+        """任一维度拒绝时，其他维度和本地租约都不消耗."""
+        limiter = MultiDimensionalRateLimiter(global_lease_size=5)
+        custom = {"endpoint_limit": 2}
+
+        for _ in range(2):
+            assert (await limiter.check_limits(
+                user_id=1, endpoint="/x", custom_limits=custom
+            ))[0]
+
+        allowed, results = await limiter.check_limits(
+            user_id=1, endpoint="/x", custom_limits=custom
+        )
+        assert not allowed
+        assert not results["endpoint"]["allowed"]
+        assert results["user"]["allowed"] and results["user"]["remaining"] == 998
+        assert limiter.global_allowance.tokens == 3
+
+        # 用户维度不受拒绝请求影响
+        allowed, results = await limiter.check_limits(user_id=1)
+        assert allowed and results["user"]["remaining"] == 997
+
+    @pytest.mark.asyncio
+    async def test_global_limit_never_exceeded_across_processes(self, fake_redis):
+        """多个进程（实例）并发租用时全局通过数不超过全局限制."""
+        limiters = [MultiDimensionalRateLimiter(global_lease_size=7) for _ in range(4)]
+        for limiter in limiters:
+            limiter.global_limiter.default_limit = 50
+
+        results = await asyncio.gather(*[
+            limiters[i % 4].check_limits(ip_address=f"10.0.0.{i % 50}") for i in range(400)
+        ])
+
+        allowed = sum(1 for ok, _ in results if ok)
+        # 每个进程同一时刻只租一批；租到的配额在并发突发中暂未用完，但不会超发
+        assert 50 - 4 * 7 < allowed <= 50
+
+        # 之后的请求消耗本地剩余配额，总通过数恰好等于全局限制
+        for limiter in limiters:
+            while (await limiter.check_limits())[0]:
+                allowed += 1
+        assert allowed == 50
+
+    @pytest.mark.asyncio
+    async def test_lease_expires(self, fake_redis, monkeypatch):
+        """租约过期后剩余本地配额作废并重新租用."""
+        now = [100.0]
+        monkeypatch.setattr("app.services.rate_limiter.time.monotonic", lambda: now[0])
+        limiter = MultiDimensionalRateLimiter(global_lease_size=10, global_lease_ttl=1.0)
+
+        await limiter.check_limits()
+        assert limiter.global_allowance.tokens == 9
+
+        now[0] += 2
+        _, results = await limiter.check_limits()
+        assert "leased" not in results["global"]
+        assert results["global"]["remaining"] == 10000 - 20
+        assert limiter.global_allowance.tokens == 9
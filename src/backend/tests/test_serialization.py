@@ -0,0 +1,125 @@
+"""序列化模块测试."""
+
+import json
+from datetime import datetime, timezone
+from enum import Enum
+from uuid import UUID
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.services.sse_converter import SSEConverter, SSEEventType
+from app.utils import serialization
+from app.utils.serialization import FastJSONResponse, dumps, dumps_bytes, loads
+
+
+class Color(Enum):
+    """测试用枚举."""
+    RED = "red"
+
+
+SAMPLE = {
+    "id": ObjectId("65a1b2c3d4e5f6a7b8c9d0e1"),
+    "created_at": datetime(2024, 1, 2, 3, 4, 5, 678000),
+    "updated_at": datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    "color": Color.RED,
+    "event": SSEEventType.CHUNK,
+    "uid": UUID("12345678-1234-5678-1234-567812345678"),
+    "text": "贸易数据",
+    "tags": {"a"},
+    1: "int-key",
+}
+
+EXPECTED = {
+    "id": "65a1b2c3d4e5f6a7b8c9d0e1",
+    "created_at": "2024-01-02T03:04:05.678000",
+    "updated_at": "2024-01-02T03:04:05+00:00",
+    "color": "red",
+    "event": "chunk",
+    "uid": "12345678-1234-5678-1234-567812345678",
+    "text": "贸易数据",
+    "tags": ["a"],
+    "1": "int-key",
+}
+
+
+@pytest.fixture(params=[True, False], ids=["orjson", "stdlib"])
+def backend(request, monkeypatch):
+    """分别使用 orjson 和标准库 json 运行."""
+    if request.param and not serialization.HAS_ORJSON:
+        pytest.skip("orjson 未安装")
+    monkeypatch.setattr(serialization, "HAS_ORJSON", request.param)
+    return request.param
+
+
+class TestSerialization:
+    """JSON序列化测试."""
+
+    def test_extended_types(self, backend):
+        """datetime/ObjectId/Enum/UUID 等类型在两种实现下输出一致."""
+        encoded = dumps_bytes(SAMPLE)
+        assert isinstance(encoded, bytes)
+        assert json.loads(encoded) == EXPECTED
+        assert "贸易数据" in dumps(SAMPLE)
+        assert loads(encoded) == EXPECTED
+        assert loads(encoded.decode()) == EXPECTED
+
+    def test_compact_output(self, backend):
+        """两种实现的输出逐字节相同."""
+        assert dumps_bytes({"a": [1, 2], "b": None}) == b'{"a":[1,2],"b":null}'
+
+    def test_unsupported_type(self, backend):
+        """不支持的类型抛出 TypeError."""
+        with pytest.raises(TypeError):
+            dumps(object())
+
+    def test_invalid_input(self, backend):
+        """解析失败抛出 JSONDecodeError."""
+        with pytest.raises(serialization.JSONDecodeError):
+            loads("{invalid")
+
+    def test_default_response_class(self, backend):
+        """FastJSONResponse 可直接返回含 datetime/ObjectId 的数据."""
+        app = FastAPI(default_response_class=FastJSONResponse)
+
+        @app.get("/item")
+        async def item():
+            return FastJSONResponse({"id": SAMPLE["id"], "at": SAMPLE["created_at"]})
+
+        @app.get("/plain")
+        async def plain():
+            return {"text": "贸易数据"}
+
+        client = TestClient(app)
+        assert client.get("/item").json() == {
+            "id": "65a1b2c3d4e5f6a7b8c9d0e1",
+            "at": "2024-01-02T03:04:05.678000",
+        }
+        response = client.get("/plain")
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == '{"text":"贸易数据"}'.encode()
+
+
+class TestSSEEncoding:
+    """SSE事件编码测试."""
+
+    def test_encode_matches_format(self, backend):
+        """bytes 编码与字符串格式化结果一致，帧格式不变."""
+        data = {"text": "你好", "at": SAMPLE["created_at"]}
+        encoded = SSEConverter.encode_sse_event(SSEEventType.CHUNK, data, "1-0")
+        assert encoded == (
+            'id: 1-0\nevent: chunk\ndata: {"text":"你好","at":"2024-01-02T03:04:05.678000"}\n\n'
+        ).encode()
+        assert SSEConverter.format_sse_event(SSEEventType.CHUNK, data, "1-0") == encoded.decode()
+
+    def test_custom_event_name(self, backend):
+        """自定义事件名与枚举值字符串都能编码."""
+        assert SSEConverter.encode_sse_event("notice", {}) == b"event: notice\ndata: {}\n\n"
+        assert SSEConverter.encode_sse_event("done", {}) == b"event: done\ndata: {}\n\n"
+
+    def test_unserializable_data_becomes_error_event(self, backend):
+        """无法序列化的数据转为错误事件."""
+        encoded = SSEConverter.encode_sse_event(SSEEventType.MESSAGE, {"x": object()})
+        assert encoded.startswith(b"event: error\ndata: ")
@@ -0,0 +1,327 @@
+"""会话管理器测试."""
+
+import asyncio
+from datetime import timedelta
+
+import pytest
+from redis.asyncio.client import Pipeline
+
+from app.services.session_manager import ExtractiveSummarizer, SessionManager
+
+
+@pytest.fixture
+def manager(fake_redis) -> SessionManager:
+    """使用假Redis的会话管理器."""
+    manager = SessionManager()
+    manager.redis = fake_redis
+    return manager
+
+
+@pytest.fixture
+def round_trips(fake_redis, monkeypatch):
+    """统计Redis往返次数：单条命令或一次管道执行各计一次."""
+    counter = {"count": 0}
+
+    original_execute_command = fake_redis.execute_command
+    original_pipeline_execute = Pipeline.execute
+
+    async def execute_command(*args, **kwargs):
+        counter["count"] += 1
+        return await original_execute_command(*args, **kwargs)
+
+    async def pipeline_execute(self, *args, **kwargs):
+        counter["count"] += 1
+        return await original_pipeline_execute(self, *args, **kwargs)
+
+    monkeypatch.setattr(fake_redis, "execute_command", execute_command)
+    monkeypatch.setattr(Pipeline, "execute", pipeline_execute)
+    return counter
+
+
+class TestSessionRoundTrips:
+    """每个会话写操作只需要一次Redis往返."""
+
+    @pytest.mark.asyncio
+    async def test_turn_operations_take_one_round_trip(self, manager, round_trips):
+        """追加消息、更新活跃时间和合并上下文各一次往返."""
+        await manager.create_session("u1", "s1")
+        # 预热脚本缓存（首次调用需要额外的EVAL）
+        await manager.add_message_to_history("u1", "s1", "user", "warmup")
+        await manager.update_context("u1", "s1", {"warmup": True})
+
+        round_trips["count"] = 0
+        await manager.create_session("u1", "s2")
+        assert round_trips["count"] == 1
+
+        round_trips["count"] = 0
+        await manager.add_message_to_history("u1", "s1", "user", "hello")
+        assert round_trips["count"] == 1
+
+        round_trips["count"] = 0
+        await manager.update_session_activity("u1", "s1")
+        assert round_trips["count"] == 1
+
+        round_trips["count"] = 0
+        await manager.update_context("u1", "s1", {"conversation_turns": 1})
+        assert round_trips["count"] == 1
+
+        round_trips["count"] = 0
+        await manager.get_context("u1", "s1")
+        assert round_trips["count"] == 1
+
+
+class TestSessionWrites:
+    """会话写操作语义测试."""
+
+    @pytest.mark.asyncio
+    async def test_append_updates_count_and_ttl(self, manager, fake_redis):
+        """追加消息累加消息计数并刷新TTL."""
+        await manager.create_session("u1", "s1")
+        session_key = manager._get_session_key("u1", "s1")
+        history_key = manager._get_history_key("u1", "s1")
+        await fake_redis.expire(session_key, 10)
+
+        await manager.add_message_to_history("u1", "s1", "user", "a")
+        await manager.add_message_to_history("u1", "s1", "assistant", "b")
+
+        session = await manager.get_session("u1", "s1")
+        assert session["message_count"] == 2
+        assert await fake_redis.ttl(session_key) > 10
+        assert await fake_redis.ttl(history_key) > 0
+
+        history = await manager.get_message_history("u1", "s1")
+        assert [m["content"] for m in history] == ["a", "b"]
+
+    @pytest.mark.asyncio
+    async def test_append_does_not_create_session(self, manager, fake_redis):
+        """会话不存在时不会留下没有TTL的会话哈希."""
+        await manager.add_message_to_history("u1", "missing", "user", "a")
+        assert not await fake_redis.exists(manager._get_session_key("u1", "missing"))
+
+    @pytest.mark.asyncio
+    async def test_concurrent_context_updates_are_merged(self, manager):
+        """并发更新不同字段时互不覆盖."""
+        await manager.create_session("u1", "s1")
+
+        await asyncio.gather(*[
+            manager.update_context("u1", "s1", {f"field_{i}": i}) for i in range(20)
+        ])
+
+        context = await manager.get_context("u1", "s1")
+        assert all(context[f"field_{i}"] == i for i in range(20))
+        assert context["conversation_turns"] == 0
+        assert context["tool_usage_history"] == []
+
+    @pytest.mark.asyncio
+    async def test_update_context_initializes_defaults(self, manager):
+        """上下文不存在时以默认值初始化后再合并."""
+        await manager.update_context("u1", "s1", {"current_topic": "纺织品"})
+
+        context = await manager.get_context("u1", "s1")
+        assert context["current_topic"] == "纺织品"
+        assert context["user_preferences"] == {}
+        assert "updated_at" in context
+
+    @pytest.mark.asyncio
+    async def test_legacy_string_context(self, manager, fake_redis):
+        """旧版本JSON字符串格式的上下文仍可读取，更新时转换为哈希."""
+        context_key = manager._get_context_key("u1", "s1")
+        await fake_redis.set(context_key, '{"conversation_turns": 3}')
+
+        assert (await manager.get_context("u1", "s1"))["conversation_turns"] == 3
+
+        await manager.update_context("u1", "s1", {"conversation_turns": 4})
+        assert await fake_redis.type(context_key) == "hash"
+        assert (await manager.get_context("u1", "s1"))["conversation_turns"] == 4
+
+
+class TestBoundedHistory:
+    """历史记录上限与滚动摘要测试."""
+
+    @pytest.mark.asyncio
+    async def test_10k_turn_session_stays_bounded(self, fake_redis):
+        """10k轮对话后历史的条数、字节数和摘要长度都不超过上限."""
+        manager = SessionManager(max_history_messages=100, max_history_bytes=32 * 1024)
+        manager.redis = fake_redis
+        await manager.create_session("u1", "s1")
+
+        for turn in range(5000):
+            await manager.add_message_to_history("u1", "s1", "user", f"问题{turn}。细节" * 3)
+            await manager.add_message_to_history(
+                "u1", "s1", "assistant", f"Answer {turn}. " + "x" * 200
+            )
+
+        history_key = manager._get_history_key("u1", "s1")
+        meta_key = manager._get_history_meta_key("u1", "s1")
+        stored = await fake_redis.lrange(history_key, 0, -1)
+        stored_bytes = sum(len(m) for m in stored)
+
+        assert len(stored) <= 100
+        assert stored_bytes <= 32 * 1024
+        assert int(await fake_redis.hget(meta_key, "bytes")) == stored_bytes
+
+        summary = await fake_redis.hget(meta_key, "summary")
+        assert len(summary) <= 4000
+        compacted = int(await fake_redis.hget(meta_key, "compacted_messages"))
+        assert compacted + len(stored) == 10000
+
+        # 会话消息计数仍记录全部消息
+        session = await manager.get_session("u1", "s1")
+        assert session["message_count"] == 10000
+
+        history = await manager.get_message_history("u1", "s1", limit=10)
+        assert history[0]["metadata"]["summary"] is True
+        assert history[0]["metadata"]["compacted_messages"] == compacted
+        assert history[-1]["content"].startswith("Answer 4999.")
+        assert len(history) == 11
+
+    @pytest.mark.asyncio
+    async def test_compaction_is_batched(self, manager):
+        """超过上限时一次压缩到低水位，而不是每次追加都调用摘要器."""
+        calls = []
+
+        def summarizer(previous, messages):
+            calls.append(len(messages))
+            return (previous or "") + "".join(m["content"] for m in messages)
+
+        manager.max_history_messages = 20
+        manager.summarizer = summarizer
+
+        for i in range(41):
+            await manager.add_message_to_history("u1", "s1", "user", str(i % 10))
+
+        # 第21条触发压缩到15条（弹出6条），之后每6条触发一次
+        assert calls == [6, 6, 6, 6]
+        history = await manager.get_message_history("u1", "s1", limit=100)
+        assert history[0]["content"] == "".join(str(i % 10) for i in range(24))
+        assert len(history) == 1 + 17
+
+    @pytest.mark.asyncio
+    async def test_async_summarizer(self, manager):
+        """摘要器可以是异步函数."""
+        async def summarizer(previous, messages):
+            await asyncio.sleep(0)
+            return f"{len(messages)} compacted"
+
+        manager.max_history_messages = 4
+        manager.summarizer = summarizer
+
+        for i in range(5):
+            await manager.add_message_to_history("u1", "s1", "user", str(i))
+
+        history = await manager.get_message_history("u1", "s1")
+        assert history[0]["content"] == "2 compacted"
+        assert [m["content"] for m in history[1:]] == ["2", "3", "4"]
+
+    @pytest.mark.asyncio
+    async def test_oversized_message_keeps_newest(self, manager):
+        """单条消息超过字节上限时仍保留最新一条."""
+        manager.max_history_bytes = 100
+
+        await manager.add_message_to_history("u1", "s1", "user", "short")
+        await manager.add_message_to_history("u1", "s1", "assistant", "y" * 500)
+
+        history = await manager.get_message_history("u1", "s1", include_summary=False)
+        assert [m["content"] for m in history] == ["y" * 500]
+
+
+class TestExtractiveSummarizer:
+    """抽取式摘要器测试."""
+
+    def test_keeps_first_sentence_per_message(self):
+        """每条消息保留角色和首句."""
+        summarizer = ExtractiveSummarizer()
+        summary = summarizer(None, [
+            {"role": "user", "content": "帮我查询纺织品出口数据。要2024年的。"},
+            {"role": "assistant", "content": "Sure. Here are the numbers..."},
+        ])
+        assert summary.splitlines() == ["user: 帮我查询纺织品出口数据。", "assistant: Sure."]
+
+    def test_drops_oldest_lines_over_limit(self):
+        """超过长度上限时丢弃最旧的行."""
+        summarizer = ExtractiveSummarizer(max_chars=50)
+        summary = None
+        for i in range(20):
+            summary = summarizer(summary, [{"role": "user", "content": f"message {i}"}])
+
+        assert len(summary) <= 50
+        assert summary.splitlines()[-1] == "user: message 19"
+
+
+class TestSessionActivityIndex:
+    """会话活跃索引测试."""
+
+    @pytest.mark.asyncio
+    async def test_user_sessions_sorted_and_paginated(self, manager, monkeypatch):
+        """用户会话按最后活跃时间倒序分页返回."""
+        now = [1000.0]
+        monkeypatch.setattr("app.services.session_manager.time.time", lambda: now[0])
+
+        for i in range(5):
+            await manager.create_session("u1", f"s{i}")
+            now[0] += 1
+        await manager.create_session("u2", "other")
+
+        # s1 重新活跃，排到最前
+        await manager.update_session_activity("u1", "s1")
+
+        first_page = await manager.get_user_sessions("u1", limit=2)
+        second_page = await manager.get_user_sessions("u1", limit=2, offset=2)
+        assert [s["session_id"] for s in first_page] == ["s1", "s4"]
+        assert [s["session_id"] for s in second_page] == ["s3", "s2"]
+        assert await manager.count_user_sessions("u1") == 5
+
+    @pytest.mark.asyncio
+    async def test_listing_and_cleanup_do_not_scan(self, manager, fake_redis, monkeypatch):
+        """列表和清理不使用KEYS/SCAN."""
+        async def fail(*args, **kwargs):
+            raise AssertionError("keyspace scan should not be used")
+
+        monkeypatch.setattr(fake_redis, "keys", fail)
+        monkeypatch.setattr(fake_redis, "scan", fail)
+
+        await manager.create_session("u1", "s1")
+        assert len(await manager.get_user_sessions("u1")) == 1
+        assert await manager.cleanup_expired_sessions() == 0
+
+    @pytest.mark.asyncio
+    async def test_cleanup_removes_idle_sessions_in_batches(
+        self, manager, fake_redis, monkeypatch
+    ):
+        """按活跃时间分批清理，保留仍活跃的会话."""
+        now = [1000.0]
+        monkeypatch.setattr("app.services.session_manager.time.time", lambda: now[0])
+
+        for i in range(25):
+            await manager.create_session(f"u{i % 3}", f"idle{i}")
+            await manager.add_message_to_history(f"u{i % 3}", f"idle{i}", "user", "hi")
+
+        now[0] += 7200
+        await manager.create_session("u0", "active")
+
+        removed = await manager.cleanup_expired_sessions(
+            max_idle=timedelta(hours=1), batch_size=10
+        )
+        assert removed == 25
+
+        assert await manager.get_session("u0", "active") is not None
+        assert await manager.get_session("u1", "idle1") is None
+        assert not await fake_redis.exists(
+            manager._get_context_key("u1", "idle1"),
+            manager._get_history_key("u1", "idle1"),
+            manager._get_history_meta_key("u1", "idle1")
+        )
+        assert await fake_redis.zcard(manager._activity_index_key) == 1
+        assert [s["session_id"] for s in await manager.get_user_sessions("u0")] == ["active"]
+        assert await manager.count_user_sessions("u1") == 0
+
+    @pytest.mark.asyncio
+    async def test_expired_sessions_pruned_from_listing(self, manager, fake_redis):
+        """已按TTL过期的会话不出现在列表中，并从索引移除."""
+        await manager.create_session("u1", "s1")
+        await manager.create_session("u1", "s2")
+        await fake_redis.delete(manager._get_session_key("u1", "s1"))
+
+        sessions = await manager.get_user_sessions("u1")
+        assert [s["session_id"] for s in sessions] == ["s2"]
+        assert await manager.count_user_sessions("u1") == 1
@@ -0,0 +1,518 @@
+"""SSE服务测试."""
+
+import asyncio
+import json
+import multiprocessing
+import queue
+import threading
+import time
+
+import pytest
+import redis.asyncio as redis
+from fakeredis import TcpFakeServer
+from redis.asyncio.client import Pipeline
+
+from app.config import settings
+from app.services.sse import _PUBLISH_EVENT_SCRIPT, SSEConnection, SSEManager
+from app.utils.redis_client import redis_client
+
+
+async def wait_subscribed(manager: SSEManager, user_id: int) -> None:
+    """等待节点订阅用户频道."""
+    for _ in range(500):
+        if user_id in manager._subscribed_users:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"user {user_id} was not subscribed")
+
+
+async def next_message(connection, timeout: float = 5.0):
+    """从连接队列读取下一条消息."""
+    pending = connection.__dict__.setdefault("_pending", [])
+    if not pending:
+        pending.extend(await asyncio.wait_for(connection.drain(), timeout))
+    return pending.pop(0)
+
+
+async def shutdown(manager: SSEManager) -> None:
+    """停止节点的后台任务."""
+    await manager.close()
+
+
+def run_node(port: int, user_id: int, ready, received) -> None:
+    """子进程节点：持有一个用户连接，把收到的消息转交给父进程."""
+
+    async def main():
+        redis_client._client = redis.Redis(port=port, decode_responses=True)
+        manager = SSEManager()
+        connection = await manager.connect(user_id, "s", request=None)
+        await next_message(connection)  # 连接成功消息
+        await wait_subscribed(manager, user_id)
+        ready.set()
+
+        for _ in range(2):
+            message = await next_message(connection, timeout=30)
+            received.put((user_id, message["text"]))
+
+        await shutdown(manager)
+
+    asyncio.run(main())
+
+
+class TestSSEBackplane:
+    """SSE跨节点转发测试."""
+
+    @pytest.mark.asyncio
+    async def test_send_reaches_connection_on_other_node(self, fake_redis_server, fake_redis):
+        """消息发送到其他节点持有的连接，本节点连接直接投递."""
+        node_a = SSEManager()
+        node_b = SSEManager()
+
+        conn_a = await node_a.connect(1, "s", request=None)
+        conn_b = await node_b.connect(2, "s", request=None)
+        await next_message(conn_a)
+        await next_message(conn_b)
+        await wait_subscribed(node_a, 1)
+        await wait_subscribed(node_b, 2)
+
+        assert await node_a.send_to_user(2, {"type": "message", "text": "hi"}) == 0
+        assert (await next_message(conn_b))["text"] == "hi"
+
+        assert await node_a.send_to_user(1, {"type": "message", "text": "local"}) == 1
+        assert (await next_message(conn_a))["text"] == "local"
+        # 本节点发布的消息不会被重复投递
+        await asyncio.sleep(0.05)
+        assert not conn_a.queue
+
+        await node_b.broadcast({"type": "notice", "text": "all"})
+        assert (await next_message(conn_a))["text"] == "all"
+        assert (await next_message(conn_b))["text"] == "all"
+
+        await shutdown(node_a)
+        await shutdown(node_b)
+
+    @pytest.mark.asyncio
+    async def test_single_publish_and_unsubscribe(self, fake_redis, monkeypatch):
+        """发送只发布一次；用户最后一个连接断开后取消订阅."""
+        node = SSEManager()
+        connection = await node.connect(7, "s", request=None)
+        await wait_subscribed(node, 7)
+
+        calls = []
+        execute_command = fake_redis.execute_command
+
+        async def counting(*args, **kwargs):
+            calls.append(args[0])
+            return await execute_command(*args, **kwargs)
+
+        monkeypatch.setattr(fake_redis, "execute_command", counting)
+
+        await node.send_to_user(7, {"type": "message"})
+        # 写入事件流和发布在同一个脚本中（首次调用回退EVAL）
+        assert calls in (["EVALSHA"], ["EVALSHA", "EVAL"])
+
+        await node.disconnect(connection.connection_id)
+        assert 7 not in node._subscribed_users
+        channels = await fake_redis.pubsub_channels()
+        assert "sse:user:7" not in channels
+        assert "sse:broadcast" in channels
+
+        await shutdown(node)
+
+    @pytest.mark.asyncio
+    async def test_multi_process_fan_out(self):
+        """多个进程分别持有不同用户的连接，任一进程发送都能送达."""
+        server = TcpFakeServer(("127.0.0.1", 0))
+        port = server.server_address[1]
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        ctx = multiprocessing.get_context("spawn")
+        received = ctx.Queue()
+        nodes = []
+        for user_id in (1, 2):
+            ready = ctx.Event()
+            process = ctx.Process(target=run_node, args=(port, user_id, ready, received))
+            process.start()
+            nodes.append((process, ready))
+
+        client = redis.Redis(port=port, decode_responses=True)
+        original_client = redis_client._client
+        redis_client._client = client
+        try:
+            loop = asyncio.get_running_loop()
+            for _, ready in nodes:
+                assert await loop.run_in_executor(None, ready.wait, 60)
+
+            # TcpFakeServer在NOSCRIPT错误后会断开连接，预先加载脚本
+            await client.script_load(_PUBLISH_EVENT_SCRIPT)
+            sender = SSEManager()
+            await sender.send_to_user(1, {"type": "message", "text": "to-1"})
+            await sender.send_to_user(2, {"type": "message", "text": "to-2"})
+            await sender.broadcast({"type": "notice", "text": "all"})
+
+            messages = []
+            for _ in range(4):
+                try:
+                    messages.append(await loop.run_in_executor(None, received.get, True, 30))
+                except queue.Empty:
+                    break
+
+            assert sorted(messages) == [(1, "all"), (1, "to-1"), (2, "all"), (2, "to-2")]
+        finally:
+            redis_client._client = original_client
+            await client.aclose()
+            for process, _ in nodes:
+                process.join(10)
+                if process.is_alive():
+                    process.terminate()
+            server.shutdown()
+            server.server_close()
+
+
+class NoPollRequest:
+    """轮询断开状态时报错的请求对象."""
+
+    async def is_disconnected(self):
+        raise AssertionError("disconnect should not be polled")
+
+
+class TestSSEConnectionQueue:
+    """SSE连接有界队列测试."""
+
+    @pytest.mark.asyncio
+    async def test_drop_oldest(self):
+        """队列满时丢弃最早的消息."""
+        connection = SSEConnection("c", 1, "s", max_queue_size=3, overflow_policy="drop_oldest")
+        for i in range(5):
+            await connection.send_message({"type": "message", "n": i})
+
+        assert connection.queue_depth == 3
+        assert connection.dropped == 2
+        assert [m["n"] for m in await connection.drain()] == [2, 3, 4]
+
+    @pytest.mark.asyncio
+    async def test_coalesce_replaces_same_type(self):
+        """合并策略优先丢弃同类型的旧消息."""
+        connection = SSEConnection("c", 1, "s", max_queue_size=3, overflow_policy="coalesce")
+        await connection.send_message({"type": "heartbeat", "n": 1})
+        await connection.send_message({"type": "message", "n": 2})
+        await connection.send_message({"type": "heartbeat", "n": 3})
+        await connection.send_message({"type": "heartbeat", "n": 4})
+
+        assert [m["n"] for m in await connection.drain()] == [2, 3, 4]
+
+        # 没有同类型消息时丢弃最早的消息
+        for n in (5, 6, 7):
+            await connection.send_message({"type": "message", "n": n})
+        await connection.send_message({"type": "status", "n": 8})
+        assert [m["n"] for m in await connection.drain()] == [6, 7, 8]
+
+    @pytest.mark.asyncio
+    async def test_disconnect_policy_ends_stream(self, fake_redis):
+        """断开策略下慢客户端的连接被关闭并从管理器移除."""
+        manager = SSEManager()
+        connection = await manager.connect(1, "s", request=None)
+        connection.overflow_policy = "disconnect"
+        connection.max_queue_size = 2
+
+        # 队列中已有连接成功消息
+        await manager.send_to_user(1, {"type": "message"})
+        assert connection.is_active
+        await manager.send_to_user(1, {"type": "message"})
+        assert not connection.is_active
+
+        chunks = [c async for c in manager.stream_generator(connection, NoPollRequest())]
+        assert chunks == []
+        assert manager.get_connection_count() == 0
+
+        await shutdown(manager)
+
+    @pytest.mark.asyncio
+    async def test_queued_messages_written_in_one_batch(self, fake_redis):
+        """排队的多条消息合并为一次写入，空闲时不轮询断开状态."""
+        manager = SSEManager()
+        connection = await manager.connect(1, "s", request=None)
+        for i in range(3):
+            await manager.send_to_user(1, {"type": "message", "n": i})
+
+        stream = manager.stream_generator(connection, NoPollRequest())
+        chunk = await stream.__anext__()
+        assert isinstance(chunk, bytes)
+        assert chunk.decode().count("event: ") == 4  # 连接消息 + 3条消息
+
+        # 空闲时写入端挂起，直到有新消息
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.2)
+        assert not pending.done()
+
+        await manager.send_to_user(1, {"type": "message", "n": 3})
+        assert b'"n":3' in await asyncio.wait_for(pending, 1)
+        assert manager.get_queue_stats()["queued_messages"] == 0
+
+        await stream.aclose()
+        assert manager.get_connection_count() == 0
+        await shutdown(manager)
+
+    @pytest.mark.asyncio
+    async def test_cancelled_stream_cleans_up(self, fake_redis):
+        """客户端断开（生成器被取消）时连接被清理."""
+        manager = SSEManager()
+        connection = await manager.connect(1, "s", request=None)
+
+        async def consume():
+            async for _ in manager.stream_generator(connection, NoPollRequest()):
+                pass
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.05)
+
+        assert not connection.is_active
+        assert manager.get_connection_count() == 0
+        await shutdown(manager)
+
+    def test_unknown_policy(self):
+        """未知溢出策略直接报错."""
+        with pytest.raises(ValueError):
+            SSEConnection("c", 1, "s", overflow_policy="block")
+
+
+class TestSSEHeartbeatAndCleanup:
+    """心跳时间轮和断开清理测试."""
+
+    @pytest.mark.asyncio
+    async def test_heartbeat_slot_only_touches_its_connections(self, fake_redis):
+        """每次只向一个槽中的连接发送心跳."""
+        manager = SSEManager(heartbeat_slots=4)
+        connections = [await manager.connect(i, "s", request=None) for i in range(200)]
+
+        sizes = [len(slot) for slot in manager._wheel]
+        assert sum(sizes) == 200
+        assert all(size > 0 for size in sizes)
+
+        await manager._heartbeat_slot(manager._wheel[2])
+        for connection in connections:
+            types = [m["type"] for m in connection.queue]
+            expected = ["connection", "heartbeat"] if connection.heartbeat_slot == 2 else ["connection"]
+            assert types == expected
+
+        await shutdown(manager)
+
+    @pytest.mark.asyncio
+    async def test_every_connection_gets_one_heartbeat_per_interval(self, fake_redis):
+        """一个心跳间隔内每个连接恰好收到一次心跳."""
+        manager = SSEManager(heartbeat_interval=0.4, heartbeat_slots=4)
+        connections = [await manager.connect(i, "s", request=None) for i in range(40)]
+
+        await asyncio.sleep(0.45)
+
+        for connection in connections:
+            assert [m["type"] for m in connection.queue].count("heartbeat") == 1
+
+        await shutdown(manager)
+
+    @pytest.mark.asyncio
+    async def test_disconnect_cleanup_is_batched_without_scan(self, fake_redis, monkeypatch):
+        """断开连接直接按注册键删除，多个断开合并为一次往返."""
+        manager = SSEManager()
+        connections = [await manager.connect(i % 5, "s", request=None) for i in range(50)]
+        assert await fake_redis.hlen("sse:connections:0") == 10
+
+        async def fail(*args, **kwargs):
+            raise AssertionError("keyspace scan should not be used")
+
+        monkeypatch.setattr(fake_redis, "scan_iter", fail)
+        monkeypatch.setattr(fake_redis, "keys", fail)
+
+        executes = []
+        execute = Pipeline.execute
+
+        async def counting(self, *args, **kwargs):
+            executes.append(len(self.command_stack))
+            return await execute(self, *args, **kwargs)
+
+        monkeypatch.setattr(Pipeline, "execute", counting)
+
+        for connection in connections[:30]:
+            await manager.disconnect(connection.connection_id)
+        assert sum(len(slot) for slot in manager._wheel) == 20
+
+        await manager._cleanup_task
+        assert executes == [5]
+        for user_id in range(5):
+            assert await fake_redis.hlen(f"sse:connections:{user_id}") == 4
+
+        await shutdown(manager)
+
+    @pytest.mark.asyncio
+    async def test_inactive_connection_removed_on_heartbeat(self, fake_redis):
+        """心跳时发现的非活跃连接被清理."""
+        manager = SSEManager(heartbeat_slots=1)
+        connection = await manager.connect(1, "s", request=None)
+        await connection.disconnect()
+
+        await manager._heartbeat_slot(manager._wheel[0])
+
+        assert manager.get_connection_count() == 0
+        assert not manager._wheel[0]
+        await manager.flush_pending_cleanup()
+        assert not await fake_redis.exists("sse:connections:1")
+        await shutdown(manager)
+
+
+class TestSSEReplay:
+    """Last-Event-ID 补发测试."""
+
+    @pytest.mark.asyncio
+    async def test_events_carry_monotonic_ids(self, fake_redis):
+        """经由管理器发送的事件带单调递增的ID，并写入SSE的 id 字段."""
+        manager = SSEManager()
+        connection = await manager.connect(1, "s", request=None)
+        for i in range(3):
+            await manager.send_to_user(1, {"type": "message", "n": i})
+
+        messages = await connection.drain()
+        ids = [m["event_id"] for m in messages if "event_id" in m]
+        assert len(ids) == 3
+        assert ids == sorted(ids, key=lambda i: tuple(map(int, i.split("-"))))
+        assert f"id: {ids[0]}\n".encode() in manager._format_event(messages[1])
+        assert b"id: " not in manager._format_event(messages[0])
+
+        await shutdown(manager)
+
+    @pytest.mark.asyncio
+    async def test_reconnect_replays_gap_before_live(self, fake_redis):
+        """重连时先补发缺口中的事件（含广播），再继续实时投递."""
+        manager = SSEManager()
+        first = await manager.connect(1, "s", request=None)
+        await manager.send_to_user(1, {"type": "message", "n": 0})
+        last_seen = (await first.drain())[-1]["event_id"]
+        await manager.disconnect(first.connection_id)
+
+        await manager.send_to_user(1, {"type": "message", "n": 1})
+        await manager.broadcast({"type": "notice", "n": 2})
+        await manager.send_to_user(2, {"type": "message", "n": -1})
+        await manager.send_to_user(1, {"type": "message", "n": 3}, session_id="other")
+        await manager.send_to_user(1, {"type": "message", "n": 4})
+
+        connection = await manager.connect(1, "s", request=None, last_event_id=last_seen)
+        await manager.send_to_user(1, {"type": "message", "n": 5})
+
+        messages = await connection.drain()
+        assert messages[0]["type"] == "connection"
+        assert [m["n"] for m in messages[1:]] == [1, 2, 4, 5]
+
+        await shutdown(manager)
+
+    @pytest.mark.asyncio
+    async def test_unreplayable_gap_asks_for_refresh(self, fake_redis, monkeypatch):
+        """缺口超出保留范围或ID非法时通知客户端全量刷新."""
+        monkeypatch.setattr(settings, "SSE_REPLAY_MAXLEN", 5)
+        manager = SSEManager()
+        await manager.send_to_user(1, {"type": "message", "n": 0})
+        oldest = (await fake_redis.xrange("sse:events:1"))[0][0]
+        for i in range(10):
+            await manager.send_to_user(1, {"type": "message", "n": i})
+        assert await fake_redis.xlen("sse:events:1") == 5
+
+        for last_event_id in (oldest, "0-1", "not-an-id"):
+            connection = await manager.connect(1, "s", request=None, last_event_id=last_event_id)
+            types = [m["type"] for m in await connection.drain()]
+            assert types == ["connection", "replay_incomplete"]
+
+        await shutdown(manager)
+
+    @pytest.mark.asyncio
+    async def test_published_envelope_is_valid_json(self, fake_redis):
+        """发布到频道的消息是合法JSON，空消息体也不例外."""
+        pubsub = fake_redis.pubsub()
+        await pubsub.subscribe("sse:test")
+        await pubsub.get_message(timeout=1)
+
+        for payload in ("{}", '{"message": {"type": "message"}}'):
+            event_id = await redis_client.run_script(
+                _PUBLISH_EVENT_SCRIPT,
+                keys=["sse:events:test", "sse:events:clock"],
+                args=["sse:test", payload, 10, 60000]
+            )
+            published = await pubsub.get_message(timeout=1)
+            assert json.loads(published["data"]) == {
+                "event_id": event_id, "payload": json.loads(payload)
+            }
+
+        await pubsub.aclose()
+
+    @pytest.mark.asyncio
+    async def test_user_and_broadcast_ids_do_not_collide(self, fake_redis, monkeypatch):
+        """同一毫秒写入用户流和广播流的事件ID不同，重连后不会漏掉另一个流的事件."""
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now)
+
+        manager = SSEManager()
+        first = await manager.connect(1, "s", request=None)
+        await manager.send_to_user(1, {"type": "message", "n": 0})
+        last_seen = (await first.drain())[-1]["event_id"]
+        await manager.disconnect(first.connection_id)
+        await manager.broadcast({"type": "notice", "n": 1})
+        await manager.send_to_user(1, {"type": "message", "n": 2})
+
+        user_ids = [event_id for event_id, _ in await fake_redis.xrange("sse:events:1")]
+        broadcast_ids = [event_id for event_id, _ in await fake_redis.xrange("sse:events:broadcast")]
+        assert len({i.split("-")[0] for i in user_ids + broadcast_ids}) == 1
+        assert sorted(user_ids + broadcast_ids, key=lambda i: int(i.split("-")[1])) == [
+            user_ids[0], broadcast_ids[0], user_ids[1]
+        ]
+
+        connection = await manager.connect(1, "s", request=None, last_event_id=last_seen)
+        assert [m.get("n") for m in await connection.drain()] == [None, 1, 2]
+
+        await shutdown(manager)
+
+    @pytest.mark.asyncio
+    async def test_retention_uses_redis_clock(self, fake_redis, monkeypatch):
+        """保留范围按Redis服务器时间判断，不受本机时钟偏差影响."""
+        # Redis服务器时钟比本机慢两个保留周期，事件ID按服务器时间生成
+        lag_ms = settings.SSE_REPLAY_RETENTION * 2000
+        server_ms = int(time.time() * 1000) - lag_ms
+        await fake_redis.xadd("sse:events:1", {"data": "{}"}, id=f"{server_ms}-0")
+        await fake_redis.xadd(
+            "sse:events:1",
+            {"data": json.dumps({"message": {"type": "message", "n": 1}})},
+            id=f"{server_ms}-1"
+        )
+
+        execute = Pipeline.execute
+
+        async def lagging_time(self, *args, **kwargs):
+            commands = [command[0][0] for command in self.command_stack]
+            results = await execute(self, *args, **kwargs)
+            if commands and commands[-1] == "TIME":
+                seconds, microseconds = results[-1]
+                results[-1] = (seconds - lag_ms // 1000, microseconds)
+            return results
+
+        monkeypatch.setattr(Pipeline, "execute", lagging_time)
+
+        manager = SSEManager()
+        connection = await manager.connect(1, "s", request=None, last_event_id=f"{server_ms}-0")
+        assert [m.get("n") for m in await connection.drain()] == [None, 1]
+
+        await shutdown(manager)
+
+    def test_insert_replay_drops_duplicates(self):
+        """补发消息排在实时消息之前，重复的实时消息被丢弃."""
+        connection = SSEConnection("c", 1, "s")
+        connection.put_message({"type": "connection"})
+        connection.put_message({"type": "message", "event_id": "100-1"})
+        connection.put_message({"type": "message", "event_id": "100-3"})
+
+        connection.insert_replay([
+            {"type": "message", "event_id": "99-0"},
+            {"type": "message", "event_id": "100-1"},
+        ])
+
+        assert [m.get("event_id") for m in connection.queue] == [None, "99-0", "100-1", "100-3"]